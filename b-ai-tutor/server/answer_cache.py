@@ -0,0 +1,344 @@
+"""
+Semantic cache of generated answers, per document.
+
+Students in the same class ask near-identical questions against the same
+PDF, and every teaching monologue for a (document, topic) pair used to be
+generated from scratch.  Each answer is stored with the embedding of the
+text that produced it (the question, or the topic for the monologue); a new
+request whose embedding is at least ``threshold`` cosine-similar to a
+stored one for the same document is answered from the cache, skipping
+retrieval and the Gemini call.  A request repeating a stored text exactly
+(case and spacing aside) is answered by lookup_text() without being
+embedded, and answers generated without an embedding (keyword questions
+retrieved from the BM25 index alone, see vector_store.py) are stored for
+such exact repeats only.
+
+Entries are partitioned by (document fingerprint, kind) where kind is
+"teach" or "question", and each partition keeps its vectors in a small
+inner-product FAISS index over L2-normalised embeddings.  Entries expire
+``ttl_seconds`` after they were stored and the least recently used ones are
+evicted beyond ``max_entries``.
+
+Typical usage::
+
+    cache = get_answer_cache()
+    sentences = cache.lookup_text(fingerprint, "question", question)
+    if sentences is None:
+        vector = embed(question)
+        sentences = cache.lookup(fingerprint, "question", vector)
+    if sentences is None:
+        sentences = generate(...)
+        cache.store(fingerprint, "question", question, vector, sentences)
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Sequence, Tuple
+
+import faiss
+import numpy as np
+
+from metrics import record_cache_lookup
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# Constants
+# ---------------------------------------------------------------------------
+
+# Defaults – each can be overridden through the environment.
+_DEFAULT_THRESHOLD = 0.95
+_DEFAULT_TTL_SECONDS = 24 * 3600
+_DEFAULT_MAX_ENTRIES = 5000
+
+# (fingerprint, kind)
+_PartitionKey = Tuple[str, str]
+# (fingerprint, kind, normalised text)
+_TextKey = Tuple[str, str, str]
+
+
+class _Entry:
+    """One cached answer; ``indexed`` when its embedding is in the partition index."""
+
+    __slots__ = ("partition", "text", "sentences", "created", "indexed")
+
+    def __init__(self, partition: _PartitionKey, text: str, sentences: List[str], indexed: bool) -> None:
+        self.partition = partition
+        self.text = text
+        self.sentences = sentences
+        self.created = time.monotonic()
+        self.indexed = indexed
+
+
+class _Partition:
+    """FAISS index of the entries for one (document, kind)."""
+
+    __slots__ = ("index",)
+
+    def __init__(self, dim: int) -> None:
+        self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(dim))
+
+
+def _normalise(vector: Sequence[float]) -> np.ndarray:
+    """Return ``vector`` as a unit-length float32 row matrix."""
+    arr = np.asarray(vector, dtype=np.float32).reshape(1, -1)
+    norm = float(np.linalg.norm(arr))
+    return arr / norm if norm else arr
+
+
+def _normalise_text(text: str) -> str:
+    """Return ``text`` lower-cased with runs of whitespace collapsed."""
+    return " ".join(text.lower().split())
+
+
+# ---------------------------------------------------------------------------
+# AnswerCache class
+# ---------------------------------------------------------------------------
+
+
+class AnswerCache:
+    """
+    Thread-safe semantic answer cache with TTL and LRU eviction.
+
+    The cache never embeds anything itself; callers pass the embedding of
+    the question (or topic) to ``lookup`` and ``store``, or probe exact
+    repeats with ``lookup_text`` first.
+    """
+
+    def __init__(
+        self,
+        threshold: float = _DEFAULT_THRESHOLD,
+        ttl_seconds: float = _DEFAULT_TTL_SECONDS,
+        max_entries: int = _DEFAULT_MAX_ENTRIES,
+    ) -> None:
+        """
+        Args:
+            threshold:   Minimum cosine similarity for a hit.
+            ttl_seconds: Age after which an entry is dropped.
+            max_entries: Maximum number of answers kept across all documents.
+        """
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+
+        self._partitions: Dict[_PartitionKey, _Partition] = {}
+        # Entry id → entry, least recently used first
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        # Normalised text → id of the entry stored for it
+        self._texts: Dict[_TextKey, int] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+
+    def lookup(self, fingerprint: str, kind: str, vector: Sequence[float] | None) -> List[str] | None:
+        """
+        Return the cached sentences of the most similar stored request, if
+        its similarity reaches the threshold.
+
+        Args:
+            fingerprint: Document fingerprint (see document_index.py).
+            kind:        "teach" or "question".
+            vector:      Embedding of the incoming question / topic; None
+                         (the request was not embedded) only records the
+                         miss of a preceding lookup_text().
+        """
+        if vector is None:
+            with self._lock:
+                self._miss()
+            return None
+
+        query = _normalise(vector)
+        with self._lock:
+            entry_id, score = self._nearest((fingerprint, kind), query)
+            if entry_id is None or score < self.threshold:
+                self._miss()
+                return None
+            sentences = self._hit(entry_id)
+            if sentences is None:
+                self._miss()
+            else:
+                logger.info(
+                    "AnswerCache: hit for %s '%s' (similarity %.3f to '%s').",
+                    kind,
+                    fingerprint[:12],
+                    score,
+                    self._entries[entry_id].text[:60],
+                )
+            return sentences
+
+    def lookup_text(self, fingerprint: str, kind: str, text: str) -> List[str] | None:
+        """
+        Return the cached sentences stored for exactly ``text`` (ignoring
+        case and spacing), without needing its embedding.
+
+        Only hits are recorded: on a miss, callers follow with lookup().
+        """
+        with self._lock:
+            entry_id = self._texts.get((fingerprint, kind, _normalise_text(text)))
+            if entry_id is None:
+                return None
+            sentences = self._hit(entry_id)
+            if sentences is not None:
+                logger.info("AnswerCache: exact hit for %s '%s' ('%s').", kind, fingerprint[:12], text[:60])
+            return sentences
+
+    def store(
+        self,
+        fingerprint: str,
+        kind: str,
+        text: str,
+        vector: Sequence[float] | None,
+        sentences: List[str],
+    ) -> None:
+        """
+        Cache the sentences generated for ``text``.
+
+        A stored entry for the same text, or already within the threshold
+        of ``vector``, is replaced rather than duplicated.  Without a
+        ``vector`` the entry only answers lookup_text().
+        """
+        if not sentences:
+            return
+        key = (fingerprint, kind)
+        text_key = (fingerprint, kind, _normalise_text(text))
+
+        with self._lock:
+            if text_key in self._texts:
+                self._remove(self._texts[text_key])
+
+            entry_id = self._next_id
+            self._next_id += 1
+            if vector is not None:
+                row = _normalise(vector)
+                similar_id, score = self._nearest(key, row)
+                if similar_id is not None and score >= self.threshold:
+                    self._remove(similar_id)
+
+                partition = self._partitions.get(key)
+                if partition is not None and partition.index.d != row.shape[1]:
+                    # The document's embedding model changed – old vectors are unusable
+                    for stale_id in [i for i, e in self._entries.items() if e.partition == key and e.indexed]:
+                        self._remove(stale_id)
+                    partition = None
+                if partition is None:
+                    partition = self._partitions[key] = _Partition(row.shape[1])
+                partition.index.add_with_ids(row, np.array([entry_id], dtype=np.int64))
+
+            self._entries[entry_id] = _Entry(key, text, list(sentences), indexed=vector is not None)
+            self._texts[text_key] = entry_id
+            self._evict()
+
+    def stats(self) -> Dict[str, float]:
+        """Return hit/miss/eviction counters and the current occupancy."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "documents": len({e.partition[0] for e in self._entries.values()}),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+    # ------------------------------------------------------------------
+    # Internal helpers (caller must hold the lock)
+    # ------------------------------------------------------------------
+
+    def _nearest(self, key: _PartitionKey, row: np.ndarray) -> Tuple[int | None, float]:
+        """Return (entry id, similarity) of the closest entry in a partition."""
+        partition = self._partitions.get(key)
+        if partition is None or partition.index.ntotal == 0 or partition.index.d != row.shape[1]:
+            return None, 0.0
+        scores, ids = partition.index.search(row, 1)
+        if ids[0][0] < 0:
+            return None, 0.0
+        return int(ids[0][0]), float(scores[0][0])
+
+    def _hit(self, entry_id: int) -> List[str] | None:
+        """Record a hit on a live entry and return its sentences; drop it (None) if expired."""
+        entry = self._entries[entry_id]
+        if time.monotonic() - entry.created > self.ttl_seconds:
+            self._remove(entry_id)
+            self.expirations += 1
+            return None
+
+        self._entries.move_to_end(entry_id)
+        self.hits += 1
+        record_cache_lookup("answer", hit=True)
+        return list(entry.sentences)
+
+    def _miss(self) -> None:
+        self.misses += 1
+        record_cache_lookup("answer", hit=False)
+
+    def _remove(self, entry_id: int) -> None:
+        entry = self._entries.pop(entry_id)
+        fingerprint, kind = entry.partition
+        self._texts.pop((fingerprint, kind, _normalise_text(entry.text)), None)
+        if not entry.indexed:
+            return
+        partition = self._partitions[entry.partition]
+        partition.index.remove_ids(np.array([entry_id], dtype=np.int64))
+        if partition.index.ntotal == 0:
+            del self._partitions[entry.partition]
+
+    def _evict(self) -> None:
+        """Drop expired entries, then least recently used ones, until within bounds."""
+        now = time.monotonic()
+        for entry_id in [i for i, e in self._entries.items() if now - e.created > self.ttl_seconds]:
+            self._remove(entry_id)
+            self.expirations += 1
+
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+
+# ---------------------------------------------------------------------------
+# Process-wide singleton
+# ---------------------------------------------------------------------------
+
+_answer_cache: AnswerCache | None = None
+_answer_cache_lock = threading.Lock()
+
+
+def get_answer_cache() -> AnswerCache | None:
+    """
+    Return the process-wide AnswerCache, or None when disabled.
+
+    Configured through ANSWER_CACHE_ENABLED (default "1"),
+    ANSWER_CACHE_SIMILARITY, ANSWER_CACHE_TTL_SECONDS and
+    ANSWER_CACHE_MAX_ENTRIES.
+    """
+    global _answer_cache
+    if os.environ.get("ANSWER_CACHE_ENABLED", "1") not in ("1", "true", "True"):
+        return None
+
+    if _answer_cache is None:
+        with _answer_cache_lock:
+            if _answer_cache is None:
+                _answer_cache = AnswerCache(
+                    threshold=float(os.environ.get("ANSWER_CACHE_SIMILARITY", _DEFAULT_THRESHOLD)),
+                    ttl_seconds=float(os.environ.get("ANSWER_CACHE_TTL_SECONDS", _DEFAULT_TTL_SECONDS)),
+                    max_entries=int(os.environ.get("ANSWER_CACHE_MAX_ENTRIES", _DEFAULT_MAX_ENTRIES)),
+                )
+                logger.info(
+                    "AnswerCache configured (similarity>=%.2f, ttl=%ss, max_entries=%d).",
+                    _answer_cache.threshold,
+                    _answer_cache.ttl_seconds,
+                    _answer_cache.max_entries,
+                )
+    return _answer_cache
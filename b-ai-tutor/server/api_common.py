@@ -0,0 +1,246 @@
+"""
+Request validation and response helpers shared by the Flask app (app.py)
+and the async ASGI app (asgi_app.py).
+
+Both front ends enforce the same limits and speak the same wire format, so
+the constants, the request validation and the response bodies live here as
+framework-independent (payload, status) replies; each app only does its
+own (sync or async) I/O and turns replies into responses.
+
+Typical usage::
+
+    if not validate_session_id(session_id):
+        return _json(INVALID_SESSION_ID)
+    wait, count, error = parse_next_args(request.args)
+    if error is not None:
+        return _json(error)
+"""
+
+import json
+import logging
+import os
+import re
+import tempfile
+from typing import Any, Dict, List, Mapping, Tuple
+
+from sessions import QUESTION_LIMIT_REACHED, SESSION_MISSING, SESSION_NOT_READY
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# Limits
+# ---------------------------------------------------------------------------
+
+# 10 MB upload limit – prevents huge PDFs that generate hundreds of embed calls
+MAX_CONTENT_LENGTH = 10 * 1024 * 1024
+
+# Maximum allowed lengths for user-supplied text fields
+MAX_TOPIC_LEN = 300
+MAX_QUESTION_LEN = 500
+# Maximum questions a single session may ask (Gemini LLM call each)
+MAX_QUESTIONS_PER_SESSION = 20
+
+# Upper bound for the ?wait= long-poll on /next (stays below proxy timeouts)
+MAX_LONG_POLL_WAIT = 25
+# Upper bound for ?count= on /next (sentences returned per request)
+MAX_NEXT_BATCH = 10
+# Keep-alive comment interval on the SSE stream
+SSE_KEEPALIVE_SECONDS = 15
+# How long a request waits for the first streamed sentence before returning
+FIRST_SENTENCE_TIMEOUT = 60
+
+# Per-IP route limits (flask-limiter / limits notation)
+STATUS_RATE_LIMIT = "60 per minute"
+NEXT_RATE_LIMIT = "120 per minute"
+EVENTS_RATE_LIMIT = "20 per minute"
+QUESTION_RATE_LIMIT = "1 per 30 seconds"
+
+# SSE comment line that keeps proxies from closing an idle stream
+SSE_KEEPALIVE = ": keep-alive\n\n"
+
+# UUID pattern used to validate session-id URL parameters.
+_UUID_RE = re.compile(
+    r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$',
+    re.IGNORECASE,
+)
+
+
+# ---------------------------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------------------------
+
+
+def validate_session_id(session_id: str) -> bool:
+    """Return True only when session_id is a well-formed UUID v4 string."""
+    return bool(_UUID_RE.match(session_id))
+
+
+def client_ip(headers: Mapping[str, str], remote_addr: str | None) -> str:
+    """
+    Return the real client IP.
+
+    X-Forwarded-For is only trusted when the TRUST_PROXY environment variable
+    is set to '1', i.e. when the app is deployed behind a known reverse proxy.
+    Trusting it unconditionally allows trivial IP-spoofing attacks.
+    """
+    if os.environ.get("TRUST_PROXY") == "1":
+        forwarded = headers.get("X-Forwarded-For")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return remote_addr or "unknown"
+
+
+def sse_event(name: str, payload: Dict[str, Any]) -> str:
+    """Format one Server-Sent Events message."""
+    return f"event: {name}\ndata: {json.dumps(payload)}\n\n"
+
+
+# Response headers of the SSE stream (no proxy buffering)
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+SSE_ERROR = sse_event("error", {"error": "An internal error occurred."})
+
+
+def sse_message(sentence: str | None, generating: bool) -> Tuple[str, bool]:
+    """
+    Return the SSE message for one wait on the sentence queue.
+
+    Args:
+        sentence:   The sentence popped, or None if the wait timed out.
+        generating: Whether more sentences are on their way.
+
+    Returns:
+        (message, whether it ends the stream).
+    """
+    if sentence:
+        return sse_event("sentence", {"text": sentence}), False
+    if generating:
+        return SSE_KEEPALIVE, False
+    return sse_event("done", {}), True
+
+
+# ---------------------------------------------------------------------------
+# Replies
+# ---------------------------------------------------------------------------
+
+# (JSON payload, HTTP status); the apps turn them into responses
+Reply = Tuple[Dict[str, Any], int]
+
+INVALID_SESSION_ID: Reply = ({"error": "Invalid session ID"}, 400)
+SESSION_NOT_FOUND: Reply = ({"error": "Session not found or expired"}, 404)
+RATE_LIMITED: Reply = ({"error": "rate_limited"}, 429)
+FILE_TOO_LARGE: Reply = ({"error": "File too large. Maximum allowed size is 10 MB."}, 413)
+INTERNAL_ERROR: Reply = ({"error": "An internal error occurred."}, 500)
+INTERNAL_ERROR_RETRY: Reply = ({"error": "An internal error occurred. Please try again."}, 500)
+INDEX_NOT_LOADED: Reply = ({"error": "Could not load session vector store"}, 500)
+
+
+def upload_error(file: Any, topic: str) -> Reply | None:
+    """
+    Validate the fields of an /upload request.
+
+    Args:
+        file:  The uploaded "uploadedPDF" file (anything with a
+               ``filename``), or None if the field is missing.
+        topic: The stripped "topicToLearn" field.
+
+    Returns:
+        The 400 reply for the first invalid field, or None if all are valid.
+    """
+    if file is None:
+        return {"error": "No PDF file provided"}, 400
+    if not file.filename:
+        return {"error": "No PDF file selected"}, 400
+    if not file.filename.lower().endswith(".pdf"):
+        return {"error": "File must be a PDF"}, 400
+    if not topic:
+        return {"error": "topicToLearn is required"}, 400
+    if len(topic) > MAX_TOPIC_LEN:
+        return {"error": f"topicToLearn must be {MAX_TOPIC_LEN} characters or fewer"}, 400
+    return None
+
+
+def upload_reply(session_id: str) -> Reply:
+    """Reply to an upload whose ingest job was queued."""
+    return {"session_id": session_id, "status": "pending"}, 202
+
+
+def new_upload_path(upload_dir: str) -> str:
+    """
+    Create an empty .pdf file in ``upload_dir`` for an uploaded PDF.
+
+    The ingest workers read it from there and delete it after extraction;
+    until the job is queued, the caller removes it with remove_upload().
+    """
+    os.makedirs(upload_dir, exist_ok=True)
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf", dir=upload_dir) as tmp:
+        return tmp.name
+
+
+def remove_upload(path: str | None) -> None:
+    """Remove an uploaded file if it still exists, logging any failure."""
+    if path and os.path.exists(path):
+        try:
+            os.remove(path)
+            logger.debug("Temporary file removed: %s", path)
+        except OSError as exc:
+            logger.warning("Could not remove temporary file %s: %s", path, exc)
+
+
+def parse_next_args(args: Any) -> Tuple[int, int, Reply | None]:
+    """
+    Parse the ``wait`` and ``count`` query parameters of /next.
+
+    Args:
+        args: The request's query arguments (werkzeug / Quart MultiDict).
+
+    Returns:
+        (wait, count, None), both clamped to their maximum, or
+        (0, 0, 400 reply) if either is invalid.
+    """
+    wait = args.get("wait", 0, type=int)
+    if wait is None or wait < 0:
+        return 0, 0, ({"error": "wait must be a non-negative integer"}, 400)
+    count = args.get("count", 1, type=int)
+    if count is None or count < 1:
+        return 0, 0, ({"error": "count must be a positive integer"}, 400)
+    return min(wait, MAX_LONG_POLL_WAIT), min(count, MAX_NEXT_BATCH), None
+
+
+def next_reply(sentences: List[str], remaining: int, generating: bool) -> Reply:
+    """
+    Reply to /next: the popped sentences, or an empty batch that is "done"
+    once no answer is being generated any more.
+    """
+    if sentences:
+        return {"text": sentences[0], "sentences": sentences, "done": False, "remaining": remaining}, 200
+    return {"text": None, "sentences": [], "done": not generating, "remaining": 0}, 200
+
+
+def parse_question(data: Mapping[str, Any]) -> Tuple[str, Reply | None]:
+    """
+    Return the question of a /question JSON body, truncated to
+    MAX_QUESTION_LEN to cap token costs, or a 400 reply if it is missing.
+    """
+    question = data.get("question", "").strip()
+    if not question:
+        return "", ({"error": "question is required"}, 400)
+    return question[:MAX_QUESTION_LEN], None
+
+
+def admission_error(session_id: str, verdict: str) -> Reply | None:
+    """Return the reply refusing a question with this admit_question() verdict, or None if admitted."""
+    if verdict == SESSION_MISSING:
+        return SESSION_NOT_FOUND
+    if verdict == SESSION_NOT_READY:
+        # The ingest worker has not finished building the index yet
+        return {"error": "session_not_ready"}, 409
+    if verdict == QUESTION_LIMIT_REACHED:
+        logger.info("session_question: session '%s' hit the %d-question cap.", session_id, MAX_QUESTIONS_PER_SESSION)
+        return {"error": "question_limit_reached"}, 429
+    return None
+
+
+def question_reply(sentence_count: int) -> Reply:
+    """Reply to a question whose answer is being queued."""
+    return {"status": "queued", "sentence_count": sentence_count}, 200
@@ -1,17 +1,70 @@
 import logging
 import os
-import re
-import tempfile
-import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Tuple
 
-import redis
 from dotenv import load_dotenv
-from flask import Flask, jsonify, request
+from flask import Flask, Response, g, jsonify, request, stream_with_context
 from flask_cors import CORS
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 
-from pdf_extractor import extract_text_from_pdf
+from api_common import (
+    EVENTS_RATE_LIMIT,
+    FILE_TOO_LARGE,
+    FIRST_SENTENCE_TIMEOUT,
+    INDEX_NOT_LOADED,
+    INTERNAL_ERROR,
+    INTERNAL_ERROR_RETRY,
+    INVALID_SESSION_ID,
+    MAX_CONTENT_LENGTH,
+    MAX_QUESTIONS_PER_SESSION,
+    NEXT_RATE_LIMIT,
+    QUESTION_RATE_LIMIT,
+    RATE_LIMITED,
+    SESSION_NOT_FOUND,
+    SSE_ERROR,
+    SSE_HEADERS,
+    SSE_KEEPALIVE_SECONDS,
+    STATUS_RATE_LIMIT,
+    Reply,
+    admission_error,
+    client_ip,
+    new_upload_path,
+    next_reply,
+    parse_next_args,
+    parse_question,
+    question_reply,
+    remove_upload,
+    sse_message,
+    upload_error,
+    upload_reply,
+    validate_session_id,
+)
+from ingest_worker import (
+    INGEST_PENDING_TTL,
+    UPLOAD_DIR,
+    enqueue_ingest_job,
+    get_status,
+    start_worker_pool,
+)
+from metrics import redis_snapshot, render_metrics, request_finished, request_started
+from sessions import (
+    STREAM_ANSWERS,
+    admit_question,
+    begin_generation,
+    claim_ip_slot,
+    create_redis_client,
+    create_session,
+    end_generation,
+    ip_slot_used,
+    is_generating,
+    next_sentences,
+    queue_answer,
+    redis_storage_uri,
+    wait_for_sentence,
+)
 from vector_store import VectorStore
 
 # ---------------------------------------------------------------------------
@@ -36,7 +89,7 @@ app = Flask(__name__)
 # ---------------------------------------------------------------------------
 
 # 10 MB upload limit – prevents huge PDFs that generate hundreds of embed calls
-app.config["MAX_CONTENT_LENGTH"] = 10 * 1024 * 1024
+app.config["MAX_CONTENT_LENGTH"] = MAX_CONTENT_LENGTH
 
 # Restrict CORS to the configured frontend origin (default: localhost dev)
 _allowed_origins = os.environ.get("CORS_ORIGINS", "http://localhost:8080").split(",")
@@ -46,31 +99,50 @@ CORS(app, origins=[o.strip() for o in _allowed_origins])
 limiter = Limiter(
     key_func=get_remote_address,
     app=app,
-    storage_uri=(
-        f"redis://:{os.environ.get('REDIS_PASSWORD', '')}@"
-        f"{os.environ.get('REDIS_HOST', 'localhost')}:"
-        f"{os.environ.get('REDIS_PORT', 6379)}/"
-        f"{os.environ.get('REDIS_DB', 0)}"
-    ),
+    storage_uri=redis_storage_uri(),
     default_limits=[],  # No global default – limits are per-route
 )
 
 # ---------------------------------------------------------------------------
 # Redis client
 # ---------------------------------------------------------------------------
-redis_client = redis.Redis(
-    host=os.environ.get("REDIS_HOST", "localhost"),
-    port=int(os.environ.get("REDIS_PORT", 6379)),
-    db=int(os.environ.get("REDIS_DB", 0)),
-    password=os.environ.get("REDIS_PASSWORD") or None,
-    decode_responses=True,
-)
-logger.info(
-    "Redis client configured at %s:%s (db=%s).",
-    os.environ.get("REDIS_HOST", "localhost"),
-    os.environ.get("REDIS_PORT", 6379),
-    os.environ.get("REDIS_DB", 0),
-)
+redis_client = create_redis_client()
+
+
+def _json(reply: Reply):
+    """Turn an api_common (payload, status) reply into a Flask response."""
+    payload, status = reply
+    return jsonify(payload), status
+
+
+# ---------------------------------------------------------------------------
+# Metrics
+# ---------------------------------------------------------------------------
+
+@app.before_request
+def _start_request_metrics():
+    g.metrics_started = request_started()
+
+
+@app.after_request
+def _finish_request_metrics(response):
+    started = g.pop("metrics_started", None)
+    if started is not None:
+        endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+        request_finished(started, endpoint, request.method, response.status_code)
+    return response
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """Prometheus metrics of the web and ingest processes (see metrics.py)."""
+    try:
+        snapshot = redis_snapshot(redis_client)
+    except Exception as exc:
+        logger.warning("metrics: Redis unavailable – %s", exc)
+        snapshot = None
+    body, content_type = render_metrics(snapshot)
+    return Response(body, content_type=content_type)
 
 
 # ---------------------------------------------------------------------------
@@ -80,7 +152,7 @@ logger.info(
 @app.errorhandler(413)
 def request_entity_too_large(e):
     """Friendly JSON response when the uploaded file exceeds MAX_CONTENT_LENGTH."""
-    return jsonify({"error": "File too large. Maximum allowed size is 10 MB."}), 413
+    return _json(FILE_TOO_LARGE)
 
 
 @app.route("/", methods=["GET"])
@@ -92,108 +164,108 @@ def index():
 
 
 # ---------------------------------------------------------------------------
-# PDF learning pipeline (upload endpoint only)
+# Answer generation → session queue
 # ---------------------------------------------------------------------------
 
-def _cleanup_temp_file(path: str) -> None:
-    """Remove a temporary file if it still exists, logging any failure."""
-    if path and os.path.exists(path):
-        try:
-            os.remove(path)
-            logger.debug("Temporary file removed: %s", path)
-        except OSError as exc:
-            logger.warning("Could not remove temporary file %s: %s", path, exc)
+# Background threads that finish streaming answers after the request returns
+_generation_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("GENERATION_WORKERS", 8)),
+    thread_name_prefix="answer-stream",
+)
 
 
-# ---------------------------------------------------------------------------
-# Sentence splitter utility
-# ---------------------------------------------------------------------------
+class _StreamProgress:
+    """State shared between a request thread and its streaming worker."""
 
-def _split_into_sentences(text: str) -> list[str]:
-    """Split a block of text into individual, non-trivial sentences."""
-    # Split on sentence-ending punctuation followed by whitespace
-    parts = re.split(r'(?<=[.!?])\s+', text.strip())
-    return [s.strip() for s in parts if s.strip() and len(s.strip()) > 10]
+    def __init__(self) -> None:
+        self.first_sentence = threading.Event()
+        self.queued = 0
+        self.error: Exception | None = None
 
 
-# ---------------------------------------------------------------------------
-# PDF upload → session creation
-# ---------------------------------------------------------------------------
+def _stream_answer(
+    session_id: str,
+    vector_store: VectorStore,
+    query: str,
+    cache_key: Tuple[str, str, str] | None,
+    progress: _StreamProgress,
+) -> None:
+    """
+    Stream the answer into the session queue on _generation_executor.
 
-# ---------------------------------------------------------------------------
-# IP-based one-time rate limiter helper
-# ---------------------------------------------------------------------------
+    Signals the waiting request after the first sentence and clears the
+    session's "generating" counter when finished.
+    """
+    def on_sentence(queued: int) -> None:
+        progress.queued = queued
+        progress.first_sentence.set()
 
-# Maximum allowed lengths for user-supplied text fields
-_MAX_TOPIC_LEN = 300
-_MAX_QUESTION_LEN = 500
-# Maximum questions a single session may ask (Gemini LLM call each)
-_MAX_QUESTIONS_PER_SESSION = 20
-# Maximum characters of extracted PDF text to embed.
-# A 10 MB text-dense PDF can produce 500 K+ chars → 500+ embedding API calls.
-# Capping at 50 000 chars keeps embedding calls to ≈50 per upload.
-_MAX_EXTRACTED_TEXT_LEN = 50_000
-
-
-# UUID pattern used to validate session-id URL parameters.
-_UUID_RE = re.compile(
-    r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$',
-    re.IGNORECASE,
-)
+    try:
+        queue_answer(redis_client, session_id, vector_store, query, cache_key, on_sentence)
+    except Exception as exc:
+        logger.exception("stream: error for session '%s' – %s", session_id, exc)
+        progress.error = exc
+    finally:
+        end_generation(redis_client, session_id)
+        progress.first_sentence.set()
 
 
-def _validate_session_id(session_id: str) -> bool:
-    """Return True only when session_id is a well-formed UUID v4 string."""
-    return bool(_UUID_RE.match(session_id))
+def _queue_answer(
+    session_id: str,
+    vector_store: VectorStore,
+    query: str,
+    cache_key: Tuple[str, str, str] | None = None,
+) -> int:
+    """
+    Generate an answer for ``query`` and push its sentences into the session queue.
 
+    Answers to semantically repeated questions come from the answer cache
+    (see sessions.queue_answer).  In streaming mode this returns as soon as
+    the first sentence is queued (the rest keeps arriving in the
+    background); otherwise it waits for the full answer.
 
-def _get_client_ip() -> str:
-    """
-    Return the real client IP.
+    Returns:
+        Number of sentences queued by the time this function returns.
 
-    X-Forwarded-For is only trusted when the TRUST_PROXY environment variable
-    is set to '1', i.e. when the app is deployed behind a known reverse proxy.
-    Trusting it unconditionally allows trivial IP-spoofing attacks.
+    Raises:
+        Exception: If generation failed before any sentence was queued.
     """
-    if os.environ.get("TRUST_PROXY") == "1":
-        forwarded = request.headers.get("X-Forwarded-For")
-        if forwarded:
-            return forwarded.split(",")[0].strip()
-    return request.remote_addr or "unknown"
-
+    if not STREAM_ANSWERS:
+        return queue_answer(redis_client, session_id, vector_store, query, cache_key)
 
-def _ip_already_used(ip: str) -> bool:
-    """Non-atomic fast check: return True if this IP has already consumed its slot."""
-    return redis_client.exists(f"rate_limit:ip:{ip}") == 1
+    # Mark generation as in progress before returning, so /next keeps the
+    # client polling instead of reporting the queue as done.
+    begin_generation(redis_client, session_id)
 
+    progress = _StreamProgress()
+    _generation_executor.submit(_stream_answer, session_id, vector_store, query, cache_key, progress)
 
-def _claim_ip_slot(ip: str) -> bool:
-    """
-    Atomically claim the one-time upload slot for this IP.
+    progress.first_sentence.wait(FIRST_SENTENCE_TIMEOUT)
+    if progress.error is not None and progress.queued == 0:
+        raise progress.error
+    return progress.queued
 
-    Uses Redis SET NX so that two concurrent requests from the same IP cannot
-    both pass the rate-limit check before either records the usage — the
-    classic TOCTOU race that the old check-then-set pattern suffered from.
 
-    This must be called AFTER input validation but BEFORE any Gemini API call
-    so that:
-      - A user with an invalid file can correct and retry without losing their slot.
-      - A transient Gemini error does not leave the slot open for unlimited retries.
+# ---------------------------------------------------------------------------
+# PDF upload → session creation
+# ---------------------------------------------------------------------------
 
-    Returns:
-        True  – slot was just claimed (request is allowed to proceed).
-        False – key already existed (request must be rejected).
-    """
-    # SET NX returns True when the key is newly written, None otherwise.
-    return redis_client.set(f"rate_limit:ip:{ip}", "1", nx=True) is True
+def _get_client_ip() -> str:
+    """Return the real client IP (see api_common.client_ip)."""
+    return client_ip(request.headers, request.remote_addr)
 
 
 @app.route("/upload", methods=["POST"])
 def upload():
     """
-    Upload a PDF + topic, extract text, build a FAISS vector store,
-    generate an initial teaching monologue, and populate a per-session
-    Redis sentence queue.
+    Upload a PDF + topic and start building the tutoring session.
+
+    The request only validates the input, stores the PDF and enqueues an
+    ingest job (see ingest_worker.py); text extraction, embedding, indexing
+    and the teaching monologue run in a background worker.  Progress is
+    available from /session/<id>/status and sentences appear in the session
+    queue as they are generated, so the client can start polling /next
+    straight away.
 
     Each IP address is allowed exactly one successful upload (rate-limited
     permanently in Redis).
@@ -203,7 +275,7 @@ def upload():
         topicToLearn (str)  – Topic the student wants to learn.
 
     Returns:
-        200 – {"session_id": "<uuid>", "sentence_count": <int>}
+        202 – {"session_id": "<uuid>", "status": "pending"}
         400 – Validation error.
         429 – IP already used its free session.
         500 – Processing error.
@@ -212,108 +284,83 @@ def upload():
 
     # Fast non-atomic check: reject immediately if IP is already permanently blocked.
     # (The key is never deleted once set, so reading without a lock is safe here.)
-    if _ip_already_used(client_ip):
+    if ip_slot_used(redis_client, client_ip):
         logger.info("upload: rate-limited request from IP %s.", client_ip)
-        return jsonify({"error": "rate_limited"}), 429
+        return _json(RATE_LIMITED)
 
     temp_path = None
     try:
-        if "uploadedPDF" not in request.files:
-            return jsonify({"error": "No PDF file provided"}), 400
-
-        file = request.files["uploadedPDF"]
+        file = request.files.get("uploadedPDF")
         topic = request.form.get("topicToLearn", "").strip()
-
-        if not file.filename:
-            return jsonify({"error": "No PDF file selected"}), 400
-        if not file.filename.lower().endswith(".pdf"):
-            return jsonify({"error": "File must be a PDF"}), 400
-        if not topic:
-            return jsonify({"error": "topicToLearn is required"}), 400
-        if len(topic) > _MAX_TOPIC_LEN:
-            return jsonify({"error": f"topicToLearn must be {_MAX_TOPIC_LEN} characters or fewer"}), 400
+        error = upload_error(file, topic)
+        if error is not None:
+            return _json(error)
 
         logger.info("upload: topic='%s', file='%s'.", topic, file.filename)
 
-        # Save to a temp file
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-            file.save(tmp.name)
-            temp_path = tmp.name
-
-        # Extract text
-        extracted_text = extract_text_from_pdf(temp_path)
-        if not extracted_text:
-            return jsonify({"error": "No text extracted from PDF"}), 400
-
-        # Cap text length to limit embedding API calls.
-        # A 10 MB all-text PDF can produce 500 K+ chars → 500+ Gemini embedding
-        # calls. Truncating to _MAX_EXTRACTED_TEXT_LEN keeps costs predictable.
-        if len(extracted_text) > _MAX_EXTRACTED_TEXT_LEN:
-            logger.warning(
-                "upload: extracted text truncated from %d to %d chars for session cost control.",
-                len(extracted_text),
-                _MAX_EXTRACTED_TEXT_LEN,
-            )
-            extracted_text = extracted_text[:_MAX_EXTRACTED_TEXT_LEN]
-
-        # Atomically claim the IP slot just before the first Gemini call.
-        # This prevents both the TOCTOU race (two concurrent requests from the
-        # same IP bypassing the check above) and retry loops caused by
-        # transient Gemini errors (the slot is consumed regardless of whether
-        # the API call succeeds).
-        if not _claim_ip_slot(client_ip):
+        # Save where the ingest workers can read it; they delete it after extraction
+        temp_path = new_upload_path(UPLOAD_DIR)
+        file.save(temp_path)
+
+        # Atomically claim the IP slot just before handing the job to the
+        # workers (whose first step leads to Gemini calls).  This prevents
+        # both the TOCTOU race (two concurrent requests from the same IP
+        # bypassing the check above) and retry loops caused by transient
+        # Gemini errors.  The worker gives the slot back if the PDF turns
+        # out to contain no text, so the user can retry with another file.
+        if not claim_ip_slot(redis_client, client_ip):
             logger.info("upload: concurrent rate-limit collision for IP %s.", client_ip)
-            return jsonify({"error": "rate_limited"}), 429
-
-        # Create session
-        session_id = str(uuid.uuid4())
-        store_path = os.path.join("faiss_store", session_id)
-        api_key = os.environ.get("GOOGLE_API_KEY")
-
-        # Build FAISS vector store
-        vector_store = VectorStore(google_api_key=api_key, pickle_file=store_path)
-        vector_store.create_vector_store_from_text(extracted_text)
-        logger.info("upload: vector store created at '%s'.", store_path)
-
-        # Generate an initial teaching script via RAG
-        teaching_query = (
-            f"You are an enthusiastic and clear AI tutor. "
-            f"Explain '{topic}' in 8 to 10 engaging, complete sentences "
-            f"that a student would enjoy listening to."
-        )
-        qa_result = vector_store.query_with_sources(teaching_query)
-        answer_text = qa_result.get("answer", "")
-
-        sentences = _split_into_sentences(answer_text)
-        if not sentences:
-            sentences = [answer_text.strip()]
-
-        # Push sentences into the session queue
-        queue_key = f"session:{session_id}:queue"
-        for sentence in sentences:
-            redis_client.rpush(queue_key, sentence)
-        redis_client.expire(queue_key, 3600)
-
-        # Store session metadata
-        meta_key = f"session:{session_id}:meta"
-        redis_client.hset(meta_key, mapping={
+            return _json(RATE_LIMITED)
+
+        session_id = create_session(redis_client, topic, file.filename, INGEST_PENDING_TTL)
+        enqueue_ingest_job(redis_client, {
+            "session_id": session_id,
+            "pdf_path": temp_path,
             "topic": topic,
-            "store_path": store_path,
             "filename": file.filename,
+            "client_ip": client_ip,
         })
-        redis_client.expire(meta_key, 3600)
+        temp_path = None  # owned by the worker from here on
 
-        logger.info(
-            "upload: session '%s' created with %d sentences.", session_id, len(sentences)
-        )
-
-        return jsonify({"session_id": session_id, "sentence_count": len(sentences)}), 200
+        logger.info("upload: session '%s' queued for ingestion.", session_id)
+        return _json(upload_reply(session_id))
 
     except Exception as exc:
         logger.exception("upload: unhandled error – %s", exc)
-        return jsonify({"error": "An internal error occurred. Please try again."}), 500
+        return _json(INTERNAL_ERROR_RETRY)
     finally:
-        _cleanup_temp_file(temp_path)
+        remove_upload(temp_path)
+
+
+# ---------------------------------------------------------------------------
+# Ingest status
+# ---------------------------------------------------------------------------
+
+@app.route("/session/<session_id>/status", methods=["GET"])
+@limiter.limit(STATUS_RATE_LIMIT)
+def session_status(session_id: str):
+    """
+    Report the ingest pipeline progress of a session.
+
+    Returns:
+        200 – {"status": "pending"|"processing"|"ready"|"failed",
+               "stage": "<stage>", "stage_index": <int>,
+               "stages": ["extract", "chunk", "embed", "index", "teach"],
+               "error": <str|null>}
+        400 – Invalid session_id format.
+        404 – Session not found / expired.
+        500 – Redis error.
+    """
+    if not validate_session_id(session_id):
+        return _json(INVALID_SESSION_ID)
+    try:
+        status = get_status(redis_client, session_id)
+        if status is None:
+            return _json(SESSION_NOT_FOUND)
+        return jsonify(status), 200
+    except Exception as exc:
+        logger.exception("session_status: error – %s", exc)
+        return _json(INTERNAL_ERROR)
 
 
 # ---------------------------------------------------------------------------
@@ -321,33 +368,88 @@ def upload():
 # ---------------------------------------------------------------------------
 
 @app.route("/session/<session_id>/next", methods=["GET"])
-@limiter.limit("120 per minute")
+@limiter.limit(NEXT_RATE_LIMIT)
 def session_next(session_id: str):
     """
-    Pop and return the next sentence from the session's Redis queue.
+    Pop and return the next sentence(s) from the session's Redis queue.
+
+    While an answer is still being streamed into the queue, an empty queue
+    is reported with "done": false so the client keeps polling.
+
+    Query parameters:
+        wait  (int, optional) – long-poll: hold the request for up to this
+                                many seconds (max 25) until a sentence is
+                                available instead of returning immediately.
+        count (int, optional) – pop up to this many sentences (default 1,
+                                max 10) so the client can prefetch.
 
     Returns:
-        200 – {"text": "<sentence>", "done": false, "remaining": <int>}
-              or {"text": null, "done": true, "remaining": 0} when empty.
-        400 – Invalid session_id format.
+        200 – {"text": "<first sentence>", "sentences": ["...", ...],
+               "done": false, "remaining": <int>}
+              or {"text": null, "sentences": [], "done": false,
+              "remaining": 0} while an answer is still being generated,
+              or {"text": null, "sentences": [], "done": true,
+              "remaining": 0} when empty.
+        400 – Invalid session_id format, wait or count value.
         500 – Redis error.
     """
-    if not _validate_session_id(session_id):
-        return jsonify({"error": "Invalid session ID"}), 400
+    if not validate_session_id(session_id):
+        return _json(INVALID_SESSION_ID)
+    wait, count, error = parse_next_args(request.args)
+    if error is not None:
+        return _json(error)
     try:
-        queue_key = f"session:{session_id}:queue"
-        sentence = redis_client.lpop(queue_key)
-        if sentence:
-            remaining = redis_client.llen(queue_key)
-            logger.debug("session_next: '%s' → sentence (%d remaining).", session_id, remaining)
-            return jsonify({"text": sentence, "done": False, "remaining": remaining}), 200
-
-        logger.debug("session_next: '%s' → queue empty.", session_id)
-        return jsonify({"text": None, "done": True, "remaining": 0}), 200
+        sentences, remaining, generating = next_sentences(redis_client, session_id, count, wait)
+        logger.debug(
+            "session_next: '%s' → %d sentence(s) (%d remaining, generating=%s).",
+            session_id, len(sentences), remaining, generating,
+        )
+        return _json(next_reply(sentences, remaining, generating))
 
     except Exception as exc:
         logger.exception("session_next: error – %s", exc)
-        return jsonify({"error": "An internal error occurred."}), 500
+        return _json(INTERNAL_ERROR)
+
+
+@app.route("/session/<session_id>/events", methods=["GET"])
+@limiter.limit(EVENTS_RATE_LIMIT)
+def session_events(session_id: str):
+    """
+    Server-Sent Events stream of the session's sentence queue.
+
+    Each queued sentence is popped and pushed to the client as soon as it
+    lands in Redis (BLPOP, no polling).  The stream ends with a "done"
+    event once the queue is empty and no answer is being generated.
+
+    Events:
+        sentence – data: {"text": "<sentence>"}
+        done     – data: {}
+        error    – data: {"error": "..."}
+
+    Returns:
+        200 – text/event-stream
+        400 – Invalid session_id format.
+    """
+    if not validate_session_id(session_id):
+        return _json(INVALID_SESSION_ID)
+
+    def generate():
+        try:
+            while True:
+                sentence = wait_for_sentence(redis_client, session_id, SSE_KEEPALIVE_SECONDS)
+                message, last = sse_message(sentence, bool(sentence) or is_generating(redis_client, session_id))
+                yield message
+                if last:
+                    return
+        except Exception as exc:
+            logger.exception("session_events: error – %s", exc)
+            yield SSE_ERROR
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers=SSE_HEADERS,
+    )
 
 
 # ---------------------------------------------------------------------------
@@ -355,11 +457,12 @@ def session_next(session_id: str):
 # ---------------------------------------------------------------------------
 
 @app.route("/session/<session_id>/question", methods=["POST"])
-@limiter.limit("1 per 30 seconds")
+@limiter.limit(QUESTION_RATE_LIMIT)
 def session_question(session_id: str):
     """
     Answer a student's question using the session's FAISS vector store and
-    push the response sentences back into the session queue.
+    push the response sentences back into the session queue (streamed as
+    they are generated when STREAM_ANSWERS is enabled).
 
     Request body (JSON):
         {"question": "<text>"}
@@ -368,69 +471,42 @@ def session_question(session_id: str):
         200 – {"status": "queued", "sentence_count": <int>}
         400 – Missing question or invalid session_id format.
         404 – Session not found / expired.
+        409 – Session still being prepared by the ingest worker.
         500 – Processing error.
     """
-    if not _validate_session_id(session_id):
-        return jsonify({"error": "Invalid session ID"}), 400
+    if not validate_session_id(session_id):
+        return _json(INVALID_SESSION_ID)
     try:
-        data = request.get_json(silent=True) or {}
-        question = data.get("question", "").strip()
-        if not question:
-            return jsonify({"error": "question is required"}), 400
-        # Truncate oversized questions to cap token costs
-        question = question[:_MAX_QUESTION_LEN]
-
-        meta_key = f"session:{session_id}:meta"
-        meta = redis_client.hgetall(meta_key)
-        if not meta:
-            return jsonify({"error": "Session not found or expired"}), 404
-
-        # Enforce per-session question cap
-        q_count_key = f"session:{session_id}:question_count"
-        question_count = int(redis_client.get(q_count_key) or 0)
-        if question_count >= _MAX_QUESTIONS_PER_SESSION:
-            logger.info(
-                "session_question: session '%s' hit the %d-question cap.",
-                session_id, _MAX_QUESTIONS_PER_SESSION,
-            )
-            return jsonify({"error": "question_limit_reached"}), 429
-        # Use a pipeline so INCR and EXPIRE are sent atomically.
-        # If the server crashes between two separate commands the key would
-        # persist forever with no TTL, permanently consuming a question slot.
-        pipe = redis_client.pipeline()
-        pipe.incr(q_count_key)
-        pipe.expire(q_count_key, 3600)
-        pipe.execute()
-
-        store_path = meta.get("store_path", "")
-        api_key = os.environ.get("GOOGLE_API_KEY")
+        question, error = parse_question(request.get_json(silent=True) or {})
+        if error is not None:
+            return _json(error)
 
-        # Load session vector store and answer the question
-        vector_store = VectorStore(google_api_key=api_key, pickle_file=store_path)
-        loaded = vector_store.load_index()
-        if not loaded:
-            return jsonify({"error": "Could not load session vector store"}), 500
-
-        qa_result = vector_store.query_with_sources(question)
-        answer_text = qa_result.get("answer", "")
-
-        sentences = _split_into_sentences(answer_text)
-        if not sentences:
-            sentences = [answer_text.strip()]
+        # Session lookup, readiness check and question cap in one round trip
+        verdict, meta = admit_question(redis_client, session_id, MAX_QUESTIONS_PER_SESSION)
+        error = admission_error(session_id, verdict)
+        if error is not None:
+            return _json(error)
 
-        queue_key = f"session:{session_id}:queue"
-        for sentence in sentences:
-            redis_client.rpush(queue_key, sentence)
-        redis_client.expire(queue_key, 3600)
+        # Load session vector store and answer the question
+        vector_store = VectorStore(google_api_key=os.environ.get("GOOGLE_API_KEY"), pickle_file=meta["store_path"])
+        if not vector_store.load_index():
+            return _json(INDEX_NOT_LOADED)
+
+        sentence_count = _queue_answer(
+            session_id,
+            vector_store,
+            question,
+            cache_key=(meta.get("fingerprint", ""), "question", question),
+        )
 
         logger.info(
-            "session_question: '%s' → %d sentences queued.", session_id, len(sentences)
+            "session_question: '%s' → %d sentences queued.", session_id, sentence_count
         )
-        return jsonify({"status": "queued", "sentence_count": len(sentences)}), 200
+        return _json(question_reply(sentence_count))
 
     except Exception as exc:
         logger.exception("session_question: error – %s", exc)
-        return jsonify({"error": "An internal error occurred. Please try again."}), 500
+        return _json(INTERNAL_ERROR_RETRY)
 
 
 # ---------------------------------------------------------------------------
@@ -440,5 +516,10 @@ def session_question(session_id: str):
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 7700))
     debug = os.environ.get("FLASK_DEBUG", "0") in ("1", "true", "True")
+    # Run ingest workers alongside the dev server (only in the reloader's
+    # child process when debug is on, so they are not started twice).
+    ingest_workers = int(os.environ.get("INGEST_WORKERS", 2))
+    if ingest_workers > 0 and (not debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true"):
+        start_worker_pool(ingest_workers)
     logger.info("Starting Flask server on port %d (debug=%s).", port, debug)
     app.run(host="0.0.0.0", port=port, debug=debug)
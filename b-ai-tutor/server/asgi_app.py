@@ -0,0 +1,474 @@
+"""
+Async (ASGI) variant of the tutoring API.
+
+Serves the same routes and responses as app.py, but on Quart with an
+asyncio Redis client and async Gemini calls, so a single worker holds many
+long-polls, SSE streams and in-flight LLM calls at once instead of one per
+thread.  Ingestion still runs in the ingest worker processes
+(ingest_worker.py); this app only enqueues jobs.
+
+Run it under an ASGI server with several worker processes, e.g. through
+serve.sh::
+
+    WEB_WORKERS=4 WEB_CONCURRENCY=1000 ./serve.sh
+    # or directly
+    uvicorn asgi_app:app --host 0.0.0.0 --port 7700 --workers 4
+"""
+
+import asyncio
+import functools
+import logging
+import os
+from typing import Any, Awaitable, Callable, Tuple
+
+from dotenv import load_dotenv
+from limits import parse
+from limits.aio.strategies import FixedWindowRateLimiter
+from limits.storage import storage_from_string
+from quart import Quart, Response, g, jsonify, request
+from quart_cors import cors
+
+from api_common import (
+    EVENTS_RATE_LIMIT,
+    FILE_TOO_LARGE,
+    FIRST_SENTENCE_TIMEOUT,
+    INDEX_NOT_LOADED,
+    INTERNAL_ERROR,
+    INTERNAL_ERROR_RETRY,
+    INVALID_SESSION_ID,
+    MAX_CONTENT_LENGTH,
+    MAX_QUESTIONS_PER_SESSION,
+    NEXT_RATE_LIMIT,
+    QUESTION_RATE_LIMIT,
+    RATE_LIMITED,
+    SESSION_NOT_FOUND,
+    SSE_ERROR,
+    SSE_HEADERS,
+    SSE_KEEPALIVE_SECONDS,
+    STATUS_RATE_LIMIT,
+    Reply,
+    admission_error,
+    client_ip,
+    new_upload_path,
+    next_reply,
+    parse_next_args,
+    parse_question,
+    question_reply,
+    remove_upload,
+    sse_message,
+    upload_error,
+    upload_reply,
+    validate_session_id,
+)
+from ingest_worker import INGEST_PENDING_TTL, UPLOAD_DIR, aenqueue_ingest_job, aget_status
+from metrics import aredis_snapshot, render_metrics, request_finished, request_started
+from sessions import (
+    STREAM_ANSWERS,
+    aadmit_question,
+    abegin_generation,
+    aclaim_ip_slot,
+    acreate_session,
+    aend_generation,
+    aip_slot_used,
+    ais_generating,
+    anext_sentences,
+    aqueue_answer,
+    await_for_sentence,
+    create_async_redis_client,
+    redis_storage_uri,
+)
+from vector_store import VectorStore
+
+# ---------------------------------------------------------------------------
+# Logging configuration
+# ---------------------------------------------------------------------------
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s  %(levelname)-8s  %(name)s  %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# App bootstrap
+# ---------------------------------------------------------------------------
+load_dotenv()
+
+app = Quart(__name__)
+
+# ---------------------------------------------------------------------------
+# Security config
+# ---------------------------------------------------------------------------
+
+app.config["MAX_CONTENT_LENGTH"] = MAX_CONTENT_LENGTH
+
+# Restrict CORS to the configured frontend origin (default: localhost dev)
+_allowed_origins = os.environ.get("CORS_ORIGINS", "http://localhost:8080").split(",")
+app = cors(app, allow_origin=[o.strip() for o in _allowed_origins])
+
+# ---------------------------------------------------------------------------
+# Redis client
+# ---------------------------------------------------------------------------
+redis_client = create_async_redis_client()
+
+
+@app.after_serving
+async def _close_redis() -> None:
+    await redis_client.aclose()
+
+
+def _json(reply: Reply):
+    """Turn an api_common (payload, status) reply into a Quart response."""
+    payload, status = reply
+    return jsonify(payload), status
+
+
+# ---------------------------------------------------------------------------
+# Per-IP rate limits
+# ---------------------------------------------------------------------------
+
+# Same fixed-window limits as flask-limiter in app.py, on the same Redis.
+# RATELIMIT_ENABLED=0 turns them off, as it does for flask-limiter.
+RATE_LIMITS_ENABLED = os.environ.get("RATELIMIT_ENABLED", "1") in ("1", "true", "True")
+_rate_limiter = FixedWindowRateLimiter(
+    storage_from_string(f"async+{redis_storage_uri()}", implementation="redispy")
+)
+
+
+def rate_limit(limit: str) -> Callable[[Callable[..., Awaitable[Any]]], Callable[..., Awaitable[Any]]]:
+    """
+    Route decorator applying ``limit`` (e.g. "60 per minute") per remote address.
+
+    Rejected requests get 429 {"error": "rate_limited"}.
+    """
+    item = parse(limit)
+
+    def decorator(view: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+        @functools.wraps(view)
+        async def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if RATE_LIMITS_ENABLED:
+                key = request.remote_addr or "unknown"
+                if not await _rate_limiter.hit(item, view.__name__, key):
+                    logger.info("%s: rate-limited request from %s.", view.__name__, key)
+                    return _json(RATE_LIMITED)
+            return await view(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+# ---------------------------------------------------------------------------
+# Metrics
+# ---------------------------------------------------------------------------
+
+@app.before_request
+async def _start_request_metrics() -> None:
+    g.metrics_started = request_started()
+
+
+@app.after_request
+async def _finish_request_metrics(response):
+    started = g.pop("metrics_started", None)
+    if started is not None:
+        endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+        request_finished(started, endpoint, request.method, response.status_code)
+    return response
+
+
+@app.route("/metrics", methods=["GET"])
+async def metrics():
+    """Prometheus metrics of the web and ingest processes (see metrics.py)."""
+    try:
+        snapshot = await aredis_snapshot(redis_client)
+    except Exception as exc:
+        logger.warning("metrics: Redis unavailable – %s", exc)
+        snapshot = None
+    body, content_type = render_metrics(snapshot)
+    return Response(body, content_type=content_type)
+
+
+# ---------------------------------------------------------------------------
+# Health check
+# ---------------------------------------------------------------------------
+
+@app.errorhandler(413)
+async def request_entity_too_large(e):
+    """Friendly JSON response when the uploaded file exceeds MAX_CONTENT_LENGTH."""
+    return _json(FILE_TOO_LARGE)
+
+
+@app.route("/", methods=["GET"])
+async def index():
+    """Return a simple health-check payload including the configured port."""
+    port = int(os.environ.get("PORT", 7700))
+    return jsonify({"status": "ok", "port": port})
+
+
+# ---------------------------------------------------------------------------
+# Answer generation → session queue
+# ---------------------------------------------------------------------------
+
+
+class _StreamProgress:
+    """State shared between a request and its background streaming task."""
+
+    def __init__(self) -> None:
+        self.first_sentence = asyncio.Event()
+        self.queued = 0
+        self.error: Exception | None = None
+
+
+async def _stream_answer(
+    session_id: str,
+    vector_store: VectorStore,
+    query: str,
+    cache_key: Tuple[str, str, str] | None,
+    progress: _StreamProgress,
+) -> None:
+    """
+    Stream the answer into the session queue as a background task.
+
+    Signals the waiting request after the first sentence and clears the
+    session's "generating" counter when finished.
+    """
+    def on_sentence(queued: int) -> None:
+        progress.queued = queued
+        progress.first_sentence.set()
+
+    try:
+        await aqueue_answer(redis_client, session_id, vector_store, query, cache_key, on_sentence)
+    except Exception as exc:
+        logger.exception("stream: error for session '%s' – %s", session_id, exc)
+        progress.error = exc
+    finally:
+        await aend_generation(redis_client, session_id)
+        progress.first_sentence.set()
+
+
+async def _queue_answer(
+    session_id: str,
+    vector_store: VectorStore,
+    query: str,
+    cache_key: Tuple[str, str, str] | None = None,
+) -> int:
+    """
+    Async variant of app._queue_answer().
+
+    In streaming mode the answer keeps arriving from a Quart background
+    task (awaited on shutdown) after the first sentence is queued.
+
+    Returns:
+        Number of sentences queued by the time this coroutine returns.
+
+    Raises:
+        Exception: If generation failed before any sentence was queued.
+    """
+    if not STREAM_ANSWERS:
+        return await aqueue_answer(redis_client, session_id, vector_store, query, cache_key)
+
+    # Mark generation as in progress before returning, so /next keeps the
+    # client polling instead of reporting the queue as done.
+    await abegin_generation(redis_client, session_id)
+
+    progress = _StreamProgress()
+    app.add_background_task(_stream_answer, session_id, vector_store, query, cache_key, progress)
+
+    try:
+        await asyncio.wait_for(progress.first_sentence.wait(), FIRST_SENTENCE_TIMEOUT)
+    except asyncio.TimeoutError:
+        pass
+    if progress.error is not None and progress.queued == 0:
+        raise progress.error
+    return progress.queued
+
+
+# ---------------------------------------------------------------------------
+# PDF upload → session creation
+# ---------------------------------------------------------------------------
+
+def _get_client_ip() -> str:
+    """Return the real client IP (see api_common.client_ip)."""
+    return client_ip(request.headers, request.remote_addr)
+
+
+@app.route("/upload", methods=["POST"])
+async def upload():
+    """
+    Upload a PDF + topic and start building the tutoring session.
+
+    Same contract as app.upload(): validates the input, stores the PDF,
+    claims the IP's one-time slot and enqueues an ingest job.
+
+    Returns:
+        202 – {"session_id": "<uuid>", "status": "pending"}
+        400 – Validation error.
+        429 – IP already used its free session.
+        500 – Processing error.
+    """
+    ip = _get_client_ip()
+
+    if await aip_slot_used(redis_client, ip):
+        logger.info("upload: rate-limited request from IP %s.", ip)
+        return _json(RATE_LIMITED)
+
+    temp_path = None
+    try:
+        file = (await request.files).get("uploadedPDF")
+        topic = (await request.form).get("topicToLearn", "").strip()
+        error = upload_error(file, topic)
+        if error is not None:
+            return _json(error)
+
+        logger.info("upload: topic='%s', file='%s'.", topic, file.filename)
+
+        # Save where the ingest workers can read it; they delete it after extraction
+        temp_path = new_upload_path(UPLOAD_DIR)
+        await file.save(temp_path)
+
+        # Atomically claim the IP slot (SET NX) – see sessions.claim_ip_slot()
+        if not await aclaim_ip_slot(redis_client, ip):
+            logger.info("upload: concurrent rate-limit collision for IP %s.", ip)
+            return _json(RATE_LIMITED)
+
+        session_id = await acreate_session(redis_client, topic, file.filename, INGEST_PENDING_TTL)
+        await aenqueue_ingest_job(redis_client, {
+            "session_id": session_id,
+            "pdf_path": temp_path,
+            "topic": topic,
+            "filename": file.filename,
+            "client_ip": ip,
+        })
+        temp_path = None  # owned by the worker from here on
+
+        logger.info("upload: session '%s' queued for ingestion.", session_id)
+        return _json(upload_reply(session_id))
+
+    except Exception as exc:
+        logger.exception("upload: unhandled error – %s", exc)
+        return _json(INTERNAL_ERROR_RETRY)
+    finally:
+        remove_upload(temp_path)
+
+
+# ---------------------------------------------------------------------------
+# Ingest status
+# ---------------------------------------------------------------------------
+
+@app.route("/session/<session_id>/status", methods=["GET"])
+@rate_limit(STATUS_RATE_LIMIT)
+async def session_status(session_id: str):
+    """Report the ingest pipeline progress of a session (see app.session_status)."""
+    if not validate_session_id(session_id):
+        return _json(INVALID_SESSION_ID)
+    try:
+        status = await aget_status(redis_client, session_id)
+        if status is None:
+            return _json(SESSION_NOT_FOUND)
+        return jsonify(status), 200
+    except Exception as exc:
+        logger.exception("session_status: error – %s", exc)
+        return _json(INTERNAL_ERROR)
+
+
+# ---------------------------------------------------------------------------
+# Per-session sentence polling
+# ---------------------------------------------------------------------------
+
+
+@app.route("/session/<session_id>/next", methods=["GET"])
+@rate_limit(NEXT_RATE_LIMIT)
+async def session_next(session_id: str):
+    """
+    Pop and return the next sentence(s) from the session's Redis queue.
+
+    Same query parameters and responses as app.session_next().
+    """
+    if not validate_session_id(session_id):
+        return _json(INVALID_SESSION_ID)
+    wait, count, error = parse_next_args(request.args)
+    if error is not None:
+        return _json(error)
+    try:
+        sentences, remaining, generating = await anext_sentences(redis_client, session_id, count, wait)
+        return _json(next_reply(sentences, remaining, generating))
+
+    except Exception as exc:
+        logger.exception("session_next: error – %s", exc)
+        return _json(INTERNAL_ERROR)
+
+
+@app.route("/session/<session_id>/events", methods=["GET"])
+@rate_limit(EVENTS_RATE_LIMIT)
+async def session_events(session_id: str):
+    """Server-Sent Events stream of the session's sentence queue (see app.session_events)."""
+    if not validate_session_id(session_id):
+        return _json(INVALID_SESSION_ID)
+
+    async def generate():
+        try:
+            while True:
+                sentence = await await_for_sentence(redis_client, session_id, SSE_KEEPALIVE_SECONDS)
+                message, last = sse_message(sentence, bool(sentence) or await ais_generating(redis_client, session_id))
+                yield message
+                if last:
+                    return
+        except Exception as exc:
+            logger.exception("session_events: error – %s", exc)
+            yield SSE_ERROR
+
+    response = Response(generate(), mimetype="text/event-stream", headers=SSE_HEADERS)
+    # The stream lasts as long as the answer; Quart's response timeout would cut it
+    response.timeout = None
+    return response
+
+
+# ---------------------------------------------------------------------------
+# Per-session question answering
+# ---------------------------------------------------------------------------
+
+@app.route("/session/<session_id>/question", methods=["POST"])
+@rate_limit(QUESTION_RATE_LIMIT)
+async def session_question(session_id: str):
+    """
+    Answer a student's question into the session queue.
+
+    Same request body and responses as app.session_question(); retrieval
+    and the Gemini call are awaited instead of occupying a thread.
+    """
+    if not validate_session_id(session_id):
+        return _json(INVALID_SESSION_ID)
+    try:
+        question, error = parse_question(await request.get_json(silent=True) or {})
+        if error is not None:
+            return _json(error)
+
+        # Session lookup, readiness check and question cap in one round trip
+        verdict, meta = await aadmit_question(redis_client, session_id, MAX_QUESTIONS_PER_SESSION)
+        error = admission_error(session_id, verdict)
+        if error is not None:
+            return _json(error)
+
+        vector_store = VectorStore(
+            google_api_key=os.environ.get("GOOGLE_API_KEY"),
+            pickle_file=meta["store_path"],
+        )
+        # Usually an in-process cache hit; a cold load reads the index from disk
+        if not await asyncio.to_thread(vector_store.load_index):
+            return _json(INDEX_NOT_LOADED)
+
+        sentence_count = await _queue_answer(
+            session_id,
+            vector_store,
+            question,
+            cache_key=(meta.get("fingerprint", ""), "question", question),
+        )
+
+        logger.info(
+            "session_question: '%s' → %d sentences queued.", session_id, sentence_count
+        )
+        return _json(question_reply(sentence_count))
+
+    except Exception as exc:
+        logger.exception("session_question: error – %s", exc)
+        return _json(INTERNAL_ERROR_RETRY)
@@ -0,0 +1,555 @@
+"""
+End-to-end benchmark of the tutoring API, runnable offline.
+
+Serves app.py (Flask, threaded werkzeug server) or asgi_app.py (uvicorn)
+on a local port, runs ingest workers as threads of the same process, and
+drives whole sessions over HTTP:
+
+    POST /upload → GET /status → GET /next (long-poll) until the teaching
+    monologue is done → POST /question, GET /next until answered, …
+
+Gemini is replaced by the deterministic stand-ins in stubs.py (latencies
+configurable) and Redis by fakeredis unless --redis-url is given.  The
+corpus is a set of generated PDFs of the requested page counts; sessions
+cycle through it, so repeated documents exercise the shared index and
+answer caches like real traffic does.
+
+Reported per endpoint: requests, errors, throughput, p50/p95/p99 latency
+and the peak RSS sampled while requests to it were in flight.  Per
+pipeline stage: the ai_tutor_stage_seconds histograms (see metrics.py),
+with percentiles interpolated from their buckets, and the peak RSS while a
+session was in the matching ingest stage.  Everything runs in one process,
+so RSS covers the web server and the ingest workers (but not the PDF
+extraction pool, which PDF_EXTRACT_WORKERS=1 avoids).
+
+--json saves the results; --baseline compares p95 latencies with a saved
+run and exits with status 1 when one regressed by more than --tolerance.
+
+Usage (from b-ai-tutor/server)::
+
+    python benchmarks/e2e.py
+    python benchmarks/e2e.py --app asgi --sessions 24 --concurrency 8 --pages 2 10 40
+    python benchmarks/e2e.py --json main.json
+    python benchmarks/e2e.py --baseline main.json --tolerance 0.2
+
+Needs fakeredis (with lupa for its Lua support) unless --redis-url is used.
+"""
+
+import argparse
+import json
+import logging
+import os
+import resource
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Tuple
+
+import httpx
+import numpy as np
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stubs import FakeChatModel, FakeEmbeddings, generate_corpus  # noqa: E402
+
+# Questions are drawn from this list, so some repeat across sessions on
+# the same document (answer cache hits) and some do not
+_QUESTIONS = [
+    "What does the enzyme do in this reaction?",
+    "How is energy moved across the membrane?",
+    "Why is chlorophyll important for the leaf?",
+    "What happens to glucose inside the cell?",
+    "How do signals reach the nucleus?",
+    "Which molecule carries the electron?",
+]
+_INGEST_STAGES = ["extract", "chunk", "embed", "index", "teach"]
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+# ---------------------------------------------------------------------------
+# Measurements
+# ---------------------------------------------------------------------------
+
+
+def current_rss() -> int:
+    """Resident set size of this process in bytes."""
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * _PAGE_SIZE
+    except OSError:
+        # Peak rather than current, but still an upper bound (KiB on Linux)
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class Recorder:
+    """Request latencies per endpoint plus an RSS sampler keyed by what is running."""
+
+    def __init__(self, redis_client: Any, interval: float = 0.05) -> None:
+        self.redis_client = redis_client
+        self.interval = interval
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.peak_rss: Dict[str, int] = defaultdict(int)
+        self.active_sessions: set = set()
+        self._in_flight: Dict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, name="rss-sampler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def request(self, endpoint: str, send: Callable[[], httpx.Response], ok: Tuple[int, ...] = (200,)) -> httpx.Response:
+        """Send one request and record its latency under ``endpoint``."""
+        with self._lock:
+            self._in_flight[endpoint] += 1
+        started = time.perf_counter()
+        try:
+            response = send()
+        except httpx.HTTPError:
+            with self._lock:
+                self.errors[endpoint] += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self._in_flight[endpoint] -= 1
+        with self._lock:
+            self.latencies[endpoint].append(elapsed)
+            if response.status_code not in ok:
+                self.errors[endpoint] += 1
+        return response
+
+    def record(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self.latencies[name].append(seconds)
+
+    def _sample(self) -> None:
+        from sessions import status_key
+
+        while not self._stop.wait(self.interval):
+            rss = current_rss()
+            with self._lock:
+                self.peak_rss["process"] = max(self.peak_rss["process"], rss)
+                busy = [name for name, count in self._in_flight.items() if count]
+                sessions = list(self.active_sessions)
+            for name in busy:
+                self.peak_rss[name] = max(self.peak_rss[name], rss)
+            for session_id in sessions:
+                stage = self.redis_client.hget(status_key(session_id), "stage")
+                if stage in _INGEST_STAGES:
+                    self.peak_rss[f"ingest:{stage}"] = max(self.peak_rss[f"ingest:{stage}"], rss)
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    p50, p95, p99 = np.percentile(values, [50, 95, 99]) if values else (0.0, 0.0, 0.0)
+    return {"p50": float(p50), "p95": float(p95), "p99": float(p99)}
+
+
+def stage_histograms() -> Dict[str, Dict[str, Any]]:
+    """Read ai_tutor_stage_seconds from this process's registry."""
+    from prometheus_client import REGISTRY
+
+    buckets: Dict[str, List[Tuple[float, float]]] = defaultdict(list)
+    totals: Dict[str, Dict[str, float]] = defaultdict(dict)
+    for family in REGISTRY.collect():
+        if family.name != "ai_tutor_stage_seconds":
+            continue
+        for sample in family.samples:
+            stage = sample.labels["stage"]
+            if sample.name.endswith("_bucket"):
+                buckets[stage].append((float(sample.labels["le"]), sample.value))
+            elif sample.name.endswith("_count"):
+                totals[stage]["count"] = sample.value
+            elif sample.name.endswith("_sum"):
+                totals[stage]["sum"] = sample.value
+
+    result = {}
+    for stage, bounds in buckets.items():
+        count = totals[stage].get("count", 0)
+        if not count:
+            continue
+        bounds.sort()
+        result[stage] = {
+            "count": int(count),
+            "mean": totals[stage].get("sum", 0.0) / count,
+            **{name: _bucket_quantile(bounds, q) for name, q in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99))},
+        }
+    return result
+
+
+def context_sizes() -> Dict[str, float]:
+    """Mean tokens and chunks of RAG context per prompt, from this process's registry."""
+    from prometheus_client import REGISTRY
+
+    values: Dict[str, float] = {}
+    for family in REGISTRY.collect():
+        if family.name in ("ai_tutor_rag_context_tokens", "ai_tutor_rag_context_chunks"):
+            for sample in family.samples:
+                if sample.name.endswith(("_sum", "_count")):
+                    values[sample.name.removeprefix("ai_tutor_rag_context_")] = sample.value
+    prompts = values.get("tokens_count", 0)
+    return {
+        "prompts": int(prompts),
+        "mean_tokens": values.get("tokens_sum", 0.0) / prompts if prompts else 0.0,
+        "mean_chunks": values.get("chunks_sum", 0.0) / prompts if prompts else 0.0,
+    }
+
+
+def _bucket_quantile(bounds: List[Tuple[float, float]], q: float) -> float:
+    """Linear interpolation inside the bucket holding quantile ``q`` (like histogram_quantile)."""
+    total = bounds[-1][1]
+    rank = q * total
+    lower_bound, lower_count = 0.0, 0.0
+    for upper_bound, upper_count in bounds:
+        if upper_count >= rank:
+            if upper_bound == float("inf"):
+                return lower_bound
+            span = upper_count - lower_count
+            fraction = (rank - lower_count) / span if span else 0.0
+            return lower_bound + (upper_bound - lower_bound) * fraction
+        lower_bound, lower_count = upper_bound, upper_count
+    return lower_bound
+
+
+# ---------------------------------------------------------------------------
+# Environment
+# ---------------------------------------------------------------------------
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def install_stubs(args: argparse.Namespace) -> Tuple[Any, Any]:
+    """
+    Swap Gemini and Redis for the stand-ins.
+
+    Returns:
+        (sync Redis client, async Redis client) shared by every component.
+    """
+    import document_index
+    import ingest_worker
+    import query_cache
+    import vector_store
+    from metrics import GeminiMetricsCallback
+
+    embeddings = FakeEmbeddings(args.embed_dims, args.embed_latency, args.embed_latency_per_text)
+    llm = FakeChatModel(
+        first_token_latency=args.llm_first_token,
+        token_latency=args.llm_token,
+        callbacks=[GeminiMetricsCallback("fake-gemini")],
+    )
+    vector_store.get_embeddings_client = lambda *a, **k: embeddings
+    vector_store.get_llm_client = lambda *a, **k: llm
+
+    if args.redis_url:
+        import redis
+        import redis.asyncio
+
+        sync_client = redis.Redis.from_url(args.redis_url, decode_responses=True)
+        async_client = redis.asyncio.Redis.from_url(args.redis_url, decode_responses=True)
+    else:
+        import fakeredis
+
+        server = fakeredis.FakeServer()
+        sync_client = fakeredis.FakeRedis(server=server, decode_responses=True)
+        async_client = fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+
+    ingest_worker.create_redis_client = lambda: sync_client
+    document_index.create_redis_client = lambda: sync_client
+    query_cache.create_redis_client = lambda: sync_client
+    return sync_client, async_client
+
+
+def start_server(app_name: str, sync_client: Any, async_client: Any) -> Tuple[str, Callable[[], None]]:
+    """Serve the chosen app on a free local port; returns (base URL, stop function)."""
+    port = _free_port()
+
+    if app_name == "flask":
+        from werkzeug.serving import make_server
+
+        import app as flask_app
+
+        flask_app.redis_client = sync_client
+        flask_app.limiter.enabled = False
+        server = make_server("127.0.0.1", port, flask_app.app, threaded=True)
+        thread = threading.Thread(target=server.serve_forever, name="flask-server", daemon=True)
+        thread.start()
+        return f"http://127.0.0.1:{port}", server.shutdown
+
+    import uvicorn
+
+    import asgi_app
+
+    asgi_app.redis_client = async_client
+    asgi_app.RATE_LIMITS_ENABLED = False
+    server = uvicorn.Server(uvicorn.Config(asgi_app.app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, name="uvicorn", daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+
+    def stop() -> None:
+        server.should_exit = True
+        thread.join()
+
+    return f"http://127.0.0.1:{port}", stop
+
+
+def start_ingest_workers(count: int) -> Callable[[], None]:
+    from ingest_worker import worker_loop
+
+    stop_event = threading.Event()
+    threads = [
+        threading.Thread(target=worker_loop, args=(stop_event,), name=f"ingest-{i}", daemon=True)
+        for i in range(count)
+    ]
+    for thread in threads:
+        thread.start()
+
+    def stop() -> None:
+        stop_event.set()
+        for thread in threads:
+            thread.join()
+
+    return stop
+
+
+# ---------------------------------------------------------------------------
+# Sessions
+# ---------------------------------------------------------------------------
+
+
+def drain(client: httpx.Client, recorder: Recorder, session_id: str, batch: int, wait: int) -> int:
+    """Long-poll /next until the session reports done; returns sentences received."""
+    received = 0
+    while True:
+        response = recorder.request(
+            "GET /next", lambda: client.get(f"/session/{session_id}/next", params={"wait": wait, "count": batch})
+        )
+        body = response.json()
+        received += len(body.get("sentences", []))
+        if response.status_code != 200 or (body.get("done") and not body.get("sentences")):
+            return received
+
+
+def run_session(base_url: str, recorder: Recorder, pdf_path: str, index: int, args: argparse.Namespace) -> None:
+    """One student: upload, hear the teaching monologue, ask questions."""
+    # TRUST_PROXY=1: every session gets its own client IP (one free upload per IP)
+    headers = {"X-Forwarded-For": f"10.{index // 65536 % 256}.{index // 256 % 256}.{index % 256}"}
+    with httpx.Client(base_url=base_url, headers=headers, timeout=120) as client:
+        started = time.perf_counter()
+        with open(pdf_path, "rb") as fh:
+            response = recorder.request(
+                "POST /upload",
+                lambda: client.post(
+                    "/upload",
+                    files={"uploadedPDF": (os.path.basename(pdf_path), fh, "application/pdf")},
+                    data={"topicToLearn": "the main ideas of this document"},
+                ),
+                ok=(202,),
+            )
+        if response.status_code != 202:
+            return
+        session_id = response.json()["session_id"]
+        recorder.active_sessions.add(session_id)
+        recorder.request("GET /status", lambda: client.get(f"/session/{session_id}/status"))
+
+        # Time to first sentence, as the student experiences it
+        while True:
+            first = recorder.request(
+                "GET /next", lambda: client.get(f"/session/{session_id}/next", params={"wait": 25, "count": 1})
+            )
+            body = first.json()
+            if first.status_code != 200 or body.get("sentences") or body.get("done"):
+                break
+        if body.get("sentences"):
+            recorder.record("upload → first sentence", time.perf_counter() - started)
+            drain(client, recorder, session_id, args.batch, wait=10)
+        recorder.record("upload → monologue done", time.perf_counter() - started)
+        recorder.active_sessions.discard(session_id)
+
+        for q in range(args.questions):
+            question = _QUESTIONS[(index + q) % len(_QUESTIONS)]
+            asked = time.perf_counter()
+            response = recorder.request(
+                "POST /question", lambda: client.post(f"/session/{session_id}/question", json={"question": question})
+            )
+            if response.status_code == 200:
+                drain(client, recorder, session_id, args.batch, wait=10)
+                recorder.record("question → answer done", time.perf_counter() - asked)
+
+
+# ---------------------------------------------------------------------------
+# Report
+# ---------------------------------------------------------------------------
+
+
+def summarise(recorder: Recorder, wall: float) -> Dict[str, Any]:
+    endpoints = {}
+    for name, values in sorted(recorder.latencies.items()):
+        endpoints[name] = {
+            "requests": len(values),
+            "errors": recorder.errors.get(name, 0),
+            "throughput": len(values) / wall if wall else 0.0,
+            **percentiles(values),
+            "peak_rss_mb": recorder.peak_rss.get(name, 0) / 2**20,
+        }
+    stages = stage_histograms()
+    # Ingest status stages are coarser than the histogram stages: RSS only
+    for name in _INGEST_STAGES:
+        if recorder.peak_rss.get(f"ingest:{name}"):
+            stages.setdefault(f"ingest:{name}", {})["peak_rss_mb"] = recorder.peak_rss[f"ingest:{name}"] / 2**20
+    return {
+        "wall_seconds": wall,
+        "peak_rss_mb": recorder.peak_rss.get("process", 0) / 2**20,
+        "endpoints": endpoints,
+        "stages": stages,
+        "context": context_sizes(),
+    }
+
+
+def _mb(value: float | None) -> str:
+    return f"{value:.0f}" if value else "-"
+
+
+def print_report(result: Dict[str, Any]) -> None:
+    print(f"\nwall {result['wall_seconds']:.1f}s, peak RSS {result['peak_rss_mb']:.0f} MB")
+    print(f"\n{'endpoint / flow':<26}{'n':>6}{'err':>5}{'req/s':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'RSS MB':>8}")
+    for name, s in result["endpoints"].items():
+        print(
+            f"{name:<26}{s['requests']:>6}{s['errors']:>5}{s['throughput']:>8.1f}"
+            f"{s['p50'] * 1000:>9.1f}{s['p95'] * 1000:>9.1f}{s['p99'] * 1000:>9.1f}"
+            f"{_mb(s.get('peak_rss_mb')):>8}"
+        )
+    print(f"\n{'stage':<26}{'n':>6}{'mean ms':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'RSS MB':>8}")
+    for name, s in sorted(result["stages"].items()):
+        if "count" not in s:
+            print(f"{name:<26}{'':>42}{_mb(s['peak_rss_mb']):>8}")
+            continue
+        print(
+            f"{name:<26}{s['count']:>6}{s['mean'] * 1000:>9.1f}{s['p50'] * 1000:>9.1f}"
+            f"{s['p95'] * 1000:>9.1f}{s['p99'] * 1000:>9.1f}{_mb(s.get('peak_rss_mb')):>8}"
+        )
+    context = result.get("context") or {}
+    if context.get("prompts"):
+        print(
+            f"\nRAG context: {context['mean_tokens']:.0f} tokens in {context['mean_chunks']:.1f} chunks "
+            f"per prompt ({context['prompts']} prompts)"
+        )
+
+
+def compare(result: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Return the p95 latencies that regressed by more than ``tolerance``."""
+    regressions = []
+    for section in ("endpoints", "stages"):
+        for name, stats in result[section].items():
+            before = baseline.get(section, {}).get(name, {}).get("p95")
+            after = stats.get("p95")
+            if before and after and after > before * (1 + tolerance):
+                regressions.append(f"{section[:-1]} '{name}': p95 {before * 1000:.1f} → {after * 1000:.1f} ms")
+    return regressions
+
+
+# ---------------------------------------------------------------------------
+# Entry point
+# ---------------------------------------------------------------------------
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--app", choices=["flask", "asgi"], default="flask")
+    parser.add_argument("--sessions", type=int, default=12, help="student sessions to run")
+    parser.add_argument("--concurrency", type=int, default=4, help="sessions running at once")
+    parser.add_argument("--questions", type=int, default=3, help="questions per session")
+    parser.add_argument("--pages", type=int, nargs="+", default=[2, 10, 30], help="page counts of the corpus PDFs")
+    parser.add_argument("--batch", type=int, default=3, help="?count= of /next requests")
+    parser.add_argument("--ingest-workers", type=int, default=2)
+    parser.add_argument("--embed-dims", type=int, default=768)
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="seconds per embedding call")
+    parser.add_argument("--embed-latency-per-text", type=float, default=0.0005)
+    parser.add_argument("--llm-first-token", type=float, default=0.3, help="seconds to the first LLM token")
+    parser.add_argument("--llm-token", type=float, default=0.005, help="seconds per further LLM token")
+    parser.add_argument("--redis-url", help="use this Redis instead of fakeredis (keys are not cleaned up)")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--baseline", help="results of an earlier run to compare p95 latencies with")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p95 slowdown vs --baseline")
+    parser.add_argument("--verbose", action="store_true", help="keep the server's INFO logging")
+    parser.add_argument("--keep", action="store_true", help="keep the working directory")
+    args = parser.parse_args()
+
+    # Indexes, uploads and the embedding cache go to a scratch directory
+    workdir = tempfile.mkdtemp(prefix="ai-tutor-bench-")
+    os.chdir(workdir)
+    os.environ.setdefault("GOOGLE_API_KEY", "benchmark")
+    os.environ.setdefault("UPLOAD_DIR", os.path.join(workdir, "uploads"))
+    os.environ.setdefault("RATELIMIT_STORAGE_URI", "memory://")
+    os.environ.setdefault("PDF_EXTRACT_WORKERS", "1")
+    os.environ["TRUST_PROXY"] = "1"
+    os.makedirs(os.environ["UPLOAD_DIR"], exist_ok=True)
+
+    sync_client, async_client = install_stubs(args)
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+        for name in ("werkzeug", "httpx", "uvicorn.access"):
+            logging.getLogger(name).setLevel(logging.WARNING)
+    corpus = generate_corpus(os.path.join(workdir, "corpus"), args.pages)
+    base_url, stop_server = start_server(args.app, sync_client, async_client)
+    stop_workers = start_ingest_workers(args.ingest_workers)
+    recorder = Recorder(sync_client)
+    recorder.start()
+
+    print(
+        f"{args.app}: {args.sessions} sessions ({args.concurrency} at once, {args.questions} questions each) "
+        f"over {len(corpus)} PDFs of {', '.join(map(str, args.pages))} pages"
+    )
+    started = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            futures = [
+                pool.submit(run_session, base_url, recorder, corpus[i % len(corpus)], i, args)
+                for i in range(args.sessions)
+            ]
+            for future in futures:
+                future.result()
+        wall = time.perf_counter() - started
+    finally:
+        recorder.stop()
+        stop_workers()
+        stop_server()
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    result = summarise(recorder, wall)
+    result["run"] = {"id": uuid.uuid4().hex, **vars(args)}
+    print_report(result)
+
+    if args.json:
+        with open(args.json, "w") as fh:
+            json.dump(result, fh, indent=2)
+    if args.baseline:
+        with open(args.baseline) as fh:
+            regressions = compare(result, json.load(fh), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
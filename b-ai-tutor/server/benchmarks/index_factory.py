@@ -0,0 +1,132 @@
+"""
+Recall-vs-size benchmark of compressed FAISS indexes against the flat one.
+
+Loads the vectors of every stored index under ``faiss_store`` (legacy
+session directories and shared ``docs/<fingerprint>`` indexes), groups them
+by dimension into one corpus, and for each configuration reports:
+
+  - bytes per vector and total serialised size, relative to Flat,
+  - recall@k of the configuration's top-k against the exact flat top-k.
+
+Queries are stored chunk vectors with Gaussian noise added (questions land
+near, not on, the chunks).  Reduced dimensions truncate the vectors and
+re-normalise them, which is what EMBED_OUTPUT_DIMENSIONALITY does for
+gemini-embedding-001 (Matryoshka embeddings).
+
+Usage (from b-ai-tutor/server)::
+
+    python benchmarks/index_factory.py
+    python benchmarks/index_factory.py --factories Flat SQ8 PQ64 IVF64,SQ8 --dims 0 768
+    python benchmarks/index_factory.py --synthetic 20000   # no stored sessions needed
+"""
+
+import argparse
+import os
+import sys
+from typing import Dict, List
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from index_store import INDEX_FILE, build_factory_index  # noqa: E402
+
+
+def load_stored_vectors(root: str) -> Dict[int, np.ndarray]:
+    """Return {dimension: stacked vectors} of every index under ``root``."""
+    corpora: Dict[int, List[np.ndarray]] = {}
+    for dirpath, _, filenames in os.walk(root):
+        if INDEX_FILE not in filenames or ".tmp-" in dirpath or ".deleting-" in dirpath:
+            continue
+        index = faiss.read_index(os.path.join(dirpath, INDEX_FILE))
+        if index.ntotal == 0:
+            continue
+        corpora.setdefault(index.d, []).append(index.reconstruct_n(0, index.ntotal))
+    return {d: np.vstack(parts) for d, parts in corpora.items()}
+
+
+def synthetic_vectors(n: int, d: int, seed: int = 0) -> np.ndarray:
+    """Clustered unit vectors, roughly shaped like chunk embeddings of a few documents."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(1, n // 200), d))
+    vectors = centers[rng.integers(len(centers), size=n)] + 0.6 * rng.normal(size=(n, d))
+    return _normalised(vectors.astype(np.float32))
+
+
+def _normalised(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def make_queries(vectors: np.ndarray, count: int, noise: float, seed: int = 1) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    picks = vectors[rng.integers(len(vectors), size=count)]
+    return _normalised(picks + noise * rng.normal(size=picks.shape).astype(np.float32))
+
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    k = truth.shape[1]
+    hits = sum(len(set(f) & set(t)) for f, t in zip(found.tolist(), truth.tolist()))
+    return hits / (len(truth) * k)
+
+
+def run(vectors: np.ndarray, factories: List[str], dims: List[int], k: int, queries: int, noise: float) -> None:
+    vectors = _normalised(vectors)
+    full_queries = make_queries(vectors, queries, noise)
+    flat = faiss.IndexFlatL2(vectors.shape[1])
+    flat.add(vectors)
+    _, truth = flat.search(full_queries, k)
+    flat_bytes = len(faiss.serialize_index(flat))
+
+    print(f"\n{len(vectors)} vectors, d={vectors.shape[1]}, k={k}, {queries} queries")
+    print(f"{'factory':<14}{'dims':>6}{'bytes/vec':>11}{'size':>12}{'vs flat':>9}{'recall@k':>10}")
+    for dim in dims:
+        dim = dim or vectors.shape[1]
+        if dim > vectors.shape[1]:
+            continue
+        base = faiss.IndexFlatL2(dim)
+        base.add(_normalised(vectors[:, :dim]))
+        q = _normalised(full_queries[:, :dim])
+        for factory in factories:
+            try:
+                index = base if factory == "Flat" else build_factory_index(base, factory)
+            except RuntimeError as exc:
+                reason = str(exc).rsplit("failed: ", 1)[-1][:70]
+                print(f"{factory:<14}{dim:>6}  n/a ({reason})")
+                continue
+            size = len(faiss.serialize_index(index))
+            _, found = index.search(q, k)
+            print(
+                f"{factory:<14}{dim:>6}{size / len(vectors):>11.0f}{size:>12,}"
+                f"{size / flat_bytes:>9.2f}{recall_at_k(found, truth):>10.3f}"
+            )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--root", default="faiss_store", help="directory holding stored indexes")
+    parser.add_argument("--factories", nargs="+", default=["Flat", "SQ8", "SQ4", "PQ32", "IVF16,SQ8"])
+    parser.add_argument("--dims", nargs="+", type=int, default=[0, 1536, 768],
+                        help="embedding sizes to test (0 = native)")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--noise", type=float, default=0.05, help="query noise per component")
+    parser.add_argument("--synthetic", type=int, default=0,
+                        help="benchmark N synthetic 3072-d vectors instead of stored indexes")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        corpora = {3072: synthetic_vectors(args.synthetic, 3072)}
+    else:
+        corpora = load_stored_vectors(args.root)
+        if not corpora:
+            sys.exit(f"No stored indexes under '{args.root}' – try --synthetic 20000.")
+
+    for vectors in corpora.values():
+        run(vectors, args.factories, args.dims, args.k, args.queries, args.noise)
+
+
+if __name__ == "__main__":
+    main()
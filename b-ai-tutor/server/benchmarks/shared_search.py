@@ -0,0 +1,135 @@
+"""
+Search throughput of the shared index (shared_index.py) against one flat
+index per document.
+
+Builds ``--documents`` synthetic documents of ``--chunks`` unit vectors
+each, then answers the same retrievals – ``--sessions`` sessions per
+document asking one question each, interleaved the way concurrent sessions
+ask them – three ways:
+
+  per-document  one ``IndexFlatL2.search`` per question on its document's index
+  shared        one SharedIndex.search() per question
+  batched       one SharedIndex.search_batch() call for all the questions
+
+and twice more from ``--threads`` threads, the way concurrent requests
+search: per-document, and through DocumentSlice.search, whose searches
+the SearchBatcher gathers into search_batch() calls (waiting up to
+``--batch-wait-ms``).
+
+It also times adding every document to the shared index and removing them
+again, and checks that every way returns the same neighbours.
+
+Usage (from b-ai-tutor/server)::
+
+    python benchmarks/shared_search.py
+    python benchmarks/shared_search.py --documents 2000 --chunks 40 --sessions 4 --dim 768
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared_index import SharedIndex  # noqa: E402
+
+
+def _normalised(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def make_documents(count: int, chunks: int, d: int, seed: int = 0) -> List[faiss.Index]:
+    rng = np.random.default_rng(seed)
+    documents = []
+    for _ in range(count):
+        index = faiss.IndexFlatL2(d)
+        index.add(_normalised(rng.normal(size=(chunks, d))))
+        documents.append(index)
+    return documents
+
+
+def _concurrently(threads: int, searches: List[Callable[[], np.ndarray]]) -> tuple:
+    """Run ``searches`` from ``threads`` threads; return (seconds, results in order)."""
+    with ThreadPoolExecutor(threads) as pool:
+        started = time.perf_counter()
+        results = list(pool.map(lambda search: search(), searches))
+        return time.perf_counter() - started, results
+
+
+def run(
+    documents: int, chunks: int, sessions: int, d: int, k: int, shards: int, threads: int, batch_wait_ms: float
+) -> None:
+    sources = make_documents(documents, chunks, d)
+    rng = np.random.default_rng(1)
+    queries = [_normalised(rng.normal(size=(1, d))) for _ in range(documents * sessions)]
+    owners = [i // sessions for i in range(len(queries))]
+    rng.shuffle(owners)
+
+    shared = SharedIndex(shards, batch_wait_ms / 1000)
+    started = time.perf_counter()
+    slices = [shared.add(source) for source in sources]
+    add_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    expected = [sources[o].search(q, k)[1] for q, o in zip(queries, owners)]
+    per_document = time.perf_counter() - started
+
+    started = time.perf_counter()
+    single = [shared.search(slices[o], q, k)[1] for q, o in zip(queries, owners)]
+    one_by_one = time.perf_counter() - started
+
+    started = time.perf_counter()
+    batched = [positions for _, positions in shared.search_batch([(slices[o], q, k) for q, o in zip(queries, owners)])]
+    batch_seconds = time.perf_counter() - started
+
+    calls = shared.stats()["search_calls"]
+    threaded, _ = _concurrently(threads, [lambda q=q, o=o: sources[o].search(q, k)[1] for q, o in zip(queries, owners)])
+    micro_batched, gathered = _concurrently(
+        threads, [lambda q=q, o=o: slices[o].search(q, k)[1] for q, o in zip(queries, owners)]
+    )
+    gathered_calls = shared.stats()["search_calls"] - calls
+
+    agree = all((a == b).all() and (a == c).all() and (a == e).all() for a, b, c, e in zip(expected, single, batched, gathered))
+
+    started = time.perf_counter()
+    for document in slices:
+        shared.remove(document)
+    remove_seconds = time.perf_counter() - started
+
+    print(f"\n{documents} documents × {chunks} chunks, d={d}, k={k}, {len(queries)} questions, {shards} shards")
+    print(f"{'search':<14}{'total ms':>10}{'µs/question':>13}{'FAISS calls':>13}")
+    for name, seconds, calls in (
+        ("per-document", per_document, len(queries)),
+        ("shared", one_by_one, len(queries)),
+        ("batched", batch_seconds, documents),
+        (f"{threads} threads", threaded, len(queries)),
+        ("micro-batched", micro_batched, gathered_calls),
+    ):
+        print(f"{name:<14}{seconds * 1e3:>10.1f}{seconds / len(queries) * 1e6:>13.1f}{calls:>13}")
+    print(f"add {add_seconds * 1e3:.1f} ms, remove {remove_seconds * 1e3:.1f} ms, same neighbours: {agree}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--documents", type=int, default=500)
+    parser.add_argument("--chunks", type=int, default=40, help="vectors per document")
+    parser.add_argument("--sessions", type=int, default=4, help="questions per document")
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--k", type=int, default=12)
+    parser.add_argument("--shards", type=int, default=8)
+    parser.add_argument("--threads", type=int, default=16, help="concurrent searching threads")
+    parser.add_argument("--batch-wait-ms", type=float, default=2, help="SHARED_INDEX_BATCH_WAIT_MS of the micro-batched run")
+    args = parser.parse_args()
+    run(args.documents, args.chunks, args.sessions, args.dim, args.k, args.shards, args.threads, args.batch_wait_ms)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""
+Offline stand-ins for Gemini and a generated PDF corpus, used by the
+benchmarks.
+
+FakeEmbeddings and FakeChatModel are deterministic (same input, same
+output) and sleep for a configurable latency, so runs are reproducible and
+the timings still include realistic waits on the "API".  make_pdf() writes
+a minimal text PDF without any PDF library, so the corpus can be generated
+anywhere; its pages carry a running header, a page-number footer and bold
+section headings, like a textbook chapter.
+
+Typical usage::
+
+    embeddings = FakeEmbeddings(dimensions=768, latency=0.05)
+    llm = FakeChatModel(first_token_latency=0.3, token_latency=0.01)
+    paths = generate_corpus("/tmp/corpus", pages=[2, 10, 40])
+"""
+
+import asyncio
+import hashlib
+import os
+import random
+import time
+from typing import Any, AsyncIterator, Iterator, List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+_WORDS = (
+    "light energy plant cell membrane protein enzyme glucose oxygen carbon water "
+    "chlorophyll leaf root stem nucleus energy reaction molecule atom electron "
+    "gradient pump transport signal gene sequence structure function system"
+).split()
+
+
+def _seed(text: str) -> int:
+    return int(hashlib.sha256(text.encode("utf-8")).hexdigest()[:16], 16)
+
+
+# ---------------------------------------------------------------------------
+# Gemini stand-ins
+# ---------------------------------------------------------------------------
+
+
+class FakeEmbeddings(Embeddings):
+    """
+    Deterministic unit vectors derived from a hash of each text.
+
+    Every call sleeps ``latency`` seconds plus ``per_text_latency`` per
+    text, like a batched embedding request.
+    """
+
+    def __init__(self, dimensions: int = 768, latency: float = 0.0, per_text_latency: float = 0.0) -> None:
+        self.dimensions = dimensions
+        self.latency = latency
+        self.per_text_latency = per_text_latency
+
+    def _vector(self, text: str) -> List[float]:
+        vector = np.random.default_rng(_seed(text)).standard_normal(self.dimensions)
+        return (vector / np.linalg.norm(vector)).astype(np.float32).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        time.sleep(self.latency + self.per_text_latency * len(texts))
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        time.sleep(self.latency)
+        return self._vector(text)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        await asyncio.sleep(self.latency)
+        return self._vector(text)
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Chat model answering with ``sentences`` generated sentences.
+
+    The answer depends only on the prompt.  Streaming yields one word per
+    token after ``first_token_latency``, then ``token_latency`` per token;
+    invoke() sleeps for the whole stream.  Token usage is reported like
+    Gemini does, so the metrics callbacks see it.
+    """
+
+    first_token_latency: float = 0.0
+    token_latency: float = 0.0
+    sentences: int = 4
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-gemini"
+
+    def _answer(self, messages: List[BaseMessage]) -> List[str]:
+        prompt = "".join(str(m.content) for m in messages)
+        rng = random.Random(_seed(prompt))
+        words: List[str] = []
+        for _ in range(self.sentences):
+            sentence = [rng.choice(_WORDS) for _ in range(rng.randint(6, 14))]
+            sentence[0] = sentence[0].capitalize()
+            sentence[-1] += "."
+            words.extend(sentence)
+        return words
+
+    def _usage(self, messages: List[BaseMessage], words: List[str]) -> dict:
+        input_tokens = sum(len(str(m.content).split()) for m in messages)
+        return {"input_tokens": input_tokens, "output_tokens": len(words), "total_tokens": input_tokens + len(words)}
+
+    def _generate(self, messages: List[BaseMessage], stop: Any = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        words = self._answer(messages)
+        time.sleep(self.first_token_latency + self.token_latency * len(words))
+        message = AIMessage(content=" ".join(words), usage_metadata=self._usage(messages, words))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _chunks(self, messages: List[BaseMessage]) -> Iterator[ChatGenerationChunk]:
+        words = self._answer(messages)
+        for i, word in enumerate(words):
+            last = i == len(words) - 1
+            yield ChatGenerationChunk(message=AIMessageChunk(
+                content=word if i == 0 else " " + word,
+                usage_metadata=self._usage(messages, words) if last else None,
+            ))
+
+    def _stream(self, messages: List[BaseMessage], stop: Any = None, run_manager: Any = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.first_token_latency)
+        for i, chunk in enumerate(self._chunks(messages)):
+            if i:
+                time.sleep(self.token_latency)
+            yield chunk
+
+    async def _astream(self, messages: List[BaseMessage], stop: Any = None, run_manager: Any = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.first_token_latency)
+        for i, chunk in enumerate(self._chunks(messages)):
+            if i:
+                await asyncio.sleep(self.token_latency)
+            yield chunk
+
+
+# ---------------------------------------------------------------------------
+# PDF corpus
+# ---------------------------------------------------------------------------
+
+
+def _pdf_text(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def make_pdf(
+    path: str,
+    pages: int,
+    seed: int = 0,
+    lines_per_page: int = 45,
+    section_lines: int = 30,
+) -> None:
+    """
+    Write a text-only PDF of ``pages`` pages of pseudo-random sentences.
+
+    Every ``section_lines`` body lines a numbered 14 pt bold heading starts
+    a new section; each page has the running header "Study notes – chapter
+    <seed>" and a "Page <n>" footer.  Different seeds give different text
+    (and so different document fingerprints); the same seed always gives
+    the same bytes.
+    """
+    rng = random.Random(seed)
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>"]
+    kids = " ".join(f"{3 + 2 * i} 0 R" for i in range(pages))
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {pages} >>".encode())
+    font_id = 3 + 2 * pages
+    sections = 0
+    for i in range(pages):
+        lines = []
+        for line in range(lines_per_page):
+            if (i * lines_per_page + line) % section_lines == 0:
+                sections += 1
+                title = f"{seed}.{sections} " + " ".join(rng.choice(_WORDS) for _ in range(3)).capitalize()
+                lines.append(f"/F2 14 Tf 18 TL ({_pdf_text(title)}) ' /F1 10 Tf 12 TL")
+            words = [rng.choice(_WORDS) for _ in range(rng.randint(8, 13))]
+            lines.append(f"({_pdf_text(' '.join(words).capitalize())}.) '")
+        content = (
+            f"BT /F1 8 Tf 40 770 Td (Study notes \\226 chapter {seed}) Tj ET "
+            "BT /F1 10 Tf 40 750 Td 12 TL " + " ".join(lines) + " ET "
+            f"BT /F1 8 Tf 290 30 Td (Page {i + 1}) Tj ET"
+        )
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {4 + 2 * i} 0 R "
+            f"/Resources << /Font << /F1 {font_id} 0 R /F2 {font_id + 1} 0 R >> >> >>".encode()
+        )
+        objects.append(f"<< /Length {len(content)} >>\nstream\n{content}\nendstream".encode())
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n".encode() + body + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    for offset in offsets:
+        out += f"{offset:010d} 00000 n \n".encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF".encode()
+    with open(path, "wb") as fh:
+        fh.write(out)
+
+
+def generate_corpus(directory: str, pages: List[int]) -> List[str]:
+    """Write one PDF per entry of ``pages`` (its page count) and return their paths."""
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for seed, count in enumerate(pages):
+        path = os.path.join(directory, f"doc{seed:02d}-{count}p.pdf")
+        make_pdf(path, count, seed=seed)
+        paths.append(path)
+    return paths
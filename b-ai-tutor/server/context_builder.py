@@ -0,0 +1,161 @@
+"""
+Token-budgeted assembly of the RAG context from over-retrieved chunks.
+
+VectorStore retrieves RAG_CONTEXT_CANDIDATES chunks per question with
+their relevance scores (normalised to 0–1 within the ranking, see
+VectorStore.retrieve_scored()); build_context() then picks what goes into
+the prompt:
+
+  1. drop candidates scoring below RAG_CONTEXT_MIN_RELEVANCE of the best one
+  2. drop near-duplicates – chunks whose word-pair shingles (over
+     lexical_index.tokenize terms) overlap a kept chunk's by
+     RAG_CONTEXT_DUPLICATE_JACCARD or more, e.g. a paragraph repeated on
+     several pages or the same passage in two sections
+  3. order the rest by maximal marginal relevance (MMR): relevance minus
+     redundancy with the chunks already chosen, weighted by RAG_CONTEXT_MMR_LAMBDA
+  4. add chunks in that order while they fit RAG_CONTEXT_TOKEN_BUDGET
+     tokens, up to RAG_CONTEXT_MAX_CHUNKS; the first chunk is cut at a
+     sentence boundary if it alone exceeds the budget
+
+Tokens are estimated at four characters each, which is close enough for
+Gemini on English prose and costs nothing.  The size of every context built
+is recorded in the ai_tutor_rag_context_* metrics (see metrics.py).
+
+Typical usage::
+
+    candidates = vs.retrieve_scored(question, k=12)
+    docs, stats = build_context(candidates)
+    context = "\n\n".join(doc.page_content for doc in docs)
+"""
+
+import logging
+import os
+from typing import Any, Dict, FrozenSet, List, Tuple
+
+from langchain_core.documents import Document
+
+from lexical_index import tokenize
+from metrics import CONTEXT_CHUNKS_DROPPED, RAG_CONTEXT_CHUNKS, RAG_CONTEXT_TOKENS
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# Constants
+# ---------------------------------------------------------------------------
+
+# Candidates retrieved per question before selection
+CONTEXT_CANDIDATES = int(os.environ.get("RAG_CONTEXT_CANDIDATES", 12))
+# Most chunks / estimated tokens of context per prompt (the old fixed
+# five 1000-character chunks came to about 1250 tokens)
+_MAX_CHUNKS = int(os.environ.get("RAG_CONTEXT_MAX_CHUNKS", 5))
+_TOKEN_BUDGET = int(os.environ.get("RAG_CONTEXT_TOKEN_BUDGET", 1000))
+# Candidates below this fraction of the best relevance are dropped
+_MIN_RELEVANCE = float(os.environ.get("RAG_CONTEXT_MIN_RELEVANCE", 0.3))
+# Shingle Jaccard similarity at which a chunk counts as a duplicate
+_DUPLICATE_JACCARD = float(os.environ.get("RAG_CONTEXT_DUPLICATE_JACCARD", 0.8))
+# MMR trade-off: 1.0 ranks by relevance only, lower values favour diversity
+_MMR_LAMBDA = float(os.environ.get("RAG_CONTEXT_MMR_LAMBDA", 0.7))
+
+_CHARS_PER_TOKEN = 4
+# A chunk cut to fit the budget keeps at least this many tokens
+_MIN_CUT_TOKENS = 50
+
+
+def estimate_tokens(text: str) -> int:
+    """Return the approximate number of Gemini tokens in ``text``."""
+    return (len(text) + _CHARS_PER_TOKEN - 1) // _CHARS_PER_TOKEN
+
+
+def _shingles(text: str) -> FrozenSet[Tuple[str, ...]]:
+    """Return the set of consecutive term pairs of ``text`` (single terms for one-word texts)."""
+    terms = tokenize(text)
+    if len(terms) < 2:
+        return frozenset((t,) for t in terms)
+    return frozenset(zip(terms, terms[1:]))
+
+
+def _jaccard(a: FrozenSet[Any], b: FrozenSet[Any]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def _cut_to_budget(text: str, tokens: int) -> str:
+    """Return the longest prefix of ``text`` within ``tokens`` that ends a sentence, if any."""
+    prefix = text[: tokens * _CHARS_PER_TOKEN]
+    end = max(prefix.rfind(". "), prefix.rfind(".\n"), prefix.rfind("? "), prefix.rfind("! "))
+    return prefix[: end + 1] if end >= _MIN_CUT_TOKENS * _CHARS_PER_TOKEN else prefix
+
+
+# ---------------------------------------------------------------------------
+# Public API
+# ---------------------------------------------------------------------------
+
+
+def build_context(
+    candidates: List[Tuple[Document, float]],
+    token_budget: int = _TOKEN_BUDGET,
+    max_chunks: int = _MAX_CHUNKS,
+) -> Tuple[List[Document], Dict[str, Any]]:
+    """
+    Select the chunks to put in the prompt from ranked ``candidates``.
+
+    Args:
+        candidates:   (chunk, relevance) pairs, best first; relevance is
+                      in 0–1 with 1.0 for the best candidate.
+        token_budget: Estimated tokens of context allowed.
+        max_chunks:   Chunks allowed.
+
+    Returns:
+        (chunks, stats): the chosen chunks, most relevant first, and a dict
+        with "candidates", "chunks", "tokens" and the number "dropped" per
+        reason ("low_score", "duplicate", "budget", and "max_chunks" for
+        candidates left once ``max_chunks`` were chosen).
+    """
+    dropped = {"low_score": 0, "duplicate": 0, "budget": 0, "max_chunks": 0}
+    best = max((score for _, score in candidates), default=0.0)
+
+    # (doc, relevance, shingles) of the candidates that survive filtering
+    pool: List[Tuple[Document, float, FrozenSet[Tuple[str, ...]]]] = []
+    for doc, score in candidates:
+        if pool and score < _MIN_RELEVANCE * best:
+            dropped["low_score"] += 1
+            continue
+        shingles = _shingles(doc.page_content)
+        if any(_jaccard(shingles, kept) >= _DUPLICATE_JACCARD for _, _, kept in pool):
+            dropped["duplicate"] += 1
+            continue
+        pool.append((doc, score, shingles))
+
+    chosen: List[Document] = []
+    chosen_shingles: List[FrozenSet[Tuple[str, ...]]] = []
+    tokens = 0
+    while pool and len(chosen) < max_chunks:
+        # Maximal marginal relevance against what is already in the context
+        index = max(
+            range(len(pool)),
+            key=lambda i: _MMR_LAMBDA * pool[i][1]
+            - (1 - _MMR_LAMBDA) * max((_jaccard(pool[i][2], t) for t in chosen_shingles), default=0.0),
+        )
+        doc, _, shingles = pool.pop(index)
+        cost = estimate_tokens(doc.page_content)
+        if tokens + cost > token_budget:
+            if chosen:
+                dropped["budget"] += 1
+                continue
+            doc = Document(page_content=_cut_to_budget(doc.page_content, token_budget), metadata=doc.metadata)
+            cost = estimate_tokens(doc.page_content)
+        chosen.append(doc)
+        chosen_shingles.append(shingles)
+        tokens += cost
+    dropped["max_chunks"] += len(pool)
+
+    for reason, count in dropped.items():
+        if count:
+            CONTEXT_CHUNKS_DROPPED.labels(reason=reason).inc(count)
+    RAG_CONTEXT_CHUNKS.observe(len(chosen))
+    RAG_CONTEXT_TOKENS.observe(tokens)
+
+    stats = {"candidates": len(candidates), "chunks": len(chosen), "tokens": tokens, "dropped": dropped}
+    logger.debug("build_context: %s.", stats)
+    return chosen, stats
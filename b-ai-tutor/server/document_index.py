@@ -0,0 +1,453 @@
+"""
+Shared, reference-counted FAISS indexes – one per unique document.
+
+Uploads of the same course material produce the same extracted text, so
+instead of building ``faiss_store/<session_id>`` for every session the index
+is stored once under ``faiss_store/docs/<fingerprint>`` and each session's
+Redis meta points at it through ``store_path``.
+
+The fingerprint covers everything that determines the index contents: the
+(capped) extracted text, the text splitter configuration and the embedding
+model.
+
+References are tracked in a Redis sorted set per document
+(``doc:<fingerprint>:refs``) whose members are session ids scored by their
+expiry time, so a reference disappears on its own when the session's TTL
+runs out.  ``collect_unreferenced_indexes`` deletes directories that have no
+live reference left, as well as legacy ``faiss_store/<session_id>``
+directories whose session expired and leftovers of interrupted saves.  An
+IndexSweeper thread runs it periodically; the ingest worker pool starts one.
+
+Because the text is streamed into the index builder, its fingerprint is
+only known once the build finishes.  ``doc:pdf:<digest>`` aliases map the
+raw bytes of an uploaded PDF to that fingerprint, so a byte-identical
+re-upload skips extraction and embedding entirely.
+
+Typical usage::
+
+    fp = document_fingerprint(text, VectorStore.index_config())
+    add_document_reference(redis_client, fp, session_id, ttl=3600)
+    store_path = shared_store_path(fp)
+    IndexSweeper().start()
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Tuple
+
+from api_common import validate_session_id
+from index_cache import get_index_cache
+from sessions import create_redis_client, index_claim_key, index_lease_key, meta_key
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# Constants
+# ---------------------------------------------------------------------------
+
+INDEX_ROOT = "faiss_store"
+SHARED_INDEX_ROOT = os.path.join(INDEX_ROOT, "docs")
+
+# A directory is never collected within this many seconds of its last
+# modification, which covers the window between a build and the first
+# reference landing in Redis.
+_GC_GRACE_SECONDS = int(os.environ.get("DOC_INDEX_GC_GRACE_SECONDS", 600))
+# PDF-bytes → fingerprint aliases outlive sessions; a stale alias whose
+# index was collected just falls back to a normal build.
+_PDF_ALIAS_TTL = 7 * 24 * 3600
+
+# Minimum interval between two collection passes across all workers
+_GC_INTERVAL_SECONDS = int(os.environ.get("DOC_INDEX_GC_INTERVAL_SECONDS", 600))
+_GC_LOCK_KEY = "doc:gc:lock"
+# How often an IndexSweeper tries to take that lock
+_SWEEP_POLL_SECONDS = min(60, _GC_INTERVAL_SECONDS)
+# Cluster-wide GC counters (gc_stats())
+_GC_STATS_KEY = "doc:gc:stats"
+
+# Above this many bytes of index directories, indexes nothing uses are
+# evicted oldest first regardless of the grace period (0 = no limit)
+_DISK_HIGH_WATER_BYTES = int(os.environ.get("DOC_INDEX_DISK_HIGH_WATER_BYTES", 0))
+# An eviction pass frees space down to this fraction of the mark
+_EVICT_TARGET_RATIO = 0.9
+
+# Upper bound on one directory deletion; the claim expires after it even if
+# the collecting process dies
+_GC_CLAIM_TTL = 60
+_GC_CLAIM_POLL_SECONDS = 0.2
+
+# KEYS: index leases, GC claim, owner (doc refs zset or session meta hash).
+# ARGV: now, claim TTL, owner kind ("refs" or "session").
+# Sets the claim and returns 1 only when no lease, reference or session is
+# live, so an index cannot be claimed between a check and the deletion.
+_CLAIM_INDEX_LUA = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+if redis.call('ZCARD', KEYS[1]) > 0 then
+  return 0
+end
+if ARGV[3] == 'refs' then
+  redis.call('ZREMRANGEBYSCORE', KEYS[3], '-inf', ARGV[1])
+  if redis.call('ZCARD', KEYS[3]) > 0 then
+    return 0
+  end
+elseif redis.call('EXISTS', KEYS[3]) == 1 then
+  return 0
+end
+if redis.call('SET', KEYS[2], '1', 'NX', 'EX', ARGV[2]) then
+  return 1
+end
+return 0
+"""
+
+
+def _refs_key(fingerprint: str) -> str:
+    return f"doc:{fingerprint}:refs"
+
+
+def _pdf_alias_key(digest: str) -> str:
+    return f"doc:pdf:{digest}"
+
+
+# ---------------------------------------------------------------------------
+# Fingerprints and paths
+# ---------------------------------------------------------------------------
+
+
+def fingerprint_hasher(index_config: Dict[str, Any]) -> Any:
+    """
+    Return a SHA-256 object primed with ``index_config``.
+
+    Feed it the document text (in any number of ``update`` calls) and take
+    ``hexdigest()`` to get the same value as document_fingerprint().
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps(index_config, sort_keys=True).encode("utf-8"))
+    digest.update(b"\0")
+    return digest
+
+
+def document_fingerprint(text: str, index_config: Dict[str, Any]) -> str:
+    """
+    Return a hex SHA-256 identifying the index that ``text`` would produce.
+
+    Args:
+        text:         Extracted document text (after any length cap).
+        index_config: Splitter / embedding settings, see
+                      VectorStore.index_config().
+    """
+    digest = fingerprint_hasher(index_config)
+    digest.update(text.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def pdf_digest(pdf_path: str, settings: Dict[str, Any]) -> str:
+    """
+    Return a hex SHA-256 of a PDF file's bytes and the ingest ``settings``.
+
+    ``settings`` must include everything besides the bytes that affects the
+    resulting fingerprint (index config, text length cap).
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps(settings, sort_keys=True).encode("utf-8"))
+    digest.update(b"\0")
+    with open(pdf_path, "rb") as fh:
+        for block in iter(lambda: fh.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def shared_store_path(fingerprint: str) -> str:
+    """Return the index directory shared by every session on this document."""
+    return os.path.join(SHARED_INDEX_ROOT, fingerprint)
+
+
+def lookup_pdf_alias(redis_client: Any, digest: str) -> str | None:
+    """Return the fingerprint previously built from this PDF, if recorded."""
+    return redis_client.get(_pdf_alias_key(digest))
+
+
+def record_pdf_alias(redis_client: Any, digest: str, fingerprint: str) -> None:
+    """Remember that the PDF with ``digest`` produced ``fingerprint``."""
+    redis_client.set(_pdf_alias_key(digest), fingerprint, ex=_PDF_ALIAS_TTL)
+
+
+# ---------------------------------------------------------------------------
+# Reference counting
+# ---------------------------------------------------------------------------
+
+
+def add_document_reference(redis_client: Any, fingerprint: str, session_id: str, ttl: int) -> None:
+    """
+    Record that ``session_id`` uses the document index for ``ttl`` seconds.
+
+    Must be called before the index is built so a concurrent collection pass
+    cannot see the fresh directory as unreferenced.
+    """
+    key = _refs_key(fingerprint)
+    pipe = redis_client.pipeline()
+    pipe.zadd(key, {session_id: time.time() + ttl})
+    # The set itself outlives its newest member by one TTL at most
+    pipe.expire(key, ttl)
+    pipe.execute()
+
+
+def index_being_collected(redis_client: Any, fingerprint: str) -> bool:
+    """Return True while the garbage collector is deleting the index ``fingerprint``."""
+    return bool(redis_client.exists(index_claim_key(fingerprint)))
+
+
+def wait_for_collection(redis_client: Any, fingerprint: str) -> None:
+    """Block until a running deletion of the index ``fingerprint`` has finished."""
+    deadline = time.monotonic() + _GC_CLAIM_TTL
+    while index_being_collected(redis_client, fingerprint) and time.monotonic() < deadline:
+        time.sleep(_GC_CLAIM_POLL_SECONDS)
+
+
+# ---------------------------------------------------------------------------
+# Garbage collection
+# ---------------------------------------------------------------------------
+
+
+def remove_index_dir(path: str) -> int:
+    """
+    Delete an index directory and drop it from the in-process index cache.
+
+    The directory is first renamed aside so concurrent readers see either
+    the complete index or nothing.
+
+    Returns:
+        Number of bytes reclaimed.
+    """
+    reclaimed = _dir_size(path)
+    trash = f"{path}.deleting-{uuid.uuid4().hex}"
+    try:
+        os.rename(path, trash)
+    except FileNotFoundError:
+        return 0
+    shutil.rmtree(trash, ignore_errors=True)
+    get_index_cache().invalidate(path)
+    return reclaimed
+
+
+def _dir_size(path: str) -> int:
+    size = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                size += os.path.getsize(os.path.join(dirpath, name))
+            except OSError:
+                pass
+    return size
+
+
+def _claim_for_collection(redis_client: Any, entry: "_IndexDir") -> bool:
+    """Atomically check that nothing uses ``entry`` and mark it as being deleted."""
+    if entry.session_id:
+        owner, owner_kind = meta_key(entry.session_id), "session"
+    else:
+        owner, owner_kind = _refs_key(entry.name), "refs"
+    script = redis_client.register_script(_CLAIM_INDEX_LUA)
+    return bool(script(
+        keys=[index_lease_key(entry.name), index_claim_key(entry.name), owner],
+        args=[time.time(), _GC_CLAIM_TTL, owner_kind],
+    ))
+
+
+class _IndexDir:
+    """An index directory found by a collection pass."""
+
+    def __init__(self, entry: os.DirEntry, session_id: str | None = None) -> None:
+        self.path = entry.path
+        self.name = entry.name
+        # Set for legacy faiss_store/<session_id> directories
+        self.session_id = session_id
+        self.mtime = entry.stat().st_mtime
+        self.size = _dir_size(entry.path)
+
+
+def _scan_index_dirs(root: str) -> Tuple[List[_IndexDir], List[_IndexDir]]:
+    """
+    Return (index directories, leftover temporary directories) under ``root``.
+
+    Both the shared ``docs/<fingerprint>`` indexes and legacy
+    ``<session_id>`` directories are listed; ``.tmp-`` / ``.deleting-``
+    siblings are leftovers of interrupted saves and deletions.
+    """
+    indexes: List[_IndexDir] = []
+    leftovers: List[_IndexDir] = []
+    for parent in (root, os.path.join(root, os.path.basename(SHARED_INDEX_ROOT))):
+        if not os.path.isdir(parent):
+            continue
+        shared = parent != root
+        with os.scandir(parent) as it:
+            for entry in it:
+                if not entry.is_dir():
+                    continue
+                try:
+                    if ".tmp-" in entry.name or ".deleting-" in entry.name:
+                        leftovers.append(_IndexDir(entry))
+                    elif shared:
+                        indexes.append(_IndexDir(entry))
+                    elif validate_session_id(entry.name):
+                        indexes.append(_IndexDir(entry, session_id=entry.name))
+                except OSError:
+                    # Removed by a concurrent pass or save while scanning
+                    continue
+    return indexes, leftovers
+
+
+def collect_unreferenced_indexes(redis_client: Any, root: str = INDEX_ROOT) -> Dict[str, int]:
+    """
+    Delete index directories that no live session uses.
+
+    A shared index is collectable once its reference set is empty, a legacy
+    ``faiss_store/<session_id>`` directory once its session meta expired.
+    Either is kept while an admitted question holds a lease on it (see
+    sessions.admit_question) and for _GC_GRACE_SECONDS after it was written.
+    Leftover ``.tmp-`` / ``.deleting-`` directories are removed after the
+    same grace period.
+
+    When the directories total more than DOC_INDEX_DISK_HIGH_WATER_BYTES,
+    the grace period is waived for indexes (oldest first) until usage is
+    back under _EVICT_TARGET_RATIO of the mark.  Indexes still in use are
+    never evicted.
+
+    Returns:
+        {"scanned": <dirs>, "removed": <dirs>, "bytes_reclaimed": <int>,
+        "disk_bytes": <bytes left under root>}
+    """
+    indexes, leftovers = _scan_index_dirs(root)
+    disk_bytes = sum(d.size for d in indexes) + sum(d.size for d in leftovers)
+    result = {"scanned": len(indexes), "removed": 0, "bytes_reclaimed": 0, "disk_bytes": disk_bytes}
+
+    now = time.time()
+    for leftover in leftovers:
+        if ".deleting-" in leftover.name or now - leftover.mtime >= _GC_GRACE_SECONDS:
+            shutil.rmtree(leftover.path, ignore_errors=True)
+            result["bytes_reclaimed"] += leftover.size
+            logger.info("collect_unreferenced_indexes: removed leftover '%s'.", leftover.path)
+
+    over_high_water = _DISK_HIGH_WATER_BYTES > 0 and disk_bytes > _DISK_HIGH_WATER_BYTES
+    if over_high_water:
+        logger.warning(
+            "Index directories use %d bytes, above the %d-byte high-water mark.",
+            disk_bytes,
+            _DISK_HIGH_WATER_BYTES,
+        )
+    target = int(_DISK_HIGH_WATER_BYTES * _EVICT_TARGET_RATIO)
+
+    for entry in sorted(indexes, key=lambda d: d.mtime):
+        usage = disk_bytes - result["bytes_reclaimed"]
+        evicting = over_high_water and usage > target
+        if now - entry.mtime < _GC_GRACE_SECONDS and not evicting:
+            continue
+        try:
+            if not _claim_for_collection(redis_client, entry):
+                continue
+            try:
+                result["bytes_reclaimed"] += remove_index_dir(entry.path)
+            finally:
+                redis_client.delete(index_claim_key(entry.name))
+            result["removed"] += 1
+            logger.info("collect_unreferenced_indexes: removed '%s'.", entry.path)
+        except Exception as exc:
+            logger.warning("collect_unreferenced_indexes: skipping '%s': %s", entry.path, exc)
+
+    result["disk_bytes"] -= result["bytes_reclaimed"]
+    if over_high_water and result["disk_bytes"] > _DISK_HIGH_WATER_BYTES:
+        logger.warning(
+            "Index directories still use %d bytes after GC – every remaining index is in use.",
+            result["disk_bytes"],
+        )
+    return result
+
+
+def maybe_collect_unreferenced_indexes(redis_client: Any) -> Dict[str, int] | None:
+    """
+    Run collect_unreferenced_indexes() at most once per interval across workers.
+
+    Totals are accumulated in the ``doc:gc:stats`` hash (see gc_stats()).
+
+    Returns:
+        The collection result, or None when another pass ran recently.
+    """
+    if not redis_client.set(_GC_LOCK_KEY, "1", nx=True, ex=_GC_INTERVAL_SECONDS):
+        return None
+
+    started = time.monotonic()
+    result = collect_unreferenced_indexes(redis_client)
+    duration = time.monotonic() - started
+
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.hincrby(_GC_STATS_KEY, "passes", 1)
+    pipe.hincrby(_GC_STATS_KEY, "removed", result["removed"])
+    pipe.hincrby(_GC_STATS_KEY, "bytes_reclaimed", result["bytes_reclaimed"])
+    pipe.hset(_GC_STATS_KEY, mapping={
+        "disk_bytes": result["disk_bytes"],
+        "last_pass_at": time.time(),
+        "last_pass_seconds": round(duration, 3),
+    })
+    pipe.execute()
+
+    logger.info(
+        "Document index GC: scanned %d, removed %d, reclaimed %d bytes in %.2fs (%d bytes in use).",
+        result["scanned"],
+        result["removed"],
+        result["bytes_reclaimed"],
+        duration,
+        result["disk_bytes"],
+    )
+    return result
+
+
+def gc_stats(redis_client: Any) -> Dict[str, float]:
+    """
+    Return the cluster-wide GC totals.
+
+    Returns:
+        {"passes", "removed", "bytes_reclaimed"} totals and the last pass's
+        {"disk_bytes", "last_pass_at", "last_pass_seconds"}; all 0 before
+        the first pass.
+    """
+    raw = redis_client.hgetall(_GC_STATS_KEY)
+    fields = ("passes", "removed", "bytes_reclaimed", "disk_bytes", "last_pass_at", "last_pass_seconds")
+    return {name: float(raw.get(name, 0)) for name in fields}
+
+
+class IndexSweeper:
+    """
+    Background thread that runs maybe_collect_unreferenced_indexes() periodically.
+
+    Every process that starts one takes part; the Redis lock in
+    maybe_collect_unreferenced_indexes() keeps it to one pass per interval
+    across all of them.
+    """
+
+    def __init__(self, interval: float = _SWEEP_POLL_SECONDS) -> None:
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="index-sweeper", daemon=True)
+
+    def start(self) -> "IndexSweeper":
+        self._thread.start()
+        logger.info("Index sweeper started (every %ds).", self.interval)
+        return self
+
+    def stop(self, timeout: float | None = None) -> None:
+        self._stop.set()
+        self._thread.join(timeout)
+
+    def _run(self) -> None:
+        redis_client = create_redis_client()
+        while True:
+            try:
+                maybe_collect_unreferenced_indexes(redis_client)
+            except Exception as exc:
+                logger.warning("Index sweeper: pass failed – %s", exc)
+            if self._stop.wait(self.interval):
+                return
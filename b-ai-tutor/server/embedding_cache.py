@@ -0,0 +1,335 @@
+"""
+Persistent, content-addressed cache of chunk embeddings.
+
+Classes share course material, so the same textbook PDF is uploaded by
+many students and produces the same chunks every time.  Each chunk vector
+is stored in a local SQLite database keyed by SHA-256 of the embedding model
+name and the chunk text; the cache is consulted before any Gemini embedding
+call and populated afterwards, so re-uploading a known document makes zero
+embedding calls.
+
+SQLite is used because it is safe across threads and worker processes that
+share the ``faiss_store`` volume, needs no extra service, and keeps vectors
+as compact float32 blobs.  Triggers keep a running total of the stored
+vector bytes in the transaction that changes them, so checking the budget
+reads one row; when it grows beyond ``max_bytes`` the least recently used
+vectors are evicted in batches.
+
+Typical usage::
+
+    cache = get_embedding_cache()
+    embeddings = CachedEmbeddings(gemini_embeddings, "gemini-embedding-001", cache)
+    FAISS.from_documents(docs, embeddings)
+"""
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from metrics import record_cache_lookup
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# Constants
+# ---------------------------------------------------------------------------
+
+# Lives on the persisted faiss_store volume next to the indexes
+_DEFAULT_PATH = os.path.join("faiss_store", "embedding_cache.sqlite3")
+_DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+# After an eviction pass the cache is trimmed to this fraction of max_bytes
+_EVICT_TARGET_RATIO = 0.9
+# SQLite limits the number of bound parameters per statement
+_SQL_BATCH = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    key         TEXT PRIMARY KEY,
+    model       TEXT NOT NULL,
+    vector      BLOB NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS embeddings_last_access ON embeddings (last_access);
+
+-- Running totals of the embeddings table (a single row, id 0)
+CREATE TABLE IF NOT EXISTS embeddings_size (
+    id      INTEGER PRIMARY KEY CHECK (id = 0),
+    entries INTEGER NOT NULL,
+    bytes   INTEGER NOT NULL
+);
+CREATE TRIGGER IF NOT EXISTS embeddings_size_insert AFTER INSERT ON embeddings BEGIN
+    UPDATE embeddings_size SET entries = entries + 1, bytes = bytes + LENGTH(new.vector);
+END;
+CREATE TRIGGER IF NOT EXISTS embeddings_size_update AFTER UPDATE OF vector ON embeddings BEGIN
+    UPDATE embeddings_size SET bytes = bytes + LENGTH(new.vector) - LENGTH(old.vector);
+END;
+CREATE TRIGGER IF NOT EXISTS embeddings_size_delete AFTER DELETE ON embeddings BEGIN
+    UPDATE embeddings_size SET entries = entries - 1, bytes = bytes - LENGTH(old.vector);
+END;
+-- Counts databases created before the totals once
+INSERT OR IGNORE INTO embeddings_size (id, entries, bytes)
+    SELECT 0, COUNT(*), COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings;
+"""
+
+
+def embedding_key(model: str, text: str) -> str:
+    """Return the cache key (hex SHA-256) for a chunk embedded with ``model``."""
+    digest = hashlib.sha256()
+    digest.update(model.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(text.encode("utf-8"))
+    return digest.hexdigest()
+
+
+# ---------------------------------------------------------------------------
+# EmbeddingCache class
+# ---------------------------------------------------------------------------
+
+
+class EmbeddingCache:
+    """
+    SQLite-backed embedding store with LRU eviction and hit/miss counters.
+
+    One connection is opened per thread; SQLite's own locking makes the file
+    safe to share between processes.
+    """
+
+    def __init__(self, path: str = _DEFAULT_PATH, max_bytes: int = _DEFAULT_MAX_BYTES) -> None:
+        """
+        Args:
+            path:      SQLite database file (parent directory is created).
+            max_bytes: Upper bound on stored vector bytes before LRU eviction.
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        parent = os.path.dirname(path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+
+    def get_many(self, model: str, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        """
+        Look up the embeddings of ``texts``.
+
+        Returns:
+            A list aligned with ``texts``; entries are None on a miss.
+        """
+        keys = [embedding_key(model, t) for t in texts]
+        found: Dict[str, List[float]] = {}
+
+        conn = self._connect()
+        for start in range(0, len(keys), _SQL_BATCH):
+            batch = keys[start:start + _SQL_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            rows = conn.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})",
+                batch,
+            ).fetchall()
+            for key, blob in rows:
+                found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+
+        if found:
+            # Refresh recency so popular documents are never evicted
+            now = time.time()
+            with conn:
+                conn.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE key = ?",
+                    [(now, key) for key in found],
+                )
+
+        vectors = [found.get(key) for key in keys]
+        hits = sum(1 for vec in vectors if vec is not None)
+        with self._stats_lock:
+            self.hits += hits
+            self.misses += len(keys) - hits
+        record_cache_lookup("embedding", hit=True, count=hits)
+        record_cache_lookup("embedding", hit=False, count=len(keys) - hits)
+
+        return vectors
+
+    def put_many(
+        self,
+        model: str,
+        texts: Sequence[str],
+        vectors: Sequence[Sequence[float]],
+    ) -> None:
+        """Store embeddings for ``texts`` and evict old entries if over budget."""
+        now = time.time()
+        rows = [
+            (embedding_key(model, text), model, np.asarray(vec, dtype=np.float32).tobytes(), now)
+            for text, vec in zip(texts, vectors)
+        ]
+        conn = self._connect()
+        with conn:
+            # An upsert, not INSERT OR REPLACE: replaced rows fire no delete trigger
+            conn.executemany(
+                "INSERT INTO embeddings (key, model, vector, last_access) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET "
+                "model = excluded.model, vector = excluded.vector, last_access = excluded.last_access",
+                rows,
+            )
+            (stored,) = conn.execute("SELECT bytes FROM embeddings_size").fetchone()
+        if stored > self.max_bytes:
+            self._evict(conn)
+
+    def stats(self) -> Dict[str, float]:
+        """Return hit/miss counters, hit rate and the bytes currently stored."""
+        entries, stored = self._connect().execute("SELECT entries, bytes FROM embeddings_size").fetchone()
+        with self._stats_lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": entries,
+                "bytes": stored,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+            }
+
+    # ------------------------------------------------------------------
+    # Internal helpers
+    # ------------------------------------------------------------------
+
+    def _connect(self) -> sqlite3.Connection:
+        """Return this thread's connection, opening it on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        """Delete least recently used vectors until under the eviction target."""
+        target = int(self.max_bytes * _EVICT_TARGET_RATIO)
+        evicted = 0
+        freed = 0
+        with conn:
+            while True:
+                entries, stored = conn.execute("SELECT entries, bytes FROM embeddings_size").fetchone()
+                if stored <= target or not entries:
+                    break
+                # Vectors of one model have one size; round up to free enough at once
+                average = stored / entries
+                count = min(entries, max(1, int(-(-(stored - target) // average))))
+                conn.execute(
+                    "DELETE FROM embeddings WHERE key IN "
+                    "(SELECT key FROM embeddings ORDER BY last_access LIMIT ?)",
+                    (count,),
+                )
+                evicted += count
+                freed += stored - conn.execute("SELECT bytes FROM embeddings_size").fetchone()[0]
+
+        with self._stats_lock:
+            self.evictions += evicted
+        logger.info(
+            "EmbeddingCache: evicted %d vector(s), freed %d bytes (LRU).", evicted, freed
+        )
+
+
+# ---------------------------------------------------------------------------
+# LangChain Embeddings wrapper
+# ---------------------------------------------------------------------------
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that serves document vectors from an EmbeddingCache.
+
+    Only chunks missing from the cache are sent to the wrapped model, in a
+    single embed_documents call.  ``api_calls`` counts how many such calls
+    were made, so callers can tell when a build was served entirely from
+    cache.
+    """
+
+    def __init__(self, inner: Embeddings, model: str, cache: EmbeddingCache) -> None:
+        """
+        Args:
+            inner: The real embeddings client.
+            model: Model identity used in the cache key (e.g. model name).
+            cache: Backing store.
+        """
+        self.inner = inner
+        self.model = model
+        self.cache = cache
+        self.api_calls = 0
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed documents, reusing cached vectors for previously seen chunks."""
+        vectors = self.cache.get_many(self.model, texts)
+        missing = [i for i, vec in enumerate(vectors) if vec is None]
+
+        logger.info(
+            "CachedEmbeddings[%s]: %d cached, %d to embed.",
+            self.model,
+            len(texts) - len(missing),
+            len(missing),
+        )
+
+        if missing:
+            fresh = self.inner.embed_documents([texts[i] for i in missing])
+            self.api_calls += 1
+            self.cache.put_many(self.model, [texts[i] for i in missing], fresh)
+            for i, vec in zip(missing, fresh):
+                vectors[i] = list(vec)
+
+        return vectors  # type: ignore[return-value]
+
+    def embed_query(self, text: str) -> List[float]:
+        """Query embeddings are not cached here; delegate to the wrapped model."""
+        return self.inner.embed_query(text)
+
+
+# ---------------------------------------------------------------------------
+# Process-wide singleton
+# ---------------------------------------------------------------------------
+
+_embedding_cache: EmbeddingCache | None = None
+_embedding_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> EmbeddingCache | None:
+    """
+    Return the process-wide EmbeddingCache, or None when disabled.
+
+    Configured through EMBEDDING_CACHE_ENABLED (default "1"),
+    EMBEDDING_CACHE_PATH and EMBEDDING_CACHE_MAX_BYTES.
+    """
+    global _embedding_cache
+    if os.environ.get("EMBEDDING_CACHE_ENABLED", "1") not in ("1", "true", "True"):
+        return None
+
+    if _embedding_cache is None:
+        with _embedding_cache_lock:
+            if _embedding_cache is None:
+                _embedding_cache = EmbeddingCache(
+                    path=os.environ.get("EMBEDDING_CACHE_PATH", _DEFAULT_PATH),
+                    max_bytes=int(os.environ.get("EMBEDDING_CACHE_MAX_BYTES", _DEFAULT_MAX_BYTES)),
+                )
+                logger.info(
+                    "EmbeddingCache configured at '%s' (max_bytes=%d).",
+                    _embedding_cache.path,
+                    _embedding_cache.max_bytes,
+                )
+    return _embedding_cache
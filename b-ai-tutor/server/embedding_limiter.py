@@ -0,0 +1,307 @@
+"""
+Rate limiting and retries for Gemini embedding calls.
+
+Index builds send chunk batches to the embedding API from several threads at
+once (see VectorStore.create_vector_store_from_pages).  To stay inside the
+API quota without a fixed sleep after every upload:
+
+  - a process-wide token bucket per model meters texts per minute, so
+    concurrent builds in the same process share one budget,
+  - a failed batch is retried on its own with exponential backoff (with
+    jitter); a 429 carrying a retry hint (``Retry-After`` header or the
+    ``retryDelay`` of a google.rpc.RetryInfo detail) is honoured and pauses
+    the bucket for every thread,
+  - errors that cannot succeed on retry (bad request, auth) are raised at
+    once, so the caller can switch to a fallback model.
+
+Typical usage::
+
+    embeddings = RateLimitedEmbeddings(gemini_embeddings, "gemini-embedding-001")
+    vectors = embeddings.embed_documents(batch)
+"""
+
+import logging
+import os
+import random
+import re
+import threading
+import time
+from typing import Any, Dict, Iterator, List
+
+import httpx
+from langchain_core.embeddings import Embeddings
+
+from metrics import GEMINI_CALLS, GEMINI_EMBEDDED_TEXTS, GEMINI_RETRIES, observe_stage
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# Constants
+# ---------------------------------------------------------------------------
+
+# Texts per minute allowed per embedding model in this process
+_RATE_PER_MINUTE = float(os.environ.get("EMBED_RATE_LIMIT_PER_MINUTE", 3000))
+# Burst size of the bucket (texts that may be sent back to back)
+_BURST = float(os.environ.get("EMBED_RATE_LIMIT_BURST", 500))
+
+# Retries per batch before the failure is treated as persistent
+_MAX_RETRIES = int(os.environ.get("EMBED_MAX_RETRIES", 5))
+_BACKOFF_BASE_SECONDS = 1.0
+_BACKOFF_MAX_SECONDS = 60.0
+
+# HTTP statuses worth retrying
+_RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+# retryDelay field of a google.rpc.RetryInfo error detail, e.g. "17s" / "1.5s"
+_RETRY_DELAY_RE = re.compile(r"retryDelay['\"]?\s*[:=]\s*['\"]?(\d+(?:\.\d+)?)s")
+
+
+# ---------------------------------------------------------------------------
+# Error classification
+# ---------------------------------------------------------------------------
+
+
+def _exception_chain(exc: BaseException) -> Iterator[BaseException]:
+    """Yield ``exc`` and every exception it was raised from."""
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        yield exc
+        exc = exc.__cause__ or exc.__context__
+
+
+def _status_code(exc: BaseException) -> int | None:
+    """Return the HTTP status behind an embedding error, if any."""
+    for err in _exception_chain(exc):
+        code = getattr(err, "code", None)
+        if isinstance(code, int):
+            return code
+        response = getattr(err, "response", None)
+        status = getattr(response, "status_code", None)
+        if isinstance(status, int):
+            return status
+    return None
+
+
+def retry_after_seconds(exc: BaseException) -> float | None:
+    """
+    Return the server's requested retry delay for a failed call, if it gave one.
+
+    Looks for a ``Retry-After`` header on the HTTP response and for the
+    ``retryDelay`` of a RetryInfo detail in the error payload.
+    """
+    for err in _exception_chain(exc):
+        headers = getattr(getattr(err, "response", None), "headers", None)
+        if headers:
+            value = headers.get("retry-after")
+            try:
+                if value is not None:
+                    return float(value)
+            except ValueError:
+                pass
+        match = _RETRY_DELAY_RE.search(str(getattr(err, "details", None) or err))
+        if match:
+            return float(match.group(1))
+    return None
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """Return True for throttling, server-side and transport errors."""
+    code = _status_code(exc)
+    if code is not None:
+        return code in _RETRYABLE_STATUS
+    return any(
+        isinstance(err, (httpx.TransportError, ConnectionError, TimeoutError))
+        for err in _exception_chain(exc)
+    )
+
+
+# ---------------------------------------------------------------------------
+# TokenBucket class
+# ---------------------------------------------------------------------------
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled continuously at ``rate_per_minute``.
+
+    ``pause`` empties the bucket and stops refills for a while, which is how
+    a 429 retry hint seen by one thread throttles all of them.
+    """
+
+    def __init__(self, rate_per_minute: float, burst: float) -> None:
+        """
+        Args:
+            rate_per_minute: Tokens added per minute.
+            burst:           Bucket capacity; requests larger than this are
+                             clamped so they can always be served.
+        """
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(1.0, burst)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+        self.waited_seconds = 0.0
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """
+        Block until ``tokens`` are available and take them.
+
+        Returns:
+            Seconds spent waiting.
+        """
+        tokens = min(tokens, self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self._paused_until and self._tokens >= tokens:
+                    self._tokens -= tokens
+                    self.waited_seconds += waited
+                    return waited
+                delay = max(self._paused_until - now, (tokens - self._tokens) / self.rate)
+            time.sleep(delay)
+            waited += delay
+
+    def pause(self, seconds: float) -> None:
+        """Drain the bucket and stop handing out tokens for ``seconds``."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens = 0.0
+            self._paused_until = max(self._paused_until, now + seconds)
+
+    def _refill(self, now: float) -> None:
+        """Add the tokens accrued since the last update (caller holds the lock)."""
+        start = max(self._updated, self._paused_until)
+        if now > start:
+            self._tokens = min(self.capacity, self._tokens + (now - start) * self.rate)
+        self._updated = now
+
+
+_buckets: Dict[str, TokenBucket] = {}
+_buckets_lock = threading.Lock()
+
+
+def get_token_bucket(model: str) -> TokenBucket:
+    """
+    Return the process-wide bucket for ``model``.
+
+    Sized by EMBED_RATE_LIMIT_PER_MINUTE and EMBED_RATE_LIMIT_BURST.
+    """
+    with _buckets_lock:
+        bucket = _buckets.get(model)
+        if bucket is None:
+            bucket = TokenBucket(_RATE_PER_MINUTE, _BURST)
+            _buckets[model] = bucket
+            logger.info(
+                "Embedding rate limit for '%s': %.0f texts/min (burst %.0f).",
+                model,
+                _RATE_PER_MINUTE,
+                bucket.capacity,
+            )
+    return bucket
+
+
+# ---------------------------------------------------------------------------
+# LangChain Embeddings wrapper
+# ---------------------------------------------------------------------------
+
+
+class RateLimitedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that meters calls and retries failed ones with backoff.
+
+    Every embed_documents call takes one token per text from the model's
+    bucket.  Retryable failures are retried up to ``max_retries`` times;
+    the last error is re-raised after that, or immediately for errors that
+    cannot succeed on retry.
+    """
+
+    def __init__(
+        self,
+        inner: Embeddings,
+        model: str,
+        bucket: TokenBucket | None = None,
+        max_retries: int = _MAX_RETRIES,
+    ) -> None:
+        """
+        Args:
+            inner:       The real embeddings client.
+            model:       Model name (selects the shared bucket).
+            bucket:      Bucket to use instead of get_token_bucket(model).
+            max_retries: Retries per call before giving up.
+        """
+        self.inner = inner
+        self.model = model
+        self.bucket = bucket or get_token_bucket(model)
+        self.max_retries = max_retries
+
+        self._stats_lock = threading.Lock()
+        self.calls = 0
+        self.retries = 0
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed a batch of texts within the rate limit, retrying on transient errors."""
+        return self._call(self.inner.embed_documents, texts, len(texts))
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embed a single query within the rate limit, retrying on transient errors."""
+        return self._call(self.inner.embed_query, text, 1)
+
+    def stats(self) -> Dict[str, float]:
+        """Return call / retry counters and the time spent waiting for tokens."""
+        with self._stats_lock:
+            return {
+                "calls": self.calls,
+                "retries": self.retries,
+                "throttled_seconds": round(self.bucket.waited_seconds, 3),
+            }
+
+    def _call(self, fn: Any, payload: Any, tokens: int) -> Any:
+        attempt = 0
+        while True:
+            self.bucket.acquire(tokens)
+            with self._stats_lock:
+                self.calls += 1
+            GEMINI_EMBEDDED_TEXTS.labels(model=self.model).inc(tokens)
+            started = time.perf_counter()
+            try:
+                result = fn(payload)
+            except Exception as exc:
+                GEMINI_CALLS.labels(kind="embed", model=self.model, outcome="error").inc()
+                if attempt >= self.max_retries or not is_retryable(exc):
+                    raise
+
+                hint = retry_after_seconds(exc)
+                if hint is not None:
+                    delay = min(hint, _BACKOFF_MAX_SECONDS)
+                else:
+                    backoff = min(_BACKOFF_MAX_SECONDS, _BACKOFF_BASE_SECONDS * 2 ** attempt)
+                    delay = random.uniform(backoff / 2, backoff)
+
+                attempt += 1
+                with self._stats_lock:
+                    self.retries += 1
+                GEMINI_RETRIES.labels(model=self.model).inc()
+                logger.warning(
+                    "Embedding call to '%s' failed (%s); retry %d/%d in %.1fs.",
+                    self.model,
+                    exc,
+                    attempt,
+                    self.max_retries,
+                    delay,
+                )
+                if hint is not None:
+                    # The server said when to come back – hold every thread;
+                    # the next acquire() waits out the pause.
+                    self.bucket.pause(delay)
+                else:
+                    time.sleep(delay)
+                continue
+
+            GEMINI_CALLS.labels(kind="embed", model=self.model, outcome="ok").inc()
+            observe_stage("embed_batch", time.perf_counter() - started)
+            return result
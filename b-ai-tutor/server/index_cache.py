@@ -0,0 +1,357 @@
+"""
+Process-wide LRU cache of loaded FAISS indexes.
+
+Every question against a session used to unpickle ``index.pkl`` and read
+``index.faiss`` from disk.  Students ask 10–20 questions per session, so the
+loaded ``FAISS`` object is kept in memory and reused until one of:
+
+  - it has not been used for ``ttl_seconds`` (by default the Redis session
+    expiry, sessions.SESSION_TTL, so an index never outlives its session by
+    much),
+  - the cache exceeds ``max_entries`` or ``max_bytes`` (least recently used
+    entries are evicted first),
+  - the files on disk change (size or mtime differ from when it was loaded).
+
+Entries are keyed by the absolute index directory path, which is
+``faiss_store/<session_id>`` for every session-scoped store.  An entry may
+carry an ``on_remove`` callback, run whenever it leaves the cache (the
+shared index backend uses it to drop the document's vectors, see
+shared_index.py).
+
+Typical usage::
+
+    cache = get_index_cache()
+    vs = cache.get(path)
+    if vs is None:
+        vs = load_index_dir(path, embeddings)   # see index_store.py
+        cache.put(path, vs)
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sessions import SESSION_TTL
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# Constants
+# ---------------------------------------------------------------------------
+
+# Defaults – each can be overridden through the environment.
+_DEFAULT_MAX_ENTRIES = 64
+_DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+# Idle entries go when their session's Redis keys expire
+_DEFAULT_TTL_SECONDS = SESSION_TTL
+
+# Signature of the on-disk files: ((name, size, mtime_ns), ...)
+_Signature = Tuple[Tuple[str, int, int], ...]
+# (key, on_remove callback) of an entry that left the cache
+_Removal = Tuple[str, Optional[Callable[[], None]]]
+
+
+def _disk_signature(path: str) -> Optional[_Signature]:
+    """
+    Return a cheap fingerprint of the files inside an index directory.
+
+    Only ``os.stat`` is used, so checking the signature costs a couple of
+    syscalls instead of a full read + unpickle.
+
+    Returns:
+        A tuple of (file name, size, mtime_ns) entries, or None if the
+        directory does not exist.
+    """
+    try:
+        entries = []
+        with os.scandir(path) as it:
+            for entry in it:
+                if entry.is_file():
+                    st = entry.stat()
+                    entries.append((entry.name, st.st_size, st.st_mtime_ns))
+        return tuple(sorted(entries))
+    except FileNotFoundError:
+        return None
+
+
+def _estimate_bytes(vectorstore: Any) -> int:
+    """
+    Approximate the resident size of a LangChain FAISS object.
+
+    Counts the raw vector storage (ntotal × code size, i.e. d × 4 bytes for
+    a flat float32 index), the length of every chunk text held in the
+    docstore and the attached BM25 index.
+    """
+    size = 0
+    index = getattr(vectorstore, "index", None)
+    if index is not None:
+        code_size = getattr(index, "code_size", int(index.d) * 4)
+        size += int(index.ntotal) * int(code_size)
+
+    docstore = getattr(vectorstore, "docstore", None)
+    for doc in getattr(docstore, "_dict", {}).values():
+        size += len(getattr(doc, "page_content", "") or "")
+
+    lexical = getattr(vectorstore, "lexical_index", None)
+    if lexical is not None:
+        size += lexical.nbytes
+
+    return size
+
+
+class _CacheEntry:
+    """A cached FAISS object plus the bookkeeping needed for eviction."""
+
+    __slots__ = ("vectorstore", "signature", "size", "last_access", "on_remove")
+
+    def __init__(
+        self,
+        vectorstore: Any,
+        signature: Optional[_Signature],
+        size: int,
+        on_remove: Optional[Callable[[], None]],
+    ) -> None:
+        self.vectorstore = vectorstore
+        self.signature = signature
+        self.size = size
+        self.last_access = time.monotonic()
+        self.on_remove = on_remove
+
+
+# ---------------------------------------------------------------------------
+# IndexCache class
+# ---------------------------------------------------------------------------
+
+
+class IndexCache:
+    """
+    Thread-safe, size- and memory-bounded LRU cache of loaded FAISS stores.
+
+    The cache never loads anything itself; callers ``get`` and, on a miss,
+    load the index and ``put`` it back.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = _DEFAULT_MAX_ENTRIES,
+        max_bytes: int = _DEFAULT_MAX_BYTES,
+        ttl_seconds: float = _DEFAULT_TTL_SECONDS,
+    ) -> None:
+        """
+        Args:
+            max_entries: Maximum number of indexes kept in memory.
+            max_bytes:   Upper bound on the estimated size of all entries.
+            ttl_seconds: Idle time after which an entry is dropped.
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+
+        self._entries: "OrderedDict[str, _CacheEntry]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+
+    def get(self, path: str) -> Any | None:
+        """
+        Return the cached FAISS store for ``path`` or None on a miss.
+
+        An entry that has expired, or whose files changed on disk since it
+        was cached, is dropped and reported as a miss.
+        """
+        key = os.path.abspath(path)
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expired = now - entry.last_access > self.ttl_seconds
+            if expired:
+                removed = [self._remove(key)]
+                self.expirations += 1
+                self.misses += 1
+        if expired:
+            logger.debug("IndexCache: '%s' expired.", key)
+            _run_on_remove(removed)
+            return None
+
+        # Stat outside the lock – it touches the filesystem.
+        signature = _disk_signature(key)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            if signature == entry.signature:
+                entry.last_access = now
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry.vectorstore
+
+            removed = [self._remove(key)]
+            self.invalidations += 1
+            self.misses += 1
+
+        logger.info("IndexCache: '%s' changed on disk – invalidated.", key)
+        _run_on_remove(removed)
+        return None
+
+    def put(self, path: str, vectorstore: Any, on_remove: Optional[Callable[[], None]] = None) -> None:
+        """
+        Cache a loaded (or freshly built and saved) FAISS store.
+
+        Must be called after the index has been written to ``path`` so the
+        recorded disk signature matches what a later ``load_index_dir`` would read.
+
+        Args:
+            on_remove: Called once when the entry is evicted, expires, is
+                       invalidated or replaced – or at once if the store
+                       is too large to be cached.
+        """
+        key = os.path.abspath(path)
+        signature = _disk_signature(key)
+        size = _estimate_bytes(vectorstore)
+
+        if size > self.max_bytes:
+            logger.warning(
+                "IndexCache: '%s' (%d bytes) exceeds the cache budget – not cached.",
+                key,
+                size,
+            )
+            _run_on_remove([(key, on_remove)])
+            return
+
+        removed = []
+        with self._lock:
+            if key in self._entries:
+                removed.append(self._remove(key))
+
+            self._entries[key] = _CacheEntry(vectorstore, signature, size, on_remove)
+            self._bytes += size
+            removed.extend(self._evict_to_fit())
+
+        logger.debug("IndexCache: cached '%s' (%d bytes).", key, size)
+        _run_on_remove(removed)
+
+    def invalidate(self, path: str) -> bool:
+        """
+        Drop the entry for ``path``.
+
+        Returns:
+            True if an entry was removed.
+        """
+        key = os.path.abspath(path)
+        with self._lock:
+            if key not in self._entries:
+                return False
+            removed = [self._remove(key)]
+            self.invalidations += 1
+        _run_on_remove(removed)
+        return True
+
+    def clear(self) -> None:
+        """Drop every entry (counters are kept)."""
+        with self._lock:
+            removed = [self._remove(key) for key in list(self._entries)]
+        _run_on_remove(removed)
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss/eviction counters and the current occupancy."""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+    # ------------------------------------------------------------------
+    # Internal helpers (caller must hold the lock, then pass the returned
+    # removals to _run_on_remove once it has released it)
+    # ------------------------------------------------------------------
+
+    def _remove(self, key: str) -> _Removal:
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+        return key, entry.on_remove
+
+    def _evict_to_fit(self) -> List[_Removal]:
+        """Evict expired entries, then least recently used ones, until within bounds."""
+        removed = []
+        now = time.monotonic()
+        for key in [k for k, e in self._entries.items() if now - e.last_access > self.ttl_seconds]:
+            removed.append(self._remove(key))
+            self.expirations += 1
+
+        while self._entries and (
+            len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+        ):
+            key, _ = next(iter(self._entries.items()))
+            removed.append(self._remove(key))
+            self.evictions += 1
+            logger.debug("IndexCache: evicted '%s' (LRU).", key)
+        return removed
+
+
+def _run_on_remove(removed: List[_Removal]) -> None:
+    """Run the callbacks of entries that left the cache, without holding its lock."""
+    for key, on_remove in removed:
+        if on_remove is None:
+            continue
+        try:
+            on_remove()
+        except Exception as exc:
+            logger.warning("IndexCache: removal callback for '%s' failed – %s", key, exc)
+
+
+# ---------------------------------------------------------------------------
+# Process-wide singleton
+# ---------------------------------------------------------------------------
+
+_index_cache: IndexCache | None = None
+_index_cache_lock = threading.Lock()
+
+
+def get_index_cache() -> IndexCache:
+    """
+    Return the process-wide IndexCache, creating it on first use.
+
+    Bounds are read from INDEX_CACHE_MAX_ENTRIES, INDEX_CACHE_MAX_BYTES and
+    INDEX_CACHE_TTL_SECONDS.
+    """
+    global _index_cache
+    if _index_cache is None:
+        with _index_cache_lock:
+            if _index_cache is None:
+                _index_cache = IndexCache(
+                    max_entries=int(os.environ.get("INDEX_CACHE_MAX_ENTRIES", _DEFAULT_MAX_ENTRIES)),
+                    max_bytes=int(os.environ.get("INDEX_CACHE_MAX_BYTES", _DEFAULT_MAX_BYTES)),
+                    ttl_seconds=float(os.environ.get("INDEX_CACHE_TTL_SECONDS", _DEFAULT_TTL_SECONDS)),
+                )
+                logger.info(
+                    "IndexCache configured (max_entries=%d, max_bytes=%d, ttl=%ss).",
+                    _index_cache.max_entries,
+                    _index_cache.max_bytes,
+                    _index_cache.ttl_seconds,
+                )
+    return _index_cache
@@ -0,0 +1,248 @@
+"""
+Compact on-disk format for FAISS indexes, loaded through memory mapping.
+
+FAISS.save_local writes ``index.faiss`` plus a pickled docstore
+(``index.pkl``); loading reads every vector into heap memory and unpickles
+every chunk in every web worker.  Indexes are now saved as:
+
+  index.faiss  – the FAISS index, read with IO_FLAG_MMAP_IFC so the vector
+                 codes stay in the OS page cache, shared by all processes
+  chunks.bin   – one UTF-8 JSON record ``[text, metadata]`` per vector,
+                 back to back in index order
+  chunks.idx   – ``.npy`` array of n + 1 int64 byte offsets into chunks.bin
+  lexical.npz  – BM25 inverted index over the same chunks (lexical_index.py)
+  model.json   – embedding model and API version that produced the vectors
+
+Chunk records are decoded on demand (k per query) from a read-only mmap of
+chunks.bin, so a cold load costs two small reads and no unpickling.
+Directories in the old format (no chunks.idx) still load through
+FAISS.load_local.  Loaded stores carry their BM25 index as
+``vectorstore.lexical_index``, so the index cache keeps both together;
+directories saved without one get it rebuilt in memory from their chunks.
+They also carry the recorded model as ``vectorstore.embed_model`` – an
+index rebuilt with a fallback model must be queried with that model.
+
+Indexes are built flat in memory; build_factory_index() re-encodes one with
+a FAISS index_factory string (e.g. "SQ8", "PQ64", "IVF256,SQ8") before it
+is saved, trading a little recall for much smaller files.
+
+Typical usage::
+
+    save_compact_index(vectorstore, "faiss_store/docs/<fingerprint>", ("gemini-embedding-001", "v1beta"))
+    vectorstore = load_index_dir("faiss_store/docs/<fingerprint>", embeddings)
+"""
+
+import json
+import logging
+import mmap
+import os
+from typing import Any, Dict, List, Tuple
+
+import faiss
+import numpy as np
+from langchain_community.docstore.base import Docstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from lexical_index import LexicalIndex
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# Constants
+# ---------------------------------------------------------------------------
+
+INDEX_FILE = "index.faiss"
+CHUNKS_FILE = "chunks.bin"
+OFFSETS_FILE = "chunks.idx"
+MODEL_FILE = "model.json"
+
+# Memory-map flat / SQ / PQ codes (faiss >= 1.8); older builds only map IVF lists
+_MMAP_FLAGS = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+
+# Inverted lists probed per query by IVF indexes
+_IVF_NPROBE = int(os.environ.get("FAISS_IVF_NPROBE", 16))
+
+
+# ---------------------------------------------------------------------------
+# Chunk file docstore
+# ---------------------------------------------------------------------------
+
+
+class ChunkFileDocstore(Docstore):
+    """
+    Read-only docstore over chunks.bin / chunks.idx.
+
+    Document ids are the decimal positions of the chunks in the FAISS index.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Args:
+            path: Index directory containing chunks.bin and chunks.idx.
+        """
+        self.path = path
+        self._offsets = np.load(os.path.join(path, OFFSETS_FILE))
+        with open(os.path.join(path, CHUNKS_FILE), "rb") as fh:
+            # mmap() rejects empty files; an empty store has no records to read
+            self._data = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) if len(self) else b""
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def search(self, search: str) -> str | Document:
+        """Return the chunk with id ``search``, or an error string (Docstore contract)."""
+        try:
+            position = int(search)
+        except ValueError:
+            position = -1
+        if not 0 <= position < len(self):
+            return f"ID {search} not found."
+        start, end = int(self._offsets[position]), int(self._offsets[position + 1])
+        text, metadata = json.loads(self._data[start:end].decode("utf-8"))
+        return Document(id=search, page_content=text, metadata=metadata)
+
+
+# ---------------------------------------------------------------------------
+# Index factory
+# ---------------------------------------------------------------------------
+
+
+def build_factory_index(flat: faiss.Index, factory: str) -> faiss.Index:
+    """
+    Re-encode the vectors of ``flat`` into a ``faiss.index_factory`` index.
+
+    The new index is trained on the same vectors and keeps their order, so
+    docstore positions stay valid.
+
+    Raises:
+        RuntimeError: If FAISS cannot train the index (e.g. fewer vectors
+                      than PQ / IVF centroids).
+    """
+    vectors = flat.reconstruct_n(0, flat.ntotal)
+    index = faiss.index_factory(flat.d, factory, flat.metric_type)
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    tune_index(index)
+    return index
+
+
+def tune_index(index: faiss.Index) -> None:
+    """Apply search-time parameters (nprobe for IVF indexes)."""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = min(_IVF_NPROBE, ivf.nlist)
+
+
+# ---------------------------------------------------------------------------
+# Save / load
+# ---------------------------------------------------------------------------
+
+
+def save_compact_index(vectorstore: FAISS, path: str, embed_model: Tuple[str, str] | None = None) -> None:
+    """
+    Write ``vectorstore`` to the directory ``path`` in the compact format.
+
+    Chunks are written in FAISS position order, so a search result's
+    position is also its record number.  The BM25 index built over them is
+    saved alongside and attached to ``vectorstore`` as ``lexical_index``.
+
+    Args:
+        embed_model: (model, api_version) that embedded the chunks,
+                     recorded in model.json (see read_index_model()).
+    """
+    os.makedirs(path, exist_ok=True)
+    faiss.write_index(vectorstore.index, os.path.join(path, INDEX_FILE))
+    if embed_model is not None:
+        model, api_version = embed_model
+        with open(os.path.join(path, MODEL_FILE), "w", encoding="utf-8") as fh:
+            json.dump({"model": model, "api_version": api_version}, fh)
+
+    docstore = vectorstore.docstore
+    index_to_id = vectorstore.index_to_docstore_id
+    offsets: List[int] = [0]
+    texts: List[str] = []
+    with open(os.path.join(path, CHUNKS_FILE), "wb") as fh:
+        for position in range(vectorstore.index.ntotal):
+            doc = docstore.search(index_to_id[position])
+            record = json.dumps([doc.page_content, doc.metadata], ensure_ascii=False).encode("utf-8")
+            fh.write(record)
+            offsets.append(offsets[-1] + len(record))
+            texts.append(doc.page_content)
+    # Through a file object so np.save does not append ".npy"
+    with open(os.path.join(path, OFFSETS_FILE), "wb") as fh:
+        np.save(fh, np.asarray(offsets, dtype=np.int64))
+
+    lexical = LexicalIndex.build(texts)
+    lexical.save(path)
+    vectorstore.lexical_index = lexical
+
+
+def _attach_lexical_index(vectorstore: FAISS, path: str) -> FAISS:
+    """Load the BM25 index saved in ``path``, or rebuild it from the chunks."""
+    lexical = LexicalIndex.load(path)
+    if lexical is None:
+        docstore = vectorstore.docstore
+        index_to_id = vectorstore.index_to_docstore_id
+        lexical = LexicalIndex.build(
+            docstore.search(index_to_id[position]).page_content for position in range(len(index_to_id))
+        )
+    vectorstore.lexical_index = lexical
+    return vectorstore
+
+
+def read_index_model(path: str) -> Tuple[str, str] | None:
+    """
+    Return the (model, api_version) recorded for the index at ``path``.
+
+    Returns:
+        None for indexes saved before the model was recorded – those were
+        built with the primary model.
+    """
+    try:
+        with open(os.path.join(path, MODEL_FILE), encoding="utf-8") as fh:
+            recorded = json.load(fh)
+        return recorded["model"], recorded["api_version"]
+    except FileNotFoundError:
+        return None
+    except (ValueError, KeyError) as exc:
+        logger.warning("read_index_model: ignoring unreadable '%s' – %s", MODEL_FILE, exc)
+        return None
+
+
+def is_compact_index(path: str) -> bool:
+    """Return True if ``path`` holds an index in the compact format."""
+    return os.path.exists(os.path.join(path, OFFSETS_FILE))
+
+
+def load_index_dir(path: str, embeddings: Embeddings, **kwargs: Any) -> FAISS:
+    """
+    Load the index saved at ``path`` (compact or legacy format).
+
+    The vectors of a compact index are memory-mapped and read-only: the
+    returned store can be searched but not extended.
+
+    Args:
+        path:       Index directory.
+        embeddings: Embeddings used to embed queries against the index.
+        **kwargs:   Extra FAISS constructor arguments (e.g. distance_strategy).
+    """
+    if not is_compact_index(path):
+        logger.info("load_index_dir: '%s' is in the legacy pickle format.", path)
+        vectorstore = FAISS.load_local(path, embeddings, allow_dangerous_deserialization=True, **kwargs)
+        vectorstore.embed_model = read_index_model(path)
+        return _attach_lexical_index(vectorstore, path)
+
+    index = faiss.read_index(os.path.join(path, INDEX_FILE), _MMAP_FLAGS)
+    tune_index(index)
+    docstore = ChunkFileDocstore(path)
+    if len(docstore) != index.ntotal:
+        raise ValueError(
+            f"Index at '{path}' has {index.ntotal} vectors but {len(docstore)} chunk records."
+        )
+    index_to_id: Dict[int, str] = {i: str(i) for i in range(index.ntotal)}
+    vectorstore = FAISS(embeddings, index, docstore, index_to_id, **kwargs)
+    vectorstore.embed_model = read_index_model(path)
+    return _attach_lexical_index(vectorstore, path)
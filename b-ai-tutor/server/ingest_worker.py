@@ -0,0 +1,665 @@
+"""
+Background ingestion pipeline for uploaded PDFs.
+
+``/upload`` only validates the request, stores the PDF and enqueues a job on
+the Redis list ``ingest:jobs``; it returns the new session id immediately
+with status "pending".  A pool of worker processes pops jobs and runs the
+pipeline stages:
+
+    extract → chunk → embed → index → teach
+
+Extraction, chunking and embedding run as one streaming pipeline: pages
+are chunked and embedded in batches while later pages are still being
+extracted, so memory is bounded by the batch size rather than the size of
+the document.  By default (INGEST_CHUNKING=structured) pages are read with
+layout hints, running headers and footers are dropped and chunks are cut
+per section, tagged with their section title and page range.
+
+Progress is written to ``session:<id>:status`` (see sessions.py) and
+served by ``/session/<id>/status``.  The teaching monologue is streamed
+into the session queue, so the client starts hearing sentences as soon as
+the first one is generated.  Once a session is ready, answers to likely
+follow-up questions on its document are queued for background generation
+(precompute.py), which runs only while the worker has no job.
+
+Jobs are not lost with a worker: BLMOVE hands each one to the worker's own
+processing list (``ingest:processing:<worker id>``), where it stays until
+the job has finished.  Workers refresh a heartbeat key while alive, and
+every worker periodically moves the jobs of workers whose heartbeat
+expired back to the head of the queue (requeue_orphaned_jobs()).  A job
+is attempted at most _MAX_JOB_ATTEMPTS times, so a PDF that kills its
+worker (e.g. out of memory) fails its session instead of every worker in
+turn.  The parent process respawns worker processes that exit.
+
+Workers are started by ``python app.py`` (INGEST_WORKERS processes, default
+2) or standalone with::
+
+    python ingest_worker.py
+"""
+
+import atexit
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import tempfile
+import threading
+import time
+import uuid
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+from dotenv import load_dotenv
+
+from document_index import (
+    IndexSweeper,
+    add_document_reference,
+    fingerprint_hasher,
+    index_being_collected,
+    lookup_pdf_alias,
+    maybe_collect_unreferenced_indexes,
+    pdf_digest,
+    record_pdf_alias,
+    shared_store_path,
+    wait_for_collection,
+)
+from metrics import observe_stage, timed_redis
+from pdf_extractor import iter_pdf_pages, iter_structured_pages
+from precompute import live_work, schedule_follow_ups
+from sessions import (
+    SESSION_TTL,
+    create_redis_client,
+    end_generation,
+    ip_slot_key,
+    meta_key,
+    queue_answer,
+    queue_sentences,
+    status_key,
+    teaching_query,
+)
+from vector_store import VectorStore, prefetch_query_embeddings
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# Constants
+# ---------------------------------------------------------------------------
+
+INGEST_QUEUE_KEY = "ingest:jobs"
+# Set of live worker ids; per worker, its heartbeat and the job it runs
+_WORKERS_KEY = "ingest:workers"
+
+STAGES: List[str] = ["extract", "chunk", "embed", "index", "teach"]
+
+# Uploaded PDFs wait here until their job has finished
+UPLOAD_DIR = os.environ.get("UPLOAD_DIR", os.path.join(tempfile.gettempdir(), "ai-tutor-uploads"))
+
+# A queued job may wait behind a burst of uploads, so the session's
+# "generating" flag gets a longer safety TTL than a single answer.
+INGEST_PENDING_TTL = 900
+
+# Maximum characters of extracted PDF text to embed.
+# A 10 MB text-dense PDF can produce 500 K+ chars → 500+ embedding API calls.
+# Capping at 50 000 chars keeps embedding calls to ≈50 per upload.  Memory
+# no longer grows with this cap (text is streamed), only embedding cost does.
+_MAX_EXTRACTED_TEXT_LEN = int(os.environ.get("MAX_EXTRACTED_TEXT_LEN", 50_000))
+
+# Longest the teach stage waits for the topic embeddings prefetched at job start
+_PREFETCH_WAIT_SECONDS = 10
+
+# Seconds a worker blocks on BLMOVE before checking for shutdown
+_POLL_TIMEOUT = 5
+# A worker whose heartbeat is older than this is dead and its job requeued
+_HEARTBEAT_TTL = 30
+_HEARTBEAT_INTERVAL = 10
+# Seconds between a worker's checks for jobs of dead workers
+_RECOVERY_INTERVAL = 60
+# Runs of one job before it is failed (a job whose worker dies is rerun)
+_MAX_JOB_ATTEMPTS = int(os.environ.get("INGEST_MAX_ATTEMPTS", 2))
+# Seconds between the parent's checks for exited worker processes
+_SUPERVISE_INTERVAL = 2
+# Seconds to wait for workers to finish their current job on shutdown
+_SHUTDOWN_GRACE = _POLL_TIMEOUT + 5
+
+# Spoken to the student when their document could not be processed
+_FAILURE_SENTENCES = {
+    "no_text": "Sorry, I couldn't find any readable text in that PDF. Please try a different document.",
+    "error": "Sorry, something went wrong while I was reading your document. Please try again later.",
+    "crashed": "Sorry, I couldn't process that PDF. Please try a smaller or simpler document.",
+}
+# Failures after which the uploader gets their free session back
+_RELEASE_SLOT_REASONS = ("no_text", "crashed")
+
+
+# ---------------------------------------------------------------------------
+# Job submission and status
+# ---------------------------------------------------------------------------
+
+
+@timed_redis("enqueue_ingest_job")
+def enqueue_ingest_job(redis_client: Any, job: Dict[str, str]) -> None:
+    """
+    Record a pending status for the session and push the job for the workers.
+
+    Args:
+        job: {"session_id", "pdf_path", "topic", "filename"}.
+    """
+    session_id = job["session_id"]
+    set_status(redis_client, session_id, "pending", stage="queued")
+    redis_client.rpush(INGEST_QUEUE_KEY, json.dumps({**job, "enqueued_at": time.time()}))
+
+
+@timed_redis("enqueue_ingest_job")
+async def aenqueue_ingest_job(redis_client: Any, job: Dict[str, str]) -> None:
+    """Async variant of enqueue_ingest_job() for a ``redis.asyncio`` client."""
+    pipe = redis_client.pipeline()
+    _pipe_status(pipe, job["session_id"], "pending", stage="queued")
+    pipe.rpush(INGEST_QUEUE_KEY, json.dumps({**job, "enqueued_at": time.time()}))
+    await pipe.execute()
+
+
+@timed_redis("set_status")
+def set_status(redis_client: Any, session_id: str, status: str, stage: str, **extra: Any) -> None:
+    """Write the session's pipeline status hash and refresh its TTL."""
+    pipe = redis_client.pipeline()
+    _pipe_status(pipe, session_id, status, stage, **extra)
+    pipe.execute()
+
+
+def _pipe_status(pipe: Any, session_id: str, status: str, stage: str, **extra: Any) -> None:
+    """Queue the status HSET + EXPIRE on a (sync or async) pipeline."""
+    fields = {"status": status, "stage": stage, "updated_at": time.time(), **extra}
+    key = status_key(session_id)
+    pipe.hset(key, mapping={k: str(v) for k, v in fields.items()})
+    pipe.expire(key, SESSION_TTL)
+
+
+@timed_redis("get_status")
+def get_status(redis_client: Any, session_id: str) -> Dict[str, Any] | None:
+    """
+    Return the pipeline status of a session, or None if unknown/expired.
+
+    The result includes "stages" (the ordered stage list) and
+    "stage_index" (position of the current stage: -1 while queued or after
+    a failure, len(stages) once done).
+    """
+    return _status_from_hash(redis_client.hgetall(status_key(session_id)))
+
+
+@timed_redis("get_status")
+async def aget_status(redis_client: Any, session_id: str) -> Dict[str, Any] | None:
+    """Async variant of get_status()."""
+    return _status_from_hash(await redis_client.hgetall(status_key(session_id)))
+
+
+def _status_from_hash(raw: Dict[str, str]) -> Dict[str, Any] | None:
+    """Shape a raw status hash into the /status response (None if missing)."""
+    if not raw:
+        return None
+    stage = raw.get("stage", "")
+    if stage in STAGES:
+        stage_index = STAGES.index(stage)
+    else:
+        stage_index = len(STAGES) if stage == "done" else -1
+    return {
+        "status": raw.get("status"),
+        "stage": stage,
+        "stage_index": stage_index,
+        "stages": STAGES,
+        "error": raw.get("error") or None,
+    }
+
+
+# ---------------------------------------------------------------------------
+# Pipeline
+# ---------------------------------------------------------------------------
+
+
+def run_ingest_job(redis_client: Any, job: Dict[str, str]) -> None:
+    """
+    Run every pipeline stage for one upload.
+
+    Failures are recorded in the status hash and announced in the session
+    queue; they are never raised to the worker loop.  The uploaded PDF is
+    left in place for the worker loop to remove, so a job rerun after its
+    worker died can read it again.
+    """
+    session_id = job["session_id"]
+    pdf_path = job["pdf_path"]
+    topic = job["topic"]
+    started = time.monotonic()
+
+    def stage(name: str) -> None:
+        logger.info("ingest: '%s' → stage '%s'.", session_id, name)
+        set_status(redis_client, session_id, "processing", stage=name)
+
+    # The topic (answer cache key) and the teaching query are embedded while
+    # the PDF is processed, so the teach stage finds both in the query cache
+    prefetch = prefetch_query_embeddings([topic, teaching_query(topic)])
+
+    try:
+        stage("extract")
+        index_config = VectorStore.index_config()
+        digest = pdf_digest(pdf_path, {**index_config, "max_text_len": _MAX_EXTRACTED_TEXT_LEN})
+
+        # A byte-identical upload whose index still exists skips the pipeline
+        fingerprint = lookup_pdf_alias(redis_client, digest)
+        if fingerprint:
+            vector_store = VectorStore(pickle_file=shared_store_path(fingerprint))
+            try:
+                reused = (
+                    not index_being_collected(redis_client, fingerprint)
+                    and vector_store.index_exists()
+                    and vector_store.load_index()
+                )
+            except Exception as exc:
+                logger.warning("ingest: shared index '%s' failed to load – rebuilding: %s", vector_store.pickle_file, exc)
+                reused = False
+            if reused:
+                # Once referenced the index cannot be claimed by GC, but a
+                # deletion claimed before may still be under way
+                add_document_reference(redis_client, fingerprint, session_id, SESSION_TTL)
+                reused = not index_being_collected(redis_client, fingerprint)
+            if reused:
+                logger.info("ingest: reusing shared index '%s'.", vector_store.pickle_file)
+            else:
+                fingerprint = None
+
+        if not fingerprint:
+            # Extract → chunk → embed → index, streamed page by page.  The
+            # fingerprint is only known once the last page has been read,
+            # so the store path is resolved just before saving.
+            vector_store = VectorStore()
+            hasher = fingerprint_hasher(index_config)
+
+            def publish_path() -> str:
+                nonlocal fingerprint
+                fingerprint = hasher.hexdigest()
+                # Reference the index before saving it so GC never collects it,
+                # and let a deletion of an older copy finish before publishing
+                add_document_reference(redis_client, fingerprint, session_id, SESSION_TTL)
+                wait_for_collection(redis_client, fingerprint)
+                return shared_store_path(fingerprint)
+
+            if index_config.get("chunking") == "structured":
+                pages = iter_structured_pages(pdf_path, max_chars=_MAX_EXTRACTED_TEXT_LEN)
+                built = vector_store.create_vector_store_from_structured_pages(
+                    _capped_lines(pages, hasher), on_stage=stage, resolve_path=publish_path
+                )
+            else:
+                pieces = _capped_text(iter_pdf_pages(pdf_path, max_chars=_MAX_EXTRACTED_TEXT_LEN), hasher)
+                built = vector_store.create_vector_store_from_pages(
+                    pieces, on_stage=stage, resolve_path=publish_path
+                )
+
+            if not built:
+                _fail(redis_client, job, "no_text", "No text extracted from PDF")
+                return
+            record_pdf_alias(redis_client, digest, fingerprint)
+
+        store_path = vector_store.pickle_file
+        meta = meta_key(session_id)
+        pipe = redis_client.pipeline()
+        pipe.hset(meta, mapping={"store_path": store_path, "fingerprint": fingerprint})
+        pipe.expire(meta, SESSION_TTL)
+        pipe.execute()
+
+        # Teach
+        stage("teach")
+        prefetch.join(_PREFETCH_WAIT_SECONDS)
+        # Every student on this document and topic hears the same monologue
+        count = queue_answer(
+            redis_client,
+            session_id,
+            vector_store,
+            teaching_query(topic),
+            cache_key=(fingerprint, "teach", topic),
+        )
+
+        set_status(redis_client, session_id, "ready", stage="done")
+        # Answers to likely follow-up questions, generated between jobs
+        schedule_follow_ups(redis_client, vector_store, fingerprint)
+        elapsed = time.monotonic() - started
+        observe_stage("ingest_job", elapsed)
+        logger.info(
+            "ingest: session '%s' ready with %d sentences in %.1fs.",
+            session_id,
+            count,
+            elapsed,
+        )
+
+        maybe_collect_unreferenced_indexes(redis_client)
+
+    except Exception as exc:
+        logger.exception("ingest: session '%s' failed – %s", session_id, exc)
+        _fail(redis_client, job, "error", "processing_failed")
+    finally:
+        end_generation(redis_client, session_id)
+
+
+def _capped_text(pages: Iterable[Tuple[int, str]], hasher: Any) -> Iterator[str]:
+    """
+    Turn extracted pages into consecutive text pieces, capped in length.
+
+    Pages are joined with a newline, the total is truncated to
+    _MAX_EXTRACTED_TEXT_LEN characters, and every piece is fed to the
+    document fingerprint ``hasher`` on its way to the chunker.
+    """
+    remaining = _MAX_EXTRACTED_TEXT_LEN
+    for page_num, text in pages:
+        piece = text if remaining == _MAX_EXTRACTED_TEXT_LEN else "\n" + text
+        if len(piece) >= remaining:
+            logger.warning(
+                "ingest: extracted text truncated to %d chars at page %d for cost control.",
+                _MAX_EXTRACTED_TEXT_LEN,
+                page_num,
+            )
+            piece = piece[:remaining]
+        remaining -= len(piece)
+        hasher.update(piece.encode("utf-8"))
+        yield piece
+        if remaining <= 0:
+            return
+
+
+def _capped_lines(
+    pages: Iterable[Tuple[int, List[Tuple[str, bool]]]], hasher: Any
+) -> Iterator[Tuple[int, List[Tuple[str, bool]]]]:
+    """
+    Structured counterpart of _capped_text().
+
+    The cleaned lines (headers and footers already stripped) are capped at
+    _MAX_EXTRACTED_TEXT_LEN characters in total and fed to ``hasher``,
+    headings marked, so only what is indexed determines the fingerprint.
+    """
+    remaining = _MAX_EXTRACTED_TEXT_LEN
+    for page_num, lines in pages:
+        kept: List[Tuple[str, bool]] = []
+        for text, is_heading in lines:
+            if len(text) >= remaining:
+                logger.warning(
+                    "ingest: extracted text truncated to %d chars at page %d for cost control.",
+                    _MAX_EXTRACTED_TEXT_LEN,
+                    page_num,
+                )
+                text = text[:remaining]
+            remaining -= len(text) + 1
+            hasher.update(f"{'#' if is_heading else ''}{text}\n".encode("utf-8"))
+            kept.append((text, is_heading))
+            if remaining <= 0:
+                break
+        hasher.update(b"\f")
+        yield page_num, kept
+        if remaining <= 0:
+            return
+
+
+def _fail(redis_client: Any, job: Dict[str, str], reason: str, error: str) -> None:
+    """
+    Mark the job failed and tell the student through the session queue.
+
+    An unreadable PDF, or one that repeatedly killed its worker, gives the
+    uploader's one free session back, as the synchronous upload used to
+    reject it before claiming the slot.
+    """
+    session_id = job["session_id"]
+    set_status(redis_client, session_id, "failed", stage="failed", error=error)
+    queue_sentences(redis_client, session_id, [_FAILURE_SENTENCES[reason]])
+    if reason in _RELEASE_SLOT_REASONS and job.get("client_ip"):
+        redis_client.delete(ip_slot_key(job["client_ip"]))
+
+
+def _remove_upload(path: str) -> None:
+    """Delete an uploaded PDF once it has been extracted."""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError as exc:
+        logger.warning("Could not remove uploaded file %s: %s", path, exc)
+
+
+# ---------------------------------------------------------------------------
+# Worker processes
+# ---------------------------------------------------------------------------
+
+
+def _processing_key(worker_id: str) -> str:
+    return f"ingest:processing:{worker_id}"
+
+
+def _heartbeat_key(worker_id: str) -> str:
+    return f"ingest:worker:{worker_id}"
+
+
+def _heartbeat(redis_client: Any, worker_id: str) -> None:
+    pipe = redis_client.pipeline()
+    pipe.sadd(_WORKERS_KEY, worker_id)
+    pipe.set(_heartbeat_key(worker_id), "1", ex=_HEARTBEAT_TTL)
+    pipe.execute()
+
+
+def _run_heartbeat(redis_client: Any, worker_id: str, stop: threading.Event) -> None:
+    """Refresh the worker's heartbeat until ``stop`` is set, also while a job runs."""
+    while not stop.wait(_HEARTBEAT_INTERVAL):
+        try:
+            _heartbeat(redis_client, worker_id)
+        except Exception as exc:
+            logger.warning("Ingest worker: heartbeat failed – %s", exc)
+
+
+@timed_redis("requeue_orphaned_jobs")
+def requeue_orphaned_jobs(redis_client: Any) -> int:
+    """
+    Move the jobs of workers whose heartbeat expired back to the head of the queue.
+
+    Safe to run from several workers at once: LMOVE hands each job to one
+    of them.
+
+    Returns:
+        Number of jobs requeued.
+    """
+    requeued = 0
+    for worker_id in redis_client.smembers(_WORKERS_KEY):
+        if redis_client.exists(_heartbeat_key(worker_id)):
+            continue
+        while redis_client.lmove(_processing_key(worker_id), INGEST_QUEUE_KEY, "RIGHT", "LEFT") is not None:
+            requeued += 1
+        redis_client.srem(_WORKERS_KEY, worker_id)
+    if requeued:
+        logger.warning("Ingest worker: requeued %d job(s) of dead workers.", requeued)
+    return requeued
+
+
+def _start_attempt(redis_client: Any, job: Dict[str, str]) -> int:
+    """Count a run of ``job`` in its status hash and return the number of runs so far."""
+    key = status_key(job["session_id"])
+    pipe = redis_client.pipeline()
+    pipe.hincrby(key, "attempts", 1)
+    pipe.expire(key, SESSION_TTL)
+    return int(pipe.execute()[0])
+
+
+def worker_loop(stop_event: Any | None = None) -> None:
+    """Take ingest jobs from Redis and run them until ``stop_event`` is set."""
+    redis_client = create_redis_client()
+    worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    processing = _processing_key(worker_id)
+    try:
+        _heartbeat(redis_client, worker_id)
+    except Exception as exc:
+        logger.warning("Ingest worker: Redis error – %s", exc)
+    stop_heartbeat = threading.Event()
+    threading.Thread(
+        target=_run_heartbeat, args=(redis_client, worker_id, stop_heartbeat), name="ingest-heartbeat", daemon=True
+    ).start()
+    logger.info("Ingest worker %d started (id %s).", os.getpid(), worker_id)
+
+    next_recovery = 0.0
+    try:
+        while stop_event is None or not stop_event.is_set():
+            try:
+                if time.monotonic() >= next_recovery:
+                    requeue_orphaned_jobs(redis_client)
+                    next_recovery = time.monotonic() + _RECOVERY_INTERVAL
+                raw = redis_client.blmove(INGEST_QUEUE_KEY, processing, _POLL_TIMEOUT, "LEFT", "RIGHT")
+            except Exception as exc:
+                logger.warning("Ingest worker: Redis error – %s", exc)
+                time.sleep(_POLL_TIMEOUT)
+                continue
+            if not raw:
+                continue
+            try:
+                _handle_job(redis_client, raw)
+                redis_client.lrem(processing, 1, raw)
+            except Exception as exc:
+                # Only Redis calls outside run_ingest_job() raise; retry the job later
+                logger.warning("Ingest worker: Redis error – %s", exc)
+                _return_job(redis_client, processing)
+                time.sleep(_POLL_TIMEOUT)
+    finally:
+        stop_heartbeat.set()
+        _deregister(redis_client, worker_id)
+
+
+def _deregister(redis_client: Any, worker_id: str) -> None:
+    """Requeue a job still held (the loop was interrupted mid-job) and drop the worker's keys."""
+    processing = _processing_key(worker_id)
+    try:
+        while redis_client.lmove(processing, INGEST_QUEUE_KEY, "RIGHT", "LEFT") is not None:
+            pass
+        redis_client.delete(_heartbeat_key(worker_id))
+        redis_client.srem(_WORKERS_KEY, worker_id)
+    except Exception as exc:
+        # Left to requeue_orphaned_jobs() once the heartbeat expires
+        logger.warning("Ingest worker: could not deregister – %s", exc)
+
+
+def _return_job(redis_client: Any, processing: str) -> None:
+    try:
+        redis_client.lmove(processing, INGEST_QUEUE_KEY, "RIGHT", "LEFT")
+    except Exception as exc:
+        logger.warning("Ingest worker: could not requeue the job – %s", exc)
+
+
+def _handle_job(redis_client: Any, raw: str) -> None:
+    """Run one job taken from the queue, or fail it if earlier runs killed their worker."""
+    try:
+        job = json.loads(raw)
+    except ValueError:
+        logger.error("Ingest worker: dropping malformed job %r.", raw)
+        return
+
+    attempts = _start_attempt(redis_client, job)
+    if attempts > _MAX_JOB_ATTEMPTS:
+        logger.error(
+            "Ingest worker: session '%s' failed %d run(s) – giving up.", job.get("session_id"), attempts - 1
+        )
+        _fail(redis_client, job, "crashed", "processing_crashed")
+        end_generation(redis_client, job["session_id"])
+        _remove_upload(job["pdf_path"])
+        return
+
+    waited = time.time() - float(job.get("enqueued_at", time.time()))
+    observe_stage("ingest_queue_wait", waited)
+    logger.info(
+        "Ingest worker %d: picked up session '%s' after %.1fs in queue (run %d).",
+        os.getpid(),
+        job.get("session_id"),
+        waited,
+        attempts,
+    )
+    # Precomputation (precompute.py) waits while a student waits
+    with live_work():
+        run_ingest_job(redis_client, job)
+    # Kept until here so a rerun of the job can read it
+    _remove_upload(job["pdf_path"])
+
+
+def _worker_main(stop_event: Any) -> None:
+    """Process entry point: configure logging, then run the loop."""
+    load_dotenv()
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s  %(levelname)-8s  %(name)s  %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
+    worker_loop(stop_event)
+
+
+def start_worker_pool(workers: int) -> List[multiprocessing.Process]:
+    """
+    Start ``workers`` processes running worker_loop().
+
+    The workers are not daemonic because each one owns the PDF extraction
+    process pool (see pdf_extractor.py), and daemonic processes may not
+    start children.  They are stopped from an atexit hook instead.
+
+    The calling process also runs an IndexSweeper thread that garbage
+    collects index directories of expired sessions, and a supervisor
+    thread that replaces worker processes that exit (e.g. killed by the
+    OOM killer) until the pool is stopped.
+
+    Returns:
+        The worker processes; the list is kept current by the supervisor.
+    """
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    # "spawn" gives each worker fresh Redis / HTTP clients instead of
+    # inheriting the parent's sockets and threads through fork().
+    ctx = multiprocessing.get_context("spawn")
+    stop_event = ctx.Event()
+    processes = [_start_worker(ctx, stop_event, i) for i in range(workers)]
+    sweeper = IndexSweeper().start()
+    threading.Thread(
+        target=_supervise, args=(ctx, stop_event, processes), name="ingest-supervisor", daemon=True
+    ).start()
+    atexit.register(_stop_worker_pool, stop_event, processes, sweeper)
+    logger.info("Started %d ingest worker process(es).", workers)
+    return processes
+
+
+def _start_worker(ctx: Any, stop_event: Any, number: int) -> multiprocessing.Process:
+    proc = ctx.Process(target=_worker_main, args=(stop_event,), name=f"ingest-worker-{number}")
+    proc.start()
+    return proc
+
+
+def _supervise(ctx: Any, stop_event: Any, processes: List[multiprocessing.Process]) -> None:
+    """Replace worker processes that exit, until the pool is stopped."""
+    while not stop_event.wait(_SUPERVISE_INTERVAL):
+        for number, proc in enumerate(processes):
+            if proc.is_alive() or stop_event.is_set():
+                continue
+            logger.warning("Ingest worker %s exited with code %s – restarting it.", proc.name, proc.exitcode)
+            # Its job, if any, is requeued once its heartbeat expires
+            processes[number] = _start_worker(ctx, stop_event, number)
+
+
+def _stop_worker_pool(
+    stop_event: Any, processes: List[multiprocessing.Process], sweeper: IndexSweeper
+) -> None:
+    """Ask the workers to exit after their current job; terminate stragglers."""
+    stop_event.set()
+    sweeper.stop(timeout=_SHUTDOWN_GRACE)
+    deadline = time.monotonic() + _SHUTDOWN_GRACE
+    for proc in processes:
+        proc.join(max(0.0, deadline - time.monotonic()))
+        if proc.is_alive():
+            logger.warning("Ingest worker %s did not stop in time – terminating.", proc.name)
+            proc.terminate()
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s  %(levelname)-8s  %(name)s  %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
+    start_worker_pool(int(os.environ.get("INGEST_WORKERS", 2)))
+    # Workers are restarted by the supervisor thread; stopped at exit
+    try:
+        while True:
+            time.sleep(_SUPERVISE_INTERVAL)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,221 @@
+"""
+BM25 inverted index over the chunks of a FAISS index.
+
+Built from the chunk texts when an index is created and saved next to it
+(``lexical.npz`` in the index directory), so keyword questions can be
+answered without embedding the question first (see
+VectorStore.retrieve()).  The postings are stored as flat numpy arrays:
+
+  terms         – vocabulary, sorted
+  term_offsets  – n_terms + 1 offsets into the two postings arrays
+  doc_ids       – chunk positions (= FAISS positions) per term, ascending
+  term_freqs    – occurrences of the term in each of those chunks
+  doc_lengths   – tokens per chunk
+
+Scoring is Okapi BM25 (k1 = 1.2, b = 0.75).  Tokens are lower-cased
+alphanumeric runs with stop words dropped and a plural "s" stripped, which
+is enough for textbook terms like "enzymes" to match "enzyme".
+
+Typical usage::
+
+    lexical = LexicalIndex.build(chunk_texts)
+    lexical.save("faiss_store/docs/<fingerprint>")
+    lexical = LexicalIndex.load("faiss_store/docs/<fingerprint>")
+    hits, coverage = lexical.search("Krebs cycle enzymes", k=5)
+"""
+
+import logging
+import math
+import os
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# Constants
+# ---------------------------------------------------------------------------
+
+LEXICAL_FILE = "lexical.npz"
+
+_BM25_K1 = 1.2
+_BM25_B = 0.75
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Function words and question words: they say nothing about which chunk
+# answers a question, and dropping them keeps the postings short
+_STOP_WORDS = frozenset(
+    """
+    a about above after again all also am an and any are as at be because been
+    before being below between both but by can could did do does doing down
+    during each explain few for from further had has have having he her here
+    hers him his how i if in into is it its itself just me more most my no nor
+    not now of off on once only or other our out over own please same she
+    should so some such tell than that the their them then there these they
+    this those through to too under until up very was we were what when where
+    which while who whom why will with would you your
+    """.split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Return the index terms of ``text``, in order (duplicates kept)."""
+    terms = []
+    for token in _TOKEN_RE.findall(text.lower()):
+        if token in _STOP_WORDS or (len(token) < 2 and not token.isdigit()):
+            continue
+        # Plural → singular, without touching "glass", "analysis", "gas"
+        if len(token) > 3 and token.endswith("s") and not token.endswith(("ss", "is", "us")):
+            token = token[:-1]
+        terms.append(token)
+    return terms
+
+
+# ---------------------------------------------------------------------------
+# LexicalIndex class
+# ---------------------------------------------------------------------------
+
+
+class LexicalIndex:
+    """Immutable BM25 index; chunk ids are positions in the matching FAISS index."""
+
+    def __init__(
+        self,
+        terms: np.ndarray,
+        term_offsets: np.ndarray,
+        doc_ids: np.ndarray,
+        term_freqs: np.ndarray,
+        doc_lengths: np.ndarray,
+    ) -> None:
+        self.terms = terms
+        self.term_offsets = term_offsets
+        self.doc_ids = doc_ids
+        self.term_freqs = term_freqs
+        self.doc_lengths = doc_lengths
+
+        self._term_rows: Dict[str, int] = {str(term): row for row, term in enumerate(terms)}
+        doc_count = len(doc_lengths)
+        average_length = float(doc_lengths.mean()) if doc_count else 0.0
+        # Per-chunk part of the BM25 denominator, precomputed once
+        self._length_norm = (
+            _BM25_K1 * (1 - _BM25_B + _BM25_B * doc_lengths / average_length)
+            if average_length
+            else np.full(doc_count, _BM25_K1, dtype=np.float32)
+        ).astype(np.float32)
+
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory held by the index."""
+        arrays = (self.term_offsets, self.doc_ids, self.term_freqs, self.doc_lengths, self._length_norm)
+        return sum(a.nbytes for a in arrays) + sum(len(t) + 64 for t in self._term_rows)
+
+    # ------------------------------------------------------------------
+    # Build / persist
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def build(cls, texts: Iterable[str]) -> "LexicalIndex":
+        """Index ``texts``; the i-th text becomes chunk i."""
+        postings: Dict[str, List[Tuple[int, int]]] = {}
+        doc_lengths: List[int] = []
+        for position, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            doc_lengths.append(sum(counts.values()))
+            for term, count in counts.items():
+                postings.setdefault(term, []).append((position, count))
+
+        terms = sorted(postings)
+        term_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        for row, term in enumerate(terms):
+            term_offsets[row + 1] = term_offsets[row] + len(postings[term])
+        pairs = [pair for term in terms for pair in postings[term]]
+        doc_ids = np.fromiter((p for p, _ in pairs), dtype=np.int32, count=len(pairs))
+        term_freqs = np.fromiter((min(c, 65535) for _, c in pairs), dtype=np.uint16, count=len(pairs))
+        return cls(
+            np.asarray(terms, dtype=np.str_),
+            term_offsets,
+            doc_ids,
+            term_freqs,
+            np.asarray(doc_lengths, dtype=np.int32),
+        )
+
+    def save(self, path: str) -> None:
+        """Write the index into the index directory ``path``."""
+        # Through a file object so np.savez does not append another ".npz"
+        with open(os.path.join(path, LEXICAL_FILE), "wb") as fh:
+            np.savez(
+                fh,
+                terms=self.terms,
+                term_offsets=self.term_offsets,
+                doc_ids=self.doc_ids,
+                term_freqs=self.term_freqs,
+                doc_lengths=self.doc_lengths,
+            )
+
+    @classmethod
+    def load(cls, path: str) -> "LexicalIndex | None":
+        """
+        Load the index saved in the index directory ``path``.
+
+        Returns:
+            None if the directory has no lexical index (built before they
+            existed) or it cannot be read.
+        """
+        file_path = os.path.join(path, LEXICAL_FILE)
+        if not os.path.exists(file_path):
+            return None
+        try:
+            with np.load(file_path, allow_pickle=False) as data:
+                return cls(
+                    data["terms"],
+                    data["term_offsets"],
+                    data["doc_ids"],
+                    data["term_freqs"],
+                    data["doc_lengths"],
+                )
+        except (OSError, ValueError, KeyError) as exc:
+            logger.warning("LexicalIndex: could not load '%s' – %s.", file_path, exc)
+            return None
+
+    # ------------------------------------------------------------------
+    # Search
+    # ------------------------------------------------------------------
+
+    def search(self, query: str, k: int) -> Tuple[List[Tuple[int, float]], float]:
+        """
+        Rank chunks by BM25 against ``query``.
+
+        Returns:
+            (hits, coverage): up to ``k`` (position, score) pairs, best
+            first, and the fraction of the query's distinct terms that occur
+            in the index (0.0 when the query has no index terms at all).
+        """
+        query_terms = set(tokenize(query))
+        rows = [self._term_rows[t] for t in query_terms if t in self._term_rows]
+        coverage = len(rows) / len(query_terms) if query_terms else 0.0
+        if not rows or not len(self):
+            return [], coverage
+
+        doc_count = len(self)
+        scores = np.zeros(doc_count, dtype=np.float32)
+        for row in rows:
+            start, end = self.term_offsets[row], self.term_offsets[row + 1]
+            docs = self.doc_ids[start:end]
+            tf = self.term_freqs[start:end].astype(np.float32)
+            df = end - start
+            idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+            # doc_ids are unique per term, so plain fancy-index += is safe
+            scores[docs] += idf * tf * (_BM25_K1 + 1) / (tf + self._length_norm[docs])
+
+        matched = np.flatnonzero(scores)
+        if len(matched) > k:
+            matched = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        ranked = matched[np.argsort(-scores[matched], kind="stable")]
+        return [(int(p), float(scores[p])) for p in ranked], coverage
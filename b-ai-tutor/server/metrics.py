@@ -0,0 +1,303 @@
+"""
+Prometheus metrics for the web apps and the ingest workers.
+
+Exposed in the text format at ``GET /metrics`` by both app.py and
+asgi_app.py:
+
+  ai_tutor_stage_seconds{stage}             – pipeline stage latency
+      extract_page, chunk, embed_batch, index_add, index_encode,
+      index_save, index_load, index_share, retrieve, llm_first_token,
+      llm_generate, ingest_queue_wait, ingest_job, precompute_answer
+  ai_tutor_redis_seconds{op}                – session / status Redis calls
+  ai_tutor_http_request_seconds{endpoint,method,status}
+  ai_tutor_http_requests_in_flight
+  ai_tutor_gemini_calls_total{kind,model,outcome}
+  ai_tutor_gemini_tokens_total{model,type}  – chat input / output tokens
+  ai_tutor_gemini_embedded_texts_total{model}  – index builds
+  ai_tutor_gemini_retries_total{model}
+  ai_tutor_embedding_fallbacks_total{model}
+  ai_tutor_cache_lookups_total{cache,result} – answer / script / embedding /
+      index
+  ai_tutor_retrievals_total{mode}          – lexical (no query embedding),
+      hybrid or vector
+  ai_tutor_rag_context_tokens, ai_tutor_rag_context_chunks  – context put
+      in each RAG prompt (see context_builder.py)
+  ai_tutor_context_chunks_dropped_total{reason}  – low_score, duplicate,
+      budget (over RAG_CONTEXT_TOKEN_BUDGET) or max_chunks (left over once
+      RAG_CONTEXT_MAX_CHUNKS were chosen)
+  ai_tutor_ingest_queue_length, ai_tutor_index_gc_*  – read from Redis
+      when scraped
+
+Web workers and ingest workers are separate processes.  When
+PROMETHEUS_MULTIPROC_DIR is set (serve.sh sets it), every process writes
+its samples to that directory and a scrape of any web worker aggregates
+all of them; otherwise /metrics only reports the process that serves it.
+
+Typical usage::
+
+    with STAGE_SECONDS.labels(stage="index_save").time():
+        save_compact_index(vectorstore, path)
+
+    @timed_redis("pop_sentences")
+    def pop_sentences(...): ...
+
+    body, content_type = render_metrics(redis_snapshot(redis_client))
+"""
+
+import functools
+import inspect
+import logging
+import os
+import time
+from typing import Any, Callable, Dict, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from prometheus_client.multiprocess import MultiProcessCollector
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# Metrics
+# ---------------------------------------------------------------------------
+
+_MULTIPROCESS = bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+
+# From a single page / FAISS add (milliseconds) up to a full ingest job
+_STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+_REDIS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+_CONTEXT_TOKEN_BUCKETS = (100, 250, 500, 750, 1000, 1500, 2000, 3000, 5000)
+
+STAGE_SECONDS = Histogram(
+    "ai_tutor_stage_seconds", "Latency of a pipeline stage.", ["stage"], buckets=_STAGE_BUCKETS
+)
+REDIS_SECONDS = Histogram(
+    "ai_tutor_redis_seconds", "Latency of a Redis operation.", ["op"], buckets=_REDIS_BUCKETS
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "ai_tutor_http_request_seconds",
+    "Time to produce an HTTP response (streamed bodies excluded).",
+    ["endpoint", "method", "status"],
+    buckets=_STAGE_BUCKETS,
+)
+HTTP_REQUESTS_IN_FLIGHT = Gauge(
+    "ai_tutor_http_requests_in_flight",
+    "HTTP requests being handled.",
+    multiprocess_mode="livesum",
+)
+
+GEMINI_CALLS = Counter(
+    "ai_tutor_gemini_calls", "Gemini API calls.", ["kind", "model", "outcome"]
+)
+GEMINI_TOKENS = Counter(
+    "ai_tutor_gemini_tokens", "Tokens reported by Gemini chat calls.", ["model", "type"]
+)
+GEMINI_EMBEDDED_TEXTS = Counter(
+    "ai_tutor_gemini_embedded_texts", "Texts sent to the Gemini embedding API.", ["model"]
+)
+GEMINI_RETRIES = Counter(
+    "ai_tutor_gemini_retries", "Embedding calls retried after a transient error.", ["model"]
+)
+EMBEDDING_FALLBACKS = Counter(
+    "ai_tutor_embedding_fallbacks", "Index builds that switched to a fallback embedding model.", ["model"]
+)
+CACHE_LOOKUPS = Counter(
+    "ai_tutor_cache_lookups", "Cache lookups by outcome.", ["cache", "result"]
+)
+RETRIEVALS = Counter(
+    "ai_tutor_retrievals", "Context retrievals by mode (lexical ones skip the query embedding).", ["mode"]
+)
+RAG_CONTEXT_TOKENS = Histogram(
+    "ai_tutor_rag_context_tokens", "Estimated tokens of context per RAG prompt.", buckets=_CONTEXT_TOKEN_BUCKETS
+)
+RAG_CONTEXT_CHUNKS = Histogram(
+    "ai_tutor_rag_context_chunks", "Chunks of context per RAG prompt.", buckets=(0, 1, 2, 3, 4, 5, 6, 8, 10)
+)
+CONTEXT_CHUNKS_DROPPED = Counter(
+    "ai_tutor_context_chunks_dropped", "Retrieved chunks left out of a RAG prompt.", ["reason"]
+)
+
+
+def observe_stage(stage: str, seconds: float) -> None:
+    """Record a stage duration measured by the caller."""
+    STAGE_SECONDS.labels(stage=stage).observe(seconds)
+
+
+def record_cache_lookup(cache: str, hit: bool, count: int = 1) -> None:
+    """Count ``count`` lookups in ``cache`` ("answer", "embedding", "index")."""
+    if count:
+        CACHE_LOOKUPS.labels(cache=cache, result="hit" if hit else "miss").inc(count)
+
+
+def request_started() -> float:
+    """Count an HTTP request as in flight; returns its start time for request_finished()."""
+    HTTP_REQUESTS_IN_FLIGHT.inc()
+    return time.perf_counter()
+
+
+def request_finished(started: float, endpoint: str, method: str, status: int) -> None:
+    """Record a response produced for a request counted by request_started()."""
+    HTTP_REQUESTS_IN_FLIGHT.dec()
+    HTTP_REQUEST_SECONDS.labels(endpoint=endpoint, method=method, status=str(status)).observe(
+        time.perf_counter() - started
+    )
+
+
+def timed_redis(op: str) -> Callable[[Callable], Callable]:
+    """Decorator observing the latency of a (sync or async) Redis helper as ``op``."""
+    histogram = REDIS_SECONDS.labels(op=op)
+
+    def decorator(fn: Callable) -> Callable:
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                started = time.perf_counter()
+                try:
+                    return await fn(*args, **kwargs)
+                finally:
+                    histogram.observe(time.perf_counter() - started)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - started)
+        return wrapper
+
+    return decorator
+
+
+# ---------------------------------------------------------------------------
+# Gemini chat calls
+# ---------------------------------------------------------------------------
+
+
+class GeminiMetricsCallback(BaseCallbackHandler):
+    """
+    LangChain callback attached to the shared chat clients.
+
+    Records call outcomes, generation latency, time to the first streamed
+    token and the token usage Gemini reports, for invoke / stream and their
+    async variants alike.
+    """
+
+    def __init__(self, model: str) -> None:
+        self.model = model
+        # run_id → (start time, first token seen)
+        self._runs: Dict[UUID, Tuple[float, bool]] = {}
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self._runs[run_id] = (time.perf_counter(), False)
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any) -> None:
+        started, seen = self._runs.get(run_id, (None, True))
+        if not seen and started is not None:
+            self._runs[run_id] = (started, True)
+            observe_stage("llm_first_token", time.perf_counter() - started)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        started, _ = self._runs.pop(run_id, (None, False))
+        if started is not None:
+            observe_stage("llm_generate", time.perf_counter() - started)
+        GEMINI_CALLS.labels(kind="chat", model=self.model, outcome="ok").inc()
+
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if usage:
+                    GEMINI_TOKENS.labels(model=self.model, type="input").inc(usage.get("input_tokens", 0))
+                    GEMINI_TOKENS.labels(model=self.model, type="output").inc(usage.get("output_tokens", 0))
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._runs.pop(run_id, None)
+        GEMINI_CALLS.labels(kind="chat", model=self.model, outcome="error").inc()
+
+
+# ---------------------------------------------------------------------------
+# Exposition
+# ---------------------------------------------------------------------------
+
+# ingest_worker.INGEST_QUEUE_KEY and document_index._GC_STATS_KEY (both
+# modules import this one, so the names are repeated rather than imported)
+_INGEST_QUEUE_KEY = "ingest:jobs"
+_GC_STATS_KEY = "doc:gc:stats"
+
+
+def redis_snapshot(redis_client: Any) -> Dict[str, Any]:
+    """Read the cluster-wide values exported at scrape time (one round trip)."""
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.llen(_INGEST_QUEUE_KEY)
+    pipe.hgetall(_GC_STATS_KEY)
+    queue_length, gc_stats = pipe.execute()
+    return {"ingest_queue_length": queue_length, "gc": gc_stats}
+
+
+async def aredis_snapshot(redis_client: Any) -> Dict[str, Any]:
+    """Async variant of redis_snapshot() for a ``redis.asyncio`` client."""
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.llen(_INGEST_QUEUE_KEY)
+    pipe.hgetall(_GC_STATS_KEY)
+    queue_length, gc_stats = await pipe.execute()
+    return {"ingest_queue_length": queue_length, "gc": gc_stats}
+
+
+class _SnapshotCollector:
+    """Turns a redis_snapshot() into metric families."""
+
+    def __init__(self, snapshot: Dict[str, Any]) -> None:
+        self.snapshot = snapshot
+
+    def collect(self) -> Any:
+        yield GaugeMetricFamily(
+            "ai_tutor_ingest_queue_length",
+            "Ingest jobs waiting for a worker.",
+            value=float(self.snapshot.get("ingest_queue_length") or 0),
+        )
+        gc = self.snapshot.get("gc") or {}
+        for field, help_text in (
+            ("passes", "Index GC passes."),
+            ("removed", "Index directories removed by GC."),
+            ("bytes_reclaimed", "Bytes reclaimed by index GC."),
+        ):
+            yield CounterMetricFamily(f"ai_tutor_index_gc_{field}", help_text, value=float(gc.get(field, 0)))
+        yield GaugeMetricFamily(
+            "ai_tutor_index_disk_bytes",
+            "Bytes of index directories after the last GC pass.",
+            value=float(gc.get("disk_bytes", 0)),
+        )
+
+
+def render_metrics(snapshot: Dict[str, Any] | None = None) -> Tuple[bytes, str]:
+    """
+    Return the /metrics body and its content type.
+
+    Args:
+        snapshot: Values from redis_snapshot(); omitted when Redis is down.
+    """
+    if _MULTIPROCESS:
+        registry = CollectorRegistry()
+        MultiProcessCollector(registry)
+        body = generate_latest(registry)
+    else:
+        body = generate_latest(REGISTRY)
+
+    if snapshot is not None:
+        extra = CollectorRegistry()
+        extra.register(_SnapshotCollector(snapshot))
+        body += generate_latest(extra)
+    return body, CONTENT_TYPE_LATEST
+
@@ -4,25 +4,446 @@ PDF extraction utilities.
 Uses pdfplumber to pull plain text and metadata from PDF files.
 All public functions are pure (no side effects beyond reading the file)
 and raise on unexpected errors so callers can decide how to handle them.
+
+``iter_pdf_pages`` streams pages as they are extracted (the ingest
+pipeline chunks and embeds them while later pages are still being read);
+``extract_text_from_pdf`` returns the whole text as one string.
+
+``iter_structured_pages`` is the layout-aware variant used for structured
+ingestion: pages come as lines tagged with whether they are a heading
+(larger font than the page body, or a short bold numbered line), and
+running headers, footers and page numbers – lines at the top or bottom of
+a page that repeat, digits aside, across pages – are stripped.  Repetition
+is judged over the pages seen so far plus a few pages of lookahead, so
+pages are still streamed.
 """
 
 import logging
+import multiprocessing
+import os
+import re
+import statistics
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Deque, Dict, Iterator, List, Tuple
 
 import pdfplumber
 
+from metrics import observe_stage
+
 logger = logging.getLogger(__name__)
 
+# ---------------------------------------------------------------------------
+# Constants
+# ---------------------------------------------------------------------------
+
+# Worker processes used for page-sharded extraction (0 or 1 = serial)
+_EXTRACT_WORKERS = int(os.environ.get("PDF_EXTRACT_WORKERS", min(4, os.cpu_count() or 1)))
+# Documents shorter than this are extracted serially – pool overhead dominates
+_PARALLEL_MIN_PAGES = 16
+# Pages handed to a worker at a time
+_PAGES_PER_SHARD = 8
+# Pages reported in the "slowest pages" log line
+_SLOW_PAGES_REPORTED = 3
+
+# Header / footer detection: lines this close to either end of a page are
+# candidates, and are stripped once their digit-insensitive form has been
+# seen there on this many pages (2 for two-page documents)
+_EDGE_LINES = 2
+_REPEAT_MIN_PAGES = 3
+# Pages held back so a header is recognised from its first occurrence on
+_LOOKAHEAD_PAGES = 4
+# A line is a heading when its font is this much larger than the page body,
+# or it is bold and numbered ("3.2 Light reactions"); either way it is short
+_HEADING_SIZE_RATIO = 1.15
+_HEADING_MAX_CHARS = 100
+
+# Bare page numbers: arabic, or well-formed roman numerals (front matter) –
+# not any run of i/v/x/l/c letters, which also spells words like "civil"
+_PAGE_NUMBER_RE = re.compile(
+    r"^(page\s*)?(\d+|(?=[mdclxvi])m{0,4}(cm|cd|d?c{0,3})(xc|xl|l?x{0,3})(ix|iv|v?i{0,3}))(\s*(of|/)\s*\d+)?$",
+    re.IGNORECASE,
+)
+_NUMBERED_HEADING_RE = re.compile(r"^(\d+(\.\d+)*|[A-Z]\.|chapter\s+\d+)\s+\S", re.IGNORECASE)
+_DIGITS_RE = re.compile(r"\d+")
+
+# (text, largest font size, all characters bold)
+PageLine = Tuple[str, float, bool]
+
+# (page_number, text / lines or None, seconds)
+PageResult = Tuple[int, Any, float]
+
+_pool: ProcessPoolExecutor | None = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    """Return the shared extraction process pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ProcessPoolExecutor(
+                    max_workers=_EXTRACT_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+                logger.info("PDF extraction pool started with %d worker(s).", _EXTRACT_WORKERS)
+    return _pool
+
+
+def _discard_pool() -> None:
+    """Drop the shared pool so the next parallel extraction starts a new one."""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+# ---------------------------------------------------------------------------
+# Page producers
+# ---------------------------------------------------------------------------
+
+
+def _page_lines(page: Any) -> List[PageLine]:
+    """Return the text lines of a pdfplumber page with their font hints."""
+    lines: List[PageLine] = []
+    for line in page.extract_text_lines(return_chars=True):
+        chars = [c for c in line.get("chars", ()) if not c.get("text", "").isspace()]
+        size = max((float(c.get("size", 0)) for c in chars), default=0.0)
+        bold = bool(chars) and all("bold" in str(c.get("fontname", "")).lower() for c in chars)
+        lines.append((line["text"], round(size, 1), bold))
+    return lines
+
+
+def _extract_page(page: Any, layout: bool) -> Any:
+    """Return the plain text (or, with ``layout``, the lines) of a page, or None."""
+    if layout:
+        return _page_lines(page) or None
+    return page.extract_text() or None
+
+
+def _extract_page_range(pdf_path: str, start: int, end: int, layout: bool = False) -> List[PageResult]:
+    """
+    Extract pages [start, end) (0-based) of a PDF.
+
+    Runs inside a pool worker, which opens the file itself so nothing but
+    the path and page numbers crosses the process boundary.
+    """
+    results: List[PageResult] = []
+    with pdfplumber.open(pdf_path) as pdf:
+        for index in range(start, end):
+            began = time.perf_counter()
+            content = _extract_page(pdf.pages[index], layout)
+            results.append((index + 1, content, time.perf_counter() - began))
+    return results
+
+
+def _iter_serial(pdf_path: str, start: int, total_pages: int, layout: bool = False) -> Iterator[PageResult]:
+    """Extract pages one by one in this process, starting at 0-based ``start``."""
+    with pdfplumber.open(pdf_path) as pdf:
+        for index in range(start, total_pages):
+            began = time.perf_counter()
+            content = _extract_page(pdf.pages[index], layout)
+            yield index + 1, content, time.perf_counter() - began
+
+
+def _iter_parallel(pdf_path: str, total_pages: int, layout: bool = False) -> Iterator[PageResult]:
+    """
+    Extract page shards on the process pool and yield pages in order.
+
+    At most two shards per worker are in flight, so workers keep extracting
+    ahead while the consumer processes earlier pages, and memory stays
+    bounded.  Closing the generator cancels the shards not yet started.
+    """
+    pool = _get_pool()
+    shards = [(s, min(s + _PAGES_PER_SHARD, total_pages)) for s in range(0, total_pages, _PAGES_PER_SHARD)]
+    max_in_flight = max(2, _EXTRACT_WORKERS * 2)
+
+    pending: List[Future] = []
+    next_shard = 0
+    try:
+        while next_shard < len(shards) or pending:
+            while next_shard < len(shards) and len(pending) < max_in_flight:
+                start, end = shards[next_shard]
+                pending.append(pool.submit(_extract_page_range, pdf_path, start, end, layout))
+                next_shard += 1
+
+            # Consume strictly in order so pages come out in document order
+            yield from pending.pop(0).result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def _iter_page_results(pdf_path: str, layout: bool = False) -> Iterator[PageResult]:
+    """
+    Yield (page_number, text, seconds) for every page, in page order.
+
+    With ``layout`` the text is replaced by the page's PageLine list.
+
+    Documents of _PARALLEL_MIN_PAGES or more pages are extracted in shards
+    on the process pool; if the pool breaks, extraction resumes serially
+    after the last page already yielded.
+    """
+    with pdfplumber.open(pdf_path) as pdf:
+        total_pages = len(pdf.pages)
+    logger.debug("PDF has %d page(s).", total_pages)
+
+    if _EXTRACT_WORKERS <= 1 or total_pages < _PARALLEL_MIN_PAGES:
+        yield from _iter_serial(pdf_path, 0, total_pages, layout)
+        return
+
+    done = 0
+    try:
+        for result in _iter_parallel(pdf_path, total_pages, layout):
+            done = result[0]
+            yield result
+    except BrokenProcessPool:
+        # A worker died (e.g. OOM-killed) – start a fresh pool next time
+        logger.warning(
+            "PDF extraction pool broke – continuing '%s' serially from page %d.", pdf_path, done + 1
+        )
+        _discard_pool()
+        yield from _iter_serial(pdf_path, done, total_pages, layout)
+
+
+# ---------------------------------------------------------------------------
+# Public API
+# ---------------------------------------------------------------------------
+
+
+def _iter_pages(
+    pdf_path: str,
+    max_chars: int | None,
+    timings: List[Dict[str, float]] | None,
+    layout: bool,
+) -> Iterator[Tuple[int, Any]]:
+    """Shared loop of iter_pdf_pages() and the layout-aware producers."""
+    logger.info("Extracting text from PDF: %s", pdf_path)
+    began = time.perf_counter()
+    page_timings: List[Dict[str, float]] = [] if timings is None else timings
+    pages_with_text = 0
+    collected = 0
+
+    results = _iter_page_results(pdf_path, layout)
+    try:
+        while True:
+            try:
+                page_num, content, seconds = next(results)
+            except StopIteration:
+                break
+            except Exception as exc:
+                logger.exception("Failed to extract text from PDF '%s': %s", pdf_path, exc)
+                raise Exception(f"Error extracting text from PDF: {exc}") from exc
+
+            chars = sum(len(line[0]) for line in content) if layout and content else len(content or "")
+            page_timings.append({"page": page_num, "chars": chars, "seconds": seconds})
+            observe_stage("extract_page", seconds)
+            if not content:
+                logger.debug("Page %d: no text found (possibly image-only).", page_num)
+                continue
+
+            logger.debug("Page %d: extracted %d characters in %.3fs.", page_num, chars, seconds)
+            pages_with_text += 1
+            collected += chars
+            yield page_num, content
+
+            if max_chars is not None and collected >= max_chars:
+                logger.debug("Early stop after page %d: %d characters collected.", page_num, collected)
+                break
+    finally:
+        results.close()
+
+    slowest = sorted(page_timings, key=lambda t: t["seconds"], reverse=True)[:_SLOW_PAGES_REPORTED]
+    logger.info(
+        "Text extraction complete: %d character(s) from %d of %d page(s) read in %.2fs; slowest pages: %s.",
+        collected,
+        pages_with_text,
+        len(page_timings),
+        time.perf_counter() - began,
+        ", ".join(f"p{t['page']}={t['seconds']:.2f}s" for t in slowest) or "n/a",
+    )
+
+
+def iter_pdf_pages(
+    pdf_path: str,
+    max_chars: int | None = None,
+    timings: List[Dict[str, float]] | None = None,
+) -> Iterator[Tuple[int, str]]:
+    """
+    Yield the text of each page that has any, in page order.
+
+    Pages are produced as soon as they are extracted, so callers can chunk
+    and embed early pages while later ones are still being read; only a
+    bounded number of pages is held in memory at any time.  Pages that
+    yield no text (e.g. scanned images without an OCR layer) are skipped.
 
-def extract_text_from_pdf(pdf_path: str) -> str:
+    Args:
+        pdf_path:  Absolute or relative path to the PDF file.
+        max_chars: Stop after the page that brings the running total to at
+                   least this many characters.
+        timings:   Optional list that receives one
+                   {"page": <int>, "chars": <int>, "seconds": <float>} entry
+                   per extracted page.
+
+    Yields:
+        (page_number, page_text) tuples; page numbers are 1-based.
+
+    Raises:
+        Exception: Wraps any pdfplumber error with a descriptive message.
+    """
+    yield from _iter_pages(pdf_path, max_chars, timings, layout=False)
+
+
+# ---------------------------------------------------------------------------
+# Structured pages
+# ---------------------------------------------------------------------------
+
+
+def _boilerplate_key(text: str) -> str:
+    """Digit-insensitive form of a line, so "Page 3" and "Page 4" match."""
+    return _DIGITS_RE.sub("#", " ".join(text.lower().split()))
+
+
+def _edge_indexes(count: int) -> range | set:
+    """Indexes of the lines of a ``count``-line page that are header / footer candidates."""
+    if count <= 2 * _EDGE_LINES:
+        return range(count)
+    return set(range(_EDGE_LINES)) | set(range(count - _EDGE_LINES, count))
+
+
+def strip_repeated_lines(pages: Iterator[Tuple[int, List[PageLine]]]) -> Iterator[Tuple[int, List[PageLine]]]:
+    """
+    Drop running headers, footers and page numbers from a stream of pages.
+
+    A line at either end of a page is dropped when it is a bare page number
+    (arabic, or a well-formed roman numeral) or its digit-insensitive form appears at a page end on _REPEAT_MIN_PAGES
+    pages.  Pages are yielded _LOOKAHEAD_PAGES behind the input, so the
+    first pages are judged with later ones already counted.
+    """
+    counts: Counter = Counter()
+    window: Deque[Tuple[int, List[PageLine]]] = deque()
+    pages_seen = 0
+
+    def clean(page: Tuple[int, List[PageLine]]) -> Tuple[int, List[PageLine]]:
+        page_num, lines = page
+        threshold = min(_REPEAT_MIN_PAGES, max(2, pages_seen))
+        edges = _edge_indexes(len(lines))
+        kept = [
+            line
+            for i, line in enumerate(lines)
+            if i not in edges
+            or not (_PAGE_NUMBER_RE.match(line[0].strip()) or counts[_boilerplate_key(line[0])] >= threshold)
+        ]
+        if len(kept) < len(lines):
+            logger.debug("Page %d: stripped %d header/footer line(s).", page_num, len(lines) - len(kept))
+        return page_num, kept
+
+    for page in pages:
+        pages_seen += 1
+        lines = page[1]
+        counts.update({_boilerplate_key(lines[i][0]) for i in _edge_indexes(len(lines))})
+        window.append(page)
+        if len(window) > _LOOKAHEAD_PAGES:
+            yield clean(window.popleft())
+    while window:
+        yield clean(window.popleft())
+
+
+def _is_heading(line: PageLine, body_size: float) -> bool:
+    text, size, bold = line
+    text = text.strip()
+    if not text or len(text) > _HEADING_MAX_CHARS or text.endswith((".", ",", ";", ":")):
+        return False
+    if not any(ch.isalpha() for ch in text):
+        return False
+    if body_size and size >= body_size * _HEADING_SIZE_RATIO:
+        return True
+    return bold and bool(_NUMBERED_HEADING_RE.match(text))
+
+
+def tag_headings(lines: List[PageLine]) -> List[Tuple[str, bool]]:
+    """
+    Return (text, is_heading) for each line of a page.
+
+    The body size is the median font size of the page's lines, weighted by
+    their length, so a page of mostly body text sets the baseline.
+    """
+    sizes = [size for text, size, _bold in lines for _weight in range(max(1, len(text) // 20))]
+    body_size = statistics.median(sizes) if sizes else 0.0
+    return [(line[0], _is_heading(line, body_size)) for line in lines]
+
+
+def iter_structured_pages(
+    pdf_path: str,
+    max_chars: int | None = None,
+    timings: List[Dict[str, float]] | None = None,
+) -> Iterator[Tuple[int, List[Tuple[str, bool]]]]:
+    """
+    Yield the cleaned lines of each page with text, tagged as headings or not.
+
+    Like iter_pdf_pages(), pages stream as they are extracted (a few pages
+    behind, see strip_repeated_lines()).  Pages left empty once headers and
+    footers are stripped are skipped.
+
+    Args:
+        pdf_path:  Absolute or relative path to the PDF file.
+        max_chars: Stop after the page that brings the running total of raw
+                   text to at least this many characters.
+        timings:   Optional per-page timings list, as for iter_pdf_pages().
+
+    Yields:
+        (page_number, [(line_text, is_heading), ...]) tuples.
+
+    Raises:
+        Exception: Wraps any pdfplumber error with a descriptive message.
+    """
+    for page_num, lines in strip_repeated_lines(_iter_pages(pdf_path, max_chars, timings, layout=True)):
+        if lines:
+            yield page_num, tag_headings(lines)
+
+
+def extract_text_with_timings(
+    pdf_path: str,
+    max_chars: int | None = None,
+) -> Tuple[str, List[Dict[str, float]]]:
+    """
+    Extract text like extract_text_from_pdf() and report per-page timings.
+
+    Args:
+        pdf_path:  Absolute or relative path to the PDF file.
+        max_chars: Stop extracting once at least this many characters have
+                   been collected (callers truncate to their own cap).
+
+    Returns:
+        (text, timings) where timings is a list of
+        {"page": <int>, "chars": <int>, "seconds": <float>} in page order.
+
+    Raises:
+        Exception: Wraps any pdfplumber error with a descriptive message.
+    """
+    timings: List[Dict[str, float]] = []
+    text_parts = [text for _, text in iter_pdf_pages(pdf_path, max_chars=max_chars, timings=timings)]
+    return "\n".join(text_parts).strip(), timings
+
+
+def extract_text_from_pdf(pdf_path: str, max_chars: int | None = None) -> str:
     """
     Extract all readable text from a PDF file.
 
     Iterates over every page and concatenates the text, inserting a newline
     between pages.  Pages that yield no text (e.g. scanned images without
-    an OCR layer) are silently skipped.
+    an OCR layer) are silently skipped.  Long documents are extracted in
+    parallel page shards (see iter_pdf_pages()).
 
     Args:
-        pdf_path: Absolute or relative path to the PDF file.
+        pdf_path:  Absolute or relative path to the PDF file.
+        max_chars: Optional early-stop threshold; extraction stops once at
+                   least this many characters have been collected.
 
     Returns:
         A single string containing all extracted text, stripped of leading /
@@ -31,37 +452,7 @@ def extract_text_from_pdf(pdf_path: str) -> str:
     Raises:
         Exception: Wraps any pdfplumber error with a descriptive message.
     """
-    logger.info("Extracting text from PDF: %s", pdf_path)
-    text_parts: list[str] = []
-
-    try:
-        with pdfplumber.open(pdf_path) as pdf:
-            total_pages = len(pdf.pages)
-            logger.debug("PDF has %d page(s).", total_pages)
-
-            for page_num, page in enumerate(pdf.pages, start=1):
-                page_text = page.extract_text()
-                if page_text:
-                    text_parts.append(page_text)
-                    logger.debug(
-                        "Page %d/%d: extracted %d characters.",
-                        page_num,
-                        total_pages,
-                        len(page_text),
-                    )
-                else:
-                    logger.debug("Page %d/%d: no text found (possibly image-only).", page_num, total_pages)
-
-    except Exception as exc:
-        logger.exception("Failed to extract text from PDF '%s': %s", pdf_path, exc)
-        raise Exception(f"Error extracting text from PDF: {exc}") from exc
-
-    extracted = "\n".join(text_parts).strip()
-    logger.info(
-        "Text extraction complete: %d character(s) from %d page(s).",
-        len(extracted),
-        len(text_parts),
-    )
+    extracted, _ = extract_text_with_timings(pdf_path, max_chars=max_chars)
     return extracted
 
 
@@ -0,0 +1,232 @@
+"""
+Speculative generation of answers for freshly indexed documents.
+
+Once an ingest job has its document's index and has taught the session's
+topic, the worker schedules answers to likely follow-up questions – one
+per section title recorded by structured chunking (largest sections first,
+see VectorStore.iter_structured_chunks()).  The answers go to the script
+store (script_store.py), so a later student on the same document who asks
+about a section has the queue filled at once, by whichever process serves
+them.
+
+Generation runs on a PrecomputePool: PRECOMPUTE_WORKERS threads per ingest
+worker process (default 1; 0 disables precomputation) taking tasks from a
+priority heap of at most _MAX_PENDING tasks.  Live work ranks above it: no
+task starts while the process runs an ingest job (PrecomputePool.live()),
+so an upload never waits behind speculative answers.  A task already
+running is not interrupted – at most PRECOMPUTE_WORKERS Gemini calls per
+process overlap live work.  Each answer is claimed in Redis first, so
+workers sharing a document do not generate it twice.
+
+Typical usage::
+
+    with live_work():
+        run_ingest_job(...)
+    schedule_follow_ups(redis_client, vector_store, fingerprint)
+"""
+
+import contextlib
+import heapq
+import itertools
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter
+from typing import Any, Callable, Iterator, List, Tuple
+
+from metrics import observe_stage
+from script_store import SCRIPT_STORE_ENABLED, claim_script, release_script_claim, save_script
+from sessions import answer_sentences
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# Constants
+# ---------------------------------------------------------------------------
+
+_PRECOMPUTE_WORKERS = int(os.environ.get("PRECOMPUTE_WORKERS", 1))
+# Sections of a document whose follow-up answer is precomputed
+_FOLLOW_UPS_PER_DOCUMENT = int(os.environ.get("PRECOMPUTE_FOLLOW_UPS", 4))
+# Tasks waiting beyond this are dropped rather than queued
+_MAX_PENDING = 64
+
+# Leading numbering of a heading ("3.2", "B.", "Chapter 4")
+_SECTION_NUMBER_RE = re.compile(r"^(\d+(\.\d+)*\.?|[A-Z]\.|chapter\s+\d+:?)\s+", re.IGNORECASE)
+
+
+def follow_up_question(section: str) -> str:
+    """Return the question precomputed for a section title (its innermost heading)."""
+    title = _SECTION_NUMBER_RE.sub("", section.split(" – ")[-1]).strip()
+    return f"Explain {title or section}."
+
+
+def section_titles(vector_store: Any, limit: int) -> List[str]:
+    """Return up to ``limit`` section titles of the loaded index, by chunk count."""
+    docstore = vector_store.vectorstore.docstore
+    index_to_id = vector_store.vectorstore.index_to_docstore_id
+    counts: Counter = Counter()
+    for position in range(len(index_to_id)):
+        section = docstore.search(index_to_id[position]).metadata.get("section")
+        if section:
+            counts[section] += 1
+    # Counter.most_common keeps first-seen order among equal counts
+    return [section for section, _ in counts.most_common(limit)]
+
+
+# ---------------------------------------------------------------------------
+# PrecomputePool class
+# ---------------------------------------------------------------------------
+
+
+class PrecomputePool:
+    """Bounded thread pool running the lowest-priority-number task first, never alongside live work."""
+
+    def __init__(self, workers: int) -> None:
+        self.workers = workers
+
+        # (priority, sequence, function, args)
+        self._heap: List[Tuple[int, int, Callable[..., Any], Tuple[Any, ...]]] = []
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+        self._live = 0
+        self._stopped = False
+        self._threads: List[threading.Thread] = []
+
+    def submit(self, priority: int, fn: Callable[..., Any], *args: Any) -> bool:
+        """
+        Queue ``fn(*args)``; lower ``priority`` values run first.
+
+        Returns:
+            False if the pool is full or shut down and the task was dropped.
+        """
+        with self._cond:
+            if self._stopped or len(self._heap) >= _MAX_PENDING:
+                logger.debug("PrecomputePool: dropping task, %d pending.", len(self._heap))
+                return False
+            heapq.heappush(self._heap, (priority, next(self._sequence), fn, args))
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._run, name=f"precompute-{len(self._threads)}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            self._cond.notify()
+        return True
+
+    @contextlib.contextmanager
+    def live(self) -> Iterator[None]:
+        """Hold back queued tasks while the block runs."""
+        with self._cond:
+            self._live += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._live -= 1
+                self._cond.notify_all()
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._heap)
+
+    def shutdown(self) -> None:
+        """Drop the queued tasks and let the threads exit after their current one."""
+        with self._cond:
+            self._stopped = True
+            self._heap.clear()
+            self._cond.notify_all()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._stopped and (not self._heap or self._live):
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                _, _, fn, args = heapq.heappop(self._heap)
+            try:
+                fn(*args)
+            except Exception as exc:
+                logger.exception("PrecomputePool: task failed – %s", exc)
+
+
+# ---------------------------------------------------------------------------
+# Process-wide singleton
+# ---------------------------------------------------------------------------
+
+_pool: PrecomputePool | None = None
+_pool_lock = threading.Lock()
+
+
+def get_precompute_pool() -> PrecomputePool | None:
+    """Return the process-wide PrecomputePool, or None when precomputation is disabled."""
+    global _pool
+    if _PRECOMPUTE_WORKERS <= 0 or not SCRIPT_STORE_ENABLED:
+        return None
+
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = PrecomputePool(_PRECOMPUTE_WORKERS)
+                logger.info("PrecomputePool configured (workers=%d).", _PRECOMPUTE_WORKERS)
+    return _pool
+
+
+@contextlib.contextmanager
+def live_work() -> Iterator[None]:
+    """Run the block as live work: no precomputation starts until it ends."""
+    pool = get_precompute_pool()
+    if pool is None:
+        yield
+        return
+    with pool.live():
+        yield
+
+
+# ---------------------------------------------------------------------------
+# Scheduling
+# ---------------------------------------------------------------------------
+
+
+def schedule_follow_ups(redis_client: Any, vector_store: Any, fingerprint: str) -> int:
+    """
+    Queue the follow-up answers of a document on the precompute pool.
+
+    The largest section of every document gets priority 0, the next one 1
+    and so on, so each new document gets its most likely answer early.
+
+    Returns:
+        Number of tasks queued.
+    """
+    pool = get_precompute_pool()
+    if pool is None or not fingerprint or _FOLLOW_UPS_PER_DOCUMENT <= 0:
+        return 0
+    queued = 0
+    for rank, section in enumerate(section_titles(vector_store, _FOLLOW_UPS_PER_DOCUMENT)):
+        question = follow_up_question(section)
+        queued += pool.submit(rank, _precompute_answer, redis_client, vector_store, fingerprint, question)
+    if queued:
+        logger.info("precompute: %d follow-up answer(s) queued for '%s'.", queued, fingerprint[:12])
+    return queued
+
+
+def _precompute_answer(redis_client: Any, vector_store: Any, fingerprint: str, question: str) -> None:
+    """Generate and store the answer to ``question`` unless it exists or is being generated."""
+    if not claim_script(redis_client, fingerprint, "question", question):
+        return
+    started = time.perf_counter()
+    try:
+        vector = vector_store.embed_query(question)
+        answer = vector_store.query_with_sources(question, query_vector=vector).get("answer", "")
+    except Exception as exc:
+        release_script_claim(redis_client, fingerprint, "question", question)
+        logger.warning("precompute: '%s' failed – %s", question[:60], exc)
+        return
+
+    sentences = answer_sentences(answer)
+    if not any(sentences):
+        release_script_claim(redis_client, fingerprint, "question", question)
+        return
+    save_script(redis_client, fingerprint, "question", question, vector, sentences, precomputed=True)
+    observe_stage("precompute_answer", time.perf_counter() - started)
+    logger.info("precompute: stored %d sentence(s) for '%s'.", len(sentences), question[:60])
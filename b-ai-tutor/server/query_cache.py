@@ -0,0 +1,244 @@
+"""
+Two-tier cache of query embeddings: per-process LRU in front of Redis.
+
+Every retrieval used to embed its query with a Gemini call, although many
+queries repeat verbatim: the templated teaching query for popular topics,
+the topic itself (answer cache lookups) and common student questions.
+Vectors are keyed by the embedding space (model and output size, see
+vector_store._embedding_space()) and the normalised query text (case-folded,
+whitespace collapsed), so "What is ATP?" and "what is  ATP?" share one.
+
+  memory – OrderedDict LRU of ``max_entries`` vectors, no I/O on a hit
+  Redis  – ``qemb:<sha256>`` strings holding base64 float32 bytes, shared by
+           every web and ingest worker, expiring ``ttl_seconds`` after the
+           last store
+
+The Redis tier is best-effort: errors are logged and the lookup falls
+through to the embedding API.  Async callers (asgi_app.py) run the Redis
+round trip on a worker thread.
+
+Typical usage::
+
+    cache = get_query_embedding_cache()
+    vector = cache.get("gemini-embedding-001", query)
+    if vector is None:
+        vector = embeddings.embed_query(query)
+        cache.put("gemini-embedding-001", query, vector)
+"""
+
+import asyncio
+import base64
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+import redis
+
+from metrics import record_cache_lookup, timed_redis
+from sessions import create_redis_client
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# Constants
+# ---------------------------------------------------------------------------
+
+# Defaults – each can be overridden through the environment.
+_DEFAULT_MAX_ENTRIES = 2048
+_DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+
+
+def normalize_query(text: str) -> str:
+    """Return the form of ``text`` used in cache keys."""
+    return " ".join(text.casefold().split())
+
+
+def query_key(model: str, text: str) -> str:
+    """Return the Redis key of the embedding of ``text`` under ``model``."""
+    digest = hashlib.sha256()
+    digest.update(model.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(normalize_query(text).encode("utf-8"))
+    return f"qemb:{digest.hexdigest()}"
+
+
+def _encode(vector: Sequence[float]) -> str:
+    return base64.b64encode(np.asarray(vector, dtype=np.float32).tobytes()).decode("ascii")
+
+
+def _decode(value: str) -> List[float]:
+    return np.frombuffer(base64.b64decode(value), dtype=np.float32).tolist()
+
+
+# ---------------------------------------------------------------------------
+# QueryEmbeddingCache class
+# ---------------------------------------------------------------------------
+
+
+class QueryEmbeddingCache:
+    """Thread-safe LRU of query vectors backed by a shared Redis tier."""
+
+    def __init__(
+        self,
+        redis_client: Any | None,
+        max_entries: int = _DEFAULT_MAX_ENTRIES,
+        ttl_seconds: int = _DEFAULT_TTL_SECONDS,
+    ) -> None:
+        """
+        Args:
+            redis_client: Sync Redis client of the shared tier, or None for
+                          a memory-only cache.
+            max_entries:  Vectors kept in process memory.
+            ttl_seconds:  Expiry of the Redis entries.
+        """
+        self.redis_client = redis_client
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+
+        self._entries: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.memory_hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+
+    def get(self, model: str, text: str) -> List[float] | None:
+        """Return the cached embedding of ``text`` under ``model``, or None."""
+        key = query_key(model, text)
+        vector = self._get_local(key)
+        if vector is None:
+            vector = self._get_shared(key)
+        return vector
+
+    def put(self, model: str, text: str, vector: Sequence[float]) -> None:
+        """Cache the embedding of ``text`` under ``model`` in both tiers."""
+        key = query_key(model, text)
+        self._put_local(key, list(vector))
+        self._put_shared(key, vector)
+
+    async def aget(self, model: str, text: str) -> List[float] | None:
+        """Async variant of get(); the Redis tier is read on a worker thread."""
+        key = query_key(model, text)
+        vector = self._get_local(key)
+        if vector is None:
+            if self.redis_client is not None:
+                vector = await asyncio.to_thread(self._get_shared, key)
+            else:
+                vector = self._get_shared(key)
+        return vector
+
+    async def aput(self, model: str, text: str, vector: Sequence[float]) -> None:
+        """Async variant of put()."""
+        key = query_key(model, text)
+        self._put_local(key, list(vector))
+        if self.redis_client is not None:
+            await asyncio.to_thread(self._put_shared, key, vector)
+
+    def stats(self) -> Dict[str, float]:
+        """Return hit/miss counters per tier and the memory occupancy."""
+        with self._lock:
+            lookups = self.memory_hits + self.redis_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "memory_hits": self.memory_hits,
+                "redis_hits": self.redis_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.redis_hits) / lookups if lookups else 0.0,
+            }
+
+    # ------------------------------------------------------------------
+    # Internal helpers
+    # ------------------------------------------------------------------
+
+    def _get_local(self, key: str) -> List[float] | None:
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+        record_cache_lookup("query_embedding", hit=vector is not None)
+        return vector
+
+    def _put_local(self, key: str, vector: List[float]) -> None:
+        with self._lock:
+            self._entries[key] = vector
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    @timed_redis("query_embedding_get")
+    def _get_shared(self, key: str) -> List[float] | None:
+        """Read ``key`` from Redis, promoting a hit into the memory tier."""
+        vector = None
+        if self.redis_client is not None:
+            try:
+                value = self.redis_client.get(key)
+            except redis.RedisError as exc:
+                logger.warning("QueryEmbeddingCache: Redis lookup failed – %s", exc)
+                value = None
+            if value:
+                vector = _decode(value)
+                self._put_local(key, vector)
+
+        with self._lock:
+            if vector is None:
+                self.misses += 1
+            else:
+                self.redis_hits += 1
+        if self.redis_client is not None:
+            record_cache_lookup("query_embedding_redis", hit=vector is not None)
+        return vector
+
+    @timed_redis("query_embedding_put")
+    def _put_shared(self, key: str, vector: Sequence[float]) -> None:
+        if self.redis_client is None:
+            return
+        try:
+            self.redis_client.set(key, _encode(vector), ex=self.ttl_seconds)
+        except redis.RedisError as exc:
+            logger.warning("QueryEmbeddingCache: Redis store failed – %s", exc)
+
+
+# ---------------------------------------------------------------------------
+# Process-wide singleton
+# ---------------------------------------------------------------------------
+
+_query_cache: QueryEmbeddingCache | None = None
+_query_cache_lock = threading.Lock()
+
+
+def get_query_embedding_cache() -> QueryEmbeddingCache | None:
+    """
+    Return the process-wide QueryEmbeddingCache, or None when disabled.
+
+    Configured through QUERY_EMBEDDING_CACHE_ENABLED (default "1"),
+    QUERY_EMBEDDING_CACHE_REDIS (default "1"; "0" keeps it in memory only),
+    QUERY_EMBEDDING_CACHE_MAX_ENTRIES and QUERY_EMBEDDING_CACHE_TTL_SECONDS.
+    """
+    global _query_cache
+    if os.environ.get("QUERY_EMBEDDING_CACHE_ENABLED", "1") not in ("1", "true", "True"):
+        return None
+
+    if _query_cache is None:
+        with _query_cache_lock:
+            if _query_cache is None:
+                shared = os.environ.get("QUERY_EMBEDDING_CACHE_REDIS", "1") in ("1", "true", "True")
+                _query_cache = QueryEmbeddingCache(
+                    redis_client=create_redis_client() if shared else None,
+                    max_entries=int(os.environ.get("QUERY_EMBEDDING_CACHE_MAX_ENTRIES", _DEFAULT_MAX_ENTRIES)),
+                    ttl_seconds=int(os.environ.get("QUERY_EMBEDDING_CACHE_TTL_SECONDS", _DEFAULT_TTL_SECONDS)),
+                )
+                logger.info(
+                    "QueryEmbeddingCache configured (max_entries=%d, redis=%s).",
+                    _query_cache.max_entries,
+                    shared,
+                )
+    return _query_cache
@@ -0,0 +1,258 @@
+"""
+Precomputed answers per document, shared by every process through Redis.
+
+The answer cache (answer_cache.py) lives in one process, but a popular
+document is opened by sessions handled by different ingest and web
+workers.  Teaching monologues and the follow-up answers precomputed in the
+background (see precompute.py) are therefore also written to one Redis
+hash per document:
+
+  scripts:<fingerprint>              – field "<kind>:<sha256 of the
+      normalised text>" → JSON {"text", "vector" (base64 float32),
+      "sentences", "precomputed"}; expires ``SCRIPT_STORE_TTL_SECONDS``
+      after the last write
+  scripts:<fingerprint>:claim:<field> – set while a worker generates that
+      entry, so two workers never generate the same one
+
+An entry answers a request repeating its text exactly (case and spacing
+aside), or whose embedding is at least SCRIPT_STORE_SIMILARITY
+cosine-similar to the entry's – SCRIPT_STORE_FOLLOW_UP_SIMILARITY for
+precomputed answers, since a student rarely phrases a question like the
+generated "Explain <section>." – among the few entries of the document.
+The store is used whether or not the process's answer cache is enabled.
+The fingerprint covers the document text and index settings, so an entry
+stays valid as long as it lives, even if the index is collected and rebuilt.
+
+Lookups and writes are best-effort: Redis errors are logged and treated as
+a miss.
+
+Typical usage::
+
+    scripts = fetch_scripts(redis_client, fingerprint)
+    sentences = match_script(scripts, "teach", topic, vector)
+    if sentences is None:
+        sentences = generate(...)
+        save_script(redis_client, fingerprint, "teach", topic, vector, sentences)
+"""
+
+import base64
+import hashlib
+import json
+import logging
+import os
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+import redis
+
+from metrics import record_cache_lookup, timed_redis
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# Constants
+# ---------------------------------------------------------------------------
+
+SCRIPT_STORE_ENABLED = os.environ.get("SCRIPT_STORE_ENABLED", "1") in ("1", "true", "True")
+_TTL_SECONDS = int(os.environ.get("SCRIPT_STORE_TTL_SECONDS", 7 * 24 * 3600))
+# Minimum cosine similarity for a hit, on generated / precomputed entries
+_SIMILARITY = float(os.environ.get("SCRIPT_STORE_SIMILARITY", 0.95))
+_FOLLOW_UP_SIMILARITY = float(os.environ.get("SCRIPT_STORE_FOLLOW_UP_SIMILARITY", 0.8))
+# A claim outlives any single generation; a crashed worker's claim expires
+_CLAIM_TTL_SECONDS = 300
+
+
+def scripts_key(fingerprint: str) -> str:
+    return f"scripts:{fingerprint}"
+
+
+def _field(kind: str, text: str) -> str:
+    normalised = " ".join(text.casefold().split())
+    return f"{kind}:{hashlib.sha256(normalised.encode('utf-8')).hexdigest()}"
+
+
+def _claim_key(fingerprint: str, kind: str, text: str) -> str:
+    return f"{scripts_key(fingerprint)}:claim:{_field(kind, text)}"
+
+
+def _encode(text: str, vector: Sequence[float], sentences: List[str], precomputed: bool) -> str:
+    packed = base64.b64encode(np.asarray(vector, dtype=np.float32).tobytes()).decode("ascii")
+    return json.dumps(
+        {"text": text, "vector": packed, "sentences": sentences, "precomputed": precomputed}, ensure_ascii=False
+    )
+
+
+def _best_match(entries: Dict[str, str], kind: str, vector: Sequence[float]) -> List[str] | None:
+    """Return the sentences of the ``kind`` entry most similar to ``vector``, if close enough."""
+    query = np.asarray(vector, dtype=np.float32)
+    query_norm = float(np.linalg.norm(query))
+    best, best_margin, best_score = None, 0.0, 0.0
+    for field, value in entries.items():
+        if not field.startswith(f"{kind}:"):
+            continue
+        try:
+            entry = json.loads(value)
+            stored = np.frombuffer(base64.b64decode(entry["vector"]), dtype=np.float32)
+        except (ValueError, KeyError) as exc:
+            logger.warning("script store: skipping unreadable entry %s – %s", field, exc)
+            continue
+        # A different embedding model (fallback) gives vectors of another size
+        if stored.shape != query.shape or not query_norm:
+            continue
+        score = float(stored @ query) / (float(np.linalg.norm(stored)) * query_norm or 1.0)
+        # Compared by how far each clears its own threshold
+        margin = score - (_FOLLOW_UP_SIMILARITY if entry.get("precomputed") else _SIMILARITY)
+        if margin >= best_margin:
+            best, best_margin, best_score = entry, margin, score
+    if best is None:
+        return None
+    logger.info("script store: hit for %s '%s' (similarity %.3f).", kind, best["text"][:60], best_score)
+    return list(best["sentences"])
+
+
+# ---------------------------------------------------------------------------
+# Public API
+# ---------------------------------------------------------------------------
+
+
+@timed_redis("script_lookup")
+def fetch_scripts(redis_client: Any, fingerprint: str) -> Dict[str, str]:
+    """
+    Return the stored entries of a document, for match_script().
+
+    Empty when the store is disabled or unreachable.
+    """
+    if not SCRIPT_STORE_ENABLED:
+        return {}
+    try:
+        return redis_client.hgetall(scripts_key(fingerprint))
+    except redis.RedisError as exc:
+        logger.warning("script store: lookup failed – %s", exc)
+        return {}
+
+
+@timed_redis("script_lookup")
+async def afetch_scripts(redis_client: Any, fingerprint: str) -> Dict[str, str]:
+    """Async variant of fetch_scripts() for a ``redis.asyncio`` client."""
+    if not SCRIPT_STORE_ENABLED:
+        return {}
+    try:
+        return await redis_client.hgetall(scripts_key(fingerprint))
+    except redis.RedisError as exc:
+        logger.warning("script store: lookup failed – %s", exc)
+        return {}
+
+
+def has_scripts(entries: Dict[str, str], kind: str) -> bool:
+    """Return whether fetched ``entries`` hold any ``kind`` entry."""
+    return any(field.startswith(f"{kind}:") for field in entries)
+
+
+def match_script(
+    entries: Dict[str, str], kind: str, text: str, vector: Sequence[float] | None = None
+) -> List[str] | None:
+    """
+    Return the sentences of the fetched entry stored for ``text``, or else
+    of the one most similar to ``vector`` (see the module docstring), or None.
+
+    Args:
+        entries: fetch_scripts() of the document.
+        kind:    "teach" or "question".
+        text:    Topic / question.
+        vector:  Its embedding; None matches ``text`` exactly only.
+    """
+    if not SCRIPT_STORE_ENABLED:
+        return None
+    sentences = None
+    exact = entries.get(_field(kind, text))
+    if exact is not None:
+        try:
+            sentences = list(json.loads(exact)["sentences"])
+        except (ValueError, KeyError) as exc:
+            logger.warning("script store: skipping unreadable entry for '%s' – %s", text[:60], exc)
+    if sentences is None and vector is not None:
+        sentences = _best_match(entries, kind, vector)
+    record_cache_lookup("script", hit=sentences is not None)
+    return sentences
+
+
+@timed_redis("script_save")
+def save_script(
+    redis_client: Any,
+    fingerprint: str,
+    kind: str,
+    text: str,
+    vector: Sequence[float],
+    sentences: List[str],
+    precomputed: bool = False,
+) -> None:
+    """
+    Store the sentences generated for ``text`` and release its claim.
+
+    Args:
+        precomputed: True for speculative answers (precompute.py), matched
+                     with the lower SCRIPT_STORE_FOLLOW_UP_SIMILARITY.
+    """
+    if not SCRIPT_STORE_ENABLED or not sentences:
+        return
+    key = scripts_key(fingerprint)
+    try:
+        pipe = redis_client.pipeline()
+        pipe.hset(key, _field(kind, text), _encode(text, vector, sentences, precomputed))
+        pipe.expire(key, _TTL_SECONDS)
+        pipe.delete(_claim_key(fingerprint, kind, text))
+        pipe.execute()
+    except redis.RedisError as exc:
+        logger.warning("script store: save failed – %s", exc)
+
+
+@timed_redis("script_save")
+async def asave_script(
+    redis_client: Any,
+    fingerprint: str,
+    kind: str,
+    text: str,
+    vector: Sequence[float],
+    sentences: List[str],
+    precomputed: bool = False,
+) -> None:
+    """Async variant of save_script()."""
+    if not SCRIPT_STORE_ENABLED or not sentences:
+        return
+    key = scripts_key(fingerprint)
+    try:
+        pipe = redis_client.pipeline()
+        pipe.hset(key, _field(kind, text), _encode(text, vector, sentences, precomputed))
+        pipe.expire(key, _TTL_SECONDS)
+        pipe.delete(_claim_key(fingerprint, kind, text))
+        await pipe.execute()
+    except redis.RedisError as exc:
+        logger.warning("script store: save failed – %s", exc)
+
+
+@timed_redis("script_claim")
+def claim_script(redis_client: Any, fingerprint: str, kind: str, text: str) -> bool:
+    """
+    Reserve the generation of the entry for ``text``.
+
+    Returns:
+        False if the entry is already stored or another worker holds the
+        claim (or the store is disabled / unreachable).
+    """
+    if not SCRIPT_STORE_ENABLED:
+        return False
+    try:
+        if redis_client.hexists(scripts_key(fingerprint), _field(kind, text)):
+            return False
+        return bool(redis_client.set(_claim_key(fingerprint, kind, text), "1", nx=True, ex=_CLAIM_TTL_SECONDS))
+    except redis.RedisError as exc:
+        logger.warning("script store: claim failed – %s", exc)
+        return False
+
+
+def release_script_claim(redis_client: Any, fingerprint: str, kind: str, text: str) -> None:
+    """Drop a claim whose generation failed, so another worker may retry."""
+    try:
+        redis_client.delete(_claim_key(fingerprint, kind, text))
+    except redis.RedisError as exc:
+        logger.warning("script store: could not release claim – %s", exc)
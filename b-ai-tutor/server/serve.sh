@@ -0,0 +1,53 @@
+#!/usr/bin/env bash
+set -euo pipefail
+
+# Production entry point: the async API (asgi_app.py) under uvicorn with
+# several worker processes, plus the ingest worker pool.
+ROOT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+VENV_DIR="$ROOT_DIR/venv"
+
+if [ -d "$VENV_DIR" ]; then
+  # shellcheck disable=SC1090
+  source "$VENV_DIR/bin/activate"
+fi
+
+cd "$ROOT_DIR"
+
+PORT=${PORT:-7700}
+# Web worker processes (each runs its own event loop)
+WEB_WORKERS=${WEB_WORKERS:-2}
+# Concurrent connections per web worker before new ones get a 503
+WEB_CONCURRENCY=${WEB_CONCURRENCY:-1000}
+INGEST_WORKERS=${INGEST_WORKERS:-2}
+
+# Shared sample files so /metrics aggregates every web and ingest process;
+# stale files from a previous run would be summed in, so start empty
+export PROMETHEUS_MULTIPROC_DIR=${PROMETHEUS_MULTIPROC_DIR:-/tmp/ai-tutor-metrics}
+rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+
+INGEST_PID=""
+if [ "$INGEST_WORKERS" -gt 0 ]; then
+  python ingest_worker.py &
+  INGEST_PID=$!
+fi
+
+uvicorn asgi_app:app \
+  --host 0.0.0.0 \
+  --port "$PORT" \
+  --workers "$WEB_WORKERS" \
+  --limit-concurrency "$WEB_CONCURRENCY" \
+  --timeout-keep-alive 30 &
+WEB_PID=$!
+
+# SIGINT lets the ingest workers finish their atexit shutdown
+shutdown() {
+  kill -TERM "$WEB_PID" 2>/dev/null || true
+  if [ -n "$INGEST_PID" ]; then
+    kill -INT "$INGEST_PID" 2>/dev/null || true
+  fi
+  wait
+}
+trap shutdown TERM INT
+
+wait "$WEB_PID"
@@ -0,0 +1,939 @@
+"""
+Redis-backed session state shared by the web app and the ingest workers.
+
+Keys (all expire with the session):
+  session:<id>:queue           – sentences waiting to be spoken (list)
+  session:<id>:meta            – topic, filename, store_path, fingerprint (hash)
+  session:<id>:status          – ingest pipeline status and stage (hash)
+  session:<id>:question_count  – number of questions asked so far
+  session:<id>:generating      – > 0 while more sentences are on their way
+
+Index directories are protected from garbage collection (document_index.py)
+while a question is using them:
+  index:<name>:leases          – sessions that recently asked a question (zset)
+  index:<name>:gc              – set while GC is deleting the directory
+
+The helpers here take the Redis client as an argument so that the Flask
+app and the ingest worker processes can each use their own connection.
+
+queue_answer() is the single entry point for answering into a session
+queue: it serves semantically repeated requests from the answer cache
+(answer_cache.py) or the cross-process store of teaching monologues and
+precomputed follow-up answers (script_store.py), and otherwise streams or
+blocks per STREAM_ANSWERS.
+
+Functions prefixed with ``a`` are the asyncio variants used by asgi_app.py;
+they take a ``redis.asyncio`` client.
+"""
+
+import logging
+import os
+import re
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Tuple
+
+import redis
+import redis.asyncio
+from redis.commands.core import AsyncScript, Script
+
+from answer_cache import get_answer_cache
+from metrics import timed_redis
+from script_store import afetch_scripts, asave_script, fetch_scripts, has_scripts, match_script, save_script
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# Constants
+# ---------------------------------------------------------------------------
+
+# Session keys (queue, meta, counters) expire after one hour
+SESSION_TTL = 3600
+# Safety TTL on the "generating" counter in case a worker dies mid-answer
+GENERATING_TTL = 300
+# An admitted question keeps its index directory safe from GC this long
+INDEX_LEASE_TTL = 120
+# Push sentences as the LLM streams them instead of after the full answer
+STREAM_ANSWERS = os.environ.get("STREAM_ANSWERS", "1") in ("1", "true", "True")
+# BLPOP slice length; between slices the "generating" flag is re-checked so
+# a finished answer ends the wait early instead of running to the timeout.
+BLPOP_SLICE_SECONDS = 2
+
+
+def queue_key(session_id: str) -> str:
+    return f"session:{session_id}:queue"
+
+
+def meta_key(session_id: str) -> str:
+    return f"session:{session_id}:meta"
+
+
+def status_key(session_id: str) -> str:
+    return f"session:{session_id}:status"
+
+
+def generating_key(session_id: str) -> str:
+    return f"session:{session_id}:generating"
+
+
+def question_count_key(session_id: str) -> str:
+    return f"session:{session_id}:question_count"
+
+
+def index_lease_key(name: str) -> str:
+    """Leases on the index directory ``name`` (last path component of store_path)."""
+    return f"index:{name}:leases"
+
+
+def index_claim_key(name: str) -> str:
+    """Set by the garbage collector while it deletes the index directory ``name``."""
+    return f"index:{name}:gc"
+
+
+def ip_slot_key(ip: str) -> str:
+    """Key recording that an IP has used its one free session."""
+    return f"rate_limit:ip:{ip}"
+
+
+# ---------------------------------------------------------------------------
+# Redis connection
+# ---------------------------------------------------------------------------
+
+
+def _redis_options() -> Dict[str, Any]:
+    """Connection settings from REDIS_HOST / REDIS_PORT / REDIS_DB / REDIS_PASSWORD."""
+    return {
+        "host": os.environ.get("REDIS_HOST", "localhost"),
+        "port": int(os.environ.get("REDIS_PORT", 6379)),
+        "db": int(os.environ.get("REDIS_DB", 0)),
+        "password": os.environ.get("REDIS_PASSWORD") or None,
+        "decode_responses": True,
+    }
+
+
+def create_redis_client() -> redis.Redis:
+    """Build a Redis client from REDIS_HOST / REDIS_PORT / REDIS_DB / REDIS_PASSWORD."""
+    client = redis.Redis(**_redis_options())
+    logger.info(
+        "Redis client configured at %s:%s (db=%s).",
+        os.environ.get("REDIS_HOST", "localhost"),
+        os.environ.get("REDIS_PORT", 6379),
+        os.environ.get("REDIS_DB", 0),
+    )
+    return client
+
+
+def create_async_redis_client() -> redis.asyncio.Redis:
+    """Build an asyncio Redis client for the same instance (used by asgi_app.py)."""
+    return redis.asyncio.Redis(**_redis_options())
+
+
+def redis_storage_uri() -> str:
+    """
+    Return the storage URI of the rate limiters (flask-limiter / limits).
+
+    RATELIMIT_STORAGE_URI overrides it (e.g. "memory://" for benchmarks
+    and other runs without a Redis server); the default is the redis:// URI
+    of the same instance.
+    """
+    override = os.environ.get("RATELIMIT_STORAGE_URI")
+    if override:
+        return override
+    return (
+        f"redis://:{os.environ.get('REDIS_PASSWORD', '')}@"
+        f"{os.environ.get('REDIS_HOST', 'localhost')}:"
+        f"{os.environ.get('REDIS_PORT', 6379)}/"
+        f"{os.environ.get('REDIS_DB', 0)}"
+    )
+
+
+# ---------------------------------------------------------------------------
+# Sentence utilities
+# ---------------------------------------------------------------------------
+
+
+def split_into_sentences(text: str) -> List[str]:
+    """Split a block of text into individual, non-trivial sentences."""
+    # Split on sentence-ending punctuation followed by whitespace
+    parts = re.split(r'(?<=[.!?])\s+', text.strip())
+    return [s.strip() for s in parts if s.strip() and len(s.strip()) > 10]
+
+
+def answer_sentences(text: str) -> List[str]:
+    """Split a complete answer into sentences to queue – never none, however short."""
+    return split_into_sentences(text) or [text.strip()]
+
+
+def teaching_query(topic: str) -> str:
+    """Return the RAG query that produces the opening teaching monologue."""
+    return (
+        f"You are an enthusiastic and clear AI tutor. "
+        f"Explain '{topic}' in 8 to 10 engaging, complete sentences "
+        f"that a student would enjoy listening to."
+    )
+
+
+# ---------------------------------------------------------------------------
+# Queue and generation state
+# ---------------------------------------------------------------------------
+
+
+# Each request-path operation on a session is a single round trip to
+# Redis: multi-value RPUSH + EXPIRE in one pipeline, and Lua scripts for the
+# read-modify-write steps so they are atomic as well.
+
+# KEYS: queue, generating counter.  ARGV: max sentences to pop.
+# Returns {{sentence, ...}, remaining queue length, generating counter}.
+# LPOP with a count needs Redis >= 6.2.
+_POP_SENTENCES_LUA = """
+local sentences = redis.call('LPOP', KEYS[1], ARGV[1]) or {}
+local generating = tonumber(redis.call('GET', KEYS[2]) or '0')
+return {sentences, redis.call('LLEN', KEYS[1]), generating}
+"""
+
+# KEYS: session meta, question counter.  ARGV: max questions, counter TTL,
+# lease expiry (unix time), lease TTL, then the index_lease_key() and
+# index_claim_key() of an index named "%s".
+# Returns {verdict, {meta field, value, ...}}; the counter is only
+# incremented when the verdict is "ok".  An admitted question also leases
+# the session's index directory so the garbage collector cannot delete it
+# while the question loads it; an index already being deleted reports the
+# session as missing.  The index keys are derived from the session's
+# store_path here, so admission stays one round trip.
+_ADMIT_QUESTION_LUA = """
+local meta = redis.call('HGETALL', KEYS[1])
+if #meta == 0 then
+  return {'missing', meta}
+end
+local store_path = redis.call('HGET', KEYS[1], 'store_path') or ''
+-- The index directory's name: the last component of store_path
+local name = string.match(store_path, '([^/]+)/*$')
+if not name then
+  return {'not_ready', meta}
+end
+if redis.call('EXISTS', string.format(ARGV[6], name)) == 1 then
+  return {'missing', {}}
+end
+if tonumber(redis.call('GET', KEYS[2]) or '0') >= tonumber(ARGV[1]) then
+  return {'limit', meta}
+end
+local leases = string.format(ARGV[5], name)
+redis.call('INCR', KEYS[2])
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+redis.call('ZADD', leases, ARGV[3], KEYS[1])
+redis.call('EXPIRE', leases, ARGV[4])
+return {'ok', meta}
+"""
+
+# Registered once; each call passes its client.  Scripts are given as bytes
+# so no client encoder is needed to hash them.
+_POP_SENTENCES = Script(None, _POP_SENTENCES_LUA.encode())
+_ADMIT_QUESTION = Script(None, _ADMIT_QUESTION_LUA.encode())
+_APOP_SENTENCES = AsyncScript(None, _POP_SENTENCES_LUA.encode())
+_AADMIT_QUESTION = AsyncScript(None, _ADMIT_QUESTION_LUA.encode())
+
+# admit_question() verdicts
+QUESTION_OK = "ok"
+SESSION_MISSING = "missing"
+SESSION_NOT_READY = "not_ready"
+QUESTION_LIMIT_REACHED = "limit"
+
+
+@timed_redis("queue_sentences")
+def queue_sentences(redis_client: Any, session_id: str, sentences: List[str]) -> None:
+    """Append sentences to the session queue and refresh its TTL (one round trip)."""
+    if not sentences:
+        return
+    key = queue_key(session_id)
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.rpush(key, *sentences)
+    pipe.expire(key, SESSION_TTL)
+    pipe.execute()
+
+
+@timed_redis("pop_sentences")
+def pop_sentences(
+    redis_client: Any, session_id: str, count: int = 1
+) -> Tuple[List[str], int, bool]:
+    """
+    Atomically pop up to ``count`` sentences from the head of a session queue.
+
+    Returns:
+        (popped sentences, possibly empty; sentences left in the queue;
+        whether an answer is still being generated).
+    """
+    return _pop_result(_POP_SENTENCES(_pop_keys(session_id), [count], client=redis_client))
+
+
+@timed_redis("admit_question")
+def admit_question(
+    redis_client: Any, session_id: str, max_questions: int
+) -> Tuple[str, Dict[str, str]]:
+    """
+    Validate a session for a new question and count it, atomically.
+
+    The question counter is incremented only when the session exists, its
+    index is ready and fewer than ``max_questions`` were asked.
+
+    An admitted question also leases the session's index directory for
+    INDEX_LEASE_TTL seconds, so GC never deletes it mid-load.
+
+    Returns:
+        (verdict, session meta) where verdict is QUESTION_OK,
+        SESSION_MISSING, SESSION_NOT_READY or QUESTION_LIMIT_REACHED.
+    """
+    return _admit_result(_ADMIT_QUESTION(_admit_keys(session_id), _admit_args(max_questions), client=redis_client))
+
+
+def _pop_keys(session_id: str) -> List[str]:
+    return [queue_key(session_id), generating_key(session_id)]
+
+
+def _admit_keys(session_id: str) -> List[str]:
+    return [meta_key(session_id), question_count_key(session_id)]
+
+
+def _admit_args(max_questions: int) -> List[Any]:
+    return [
+        max_questions,
+        SESSION_TTL,
+        time.time() + INDEX_LEASE_TTL,
+        INDEX_LEASE_TTL,
+        index_lease_key("%s"),
+        index_claim_key("%s"),
+    ]
+
+
+def _pop_result(raw: List[Any]) -> Tuple[List[str], int, bool]:
+    sentences, remaining, generating = raw
+    return list(sentences), int(remaining), int(generating) > 0
+
+
+def _admit_result(raw: List[Any]) -> Tuple[str, Dict[str, str]]:
+    verdict, flat = raw
+    return verdict, dict(zip(flat[::2], flat[1::2]))
+
+
+@timed_redis("is_generating")
+def is_generating(redis_client: Any, session_id: str) -> bool:
+    """Return True while more sentences for this session are on their way."""
+    return int(redis_client.get(generating_key(session_id)) or 0) > 0
+
+
+@timed_redis("begin_generation")
+def begin_generation(redis_client: Any, session_id: str, ttl: int = GENERATING_TTL) -> None:
+    """
+    Mark that sentences are being produced for this session.
+
+    /next keeps reporting done=false on an empty queue until the matching
+    end_generation() call (or until ``ttl`` expires).
+    """
+    key = generating_key(session_id)
+    pipe = redis_client.pipeline()
+    pipe.incr(key)
+    pipe.expire(key, ttl)
+    pipe.execute()
+
+
+@timed_redis("end_generation")
+def end_generation(redis_client: Any, session_id: str) -> None:
+    """Undo one begin_generation() call."""
+    key = generating_key(session_id)
+    if redis_client.decr(key) <= 0:
+        redis_client.delete(key)
+
+
+# ---------------------------------------------------------------------------
+# Session creation and sentence delivery (web apps)
+# ---------------------------------------------------------------------------
+
+
+@timed_redis("ip_slot_used")
+def ip_slot_used(redis_client: Any, ip: str) -> bool:
+    """Non-atomic fast check: return True if this IP has already consumed its upload slot."""
+    return redis_client.exists(ip_slot_key(ip)) == 1
+
+
+@timed_redis("claim_ip_slot")
+def claim_ip_slot(redis_client: Any, ip: str) -> bool:
+    """
+    Atomically claim the one-time upload slot for this IP.
+
+    Uses Redis SET NX so that two concurrent requests from the same IP cannot
+    both pass the rate-limit check before either records the usage — the
+    classic TOCTOU race that the old check-then-set pattern suffered from.
+
+    This must be called AFTER input validation but BEFORE any Gemini API call
+    so that:
+      - A user with an invalid file can correct and retry without losing their slot.
+      - A transient Gemini error does not leave the slot open for unlimited retries.
+
+    Returns:
+        True  – slot was just claimed (request is allowed to proceed).
+        False – key already existed (request must be rejected).
+    """
+    # SET NX returns True when the key is newly written, None otherwise.
+    return redis_client.set(ip_slot_key(ip), "1", nx=True) is True
+
+
+@timed_redis("create_session")
+def create_session(redis_client: Any, topic: str, filename: str, pending_ttl: int) -> str:
+    """
+    Create the meta hash of a new session and return its id.
+
+    store_path / fingerprint are added by the ingest worker once the index
+    exists.  The session is marked as generating for up to ``pending_ttl``
+    seconds, so /next does not report "done" before the monologue is queued.
+    """
+    session_id = str(uuid.uuid4())
+    key = meta_key(session_id)
+    pipe = redis_client.pipeline()
+    pipe.hset(key, mapping={"topic": topic, "filename": filename})
+    pipe.expire(key, SESSION_TTL)
+    pipe.execute()
+    begin_generation(redis_client, session_id, ttl=pending_ttl)
+    return session_id
+
+
+def wait_for_sentence(redis_client: Any, session_id: str, timeout: float) -> str | None:
+    """
+    Block until a sentence lands in the session queue or ``timeout`` expires.
+
+    Uses BLPOP so no Redis traffic is generated while waiting.  Returns
+    early (None) once the queue is empty and no answer is being generated.
+    """
+    key = queue_key(session_id)
+    deadline = time.monotonic() + timeout
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return None
+        item = redis_client.blpop([key], timeout=min(remaining, BLPOP_SLICE_SECONDS))
+        if item:
+            return item[1]
+        if not is_generating(redis_client, session_id):
+            # The last sentence may have been pushed just before the flag cleared
+            return redis_client.lpop(key)
+
+
+def next_sentences(
+    redis_client: Any, session_id: str, count: int, wait: float
+) -> Tuple[List[str], int, bool]:
+    """
+    Pop up to ``count`` sentences, long-polling up to ``wait`` seconds for
+    the first one while an answer is still being generated.
+
+    Returns:
+        Same as pop_sentences(), except that a single long-polled sentence
+        reports 0 remaining without counting the queue again.
+    """
+    sentences, remaining, generating = pop_sentences(redis_client, session_id, count)
+    if sentences or not wait or not generating:
+        return sentences, remaining, generating
+    sentence = wait_for_sentence(redis_client, session_id, wait)
+    if not sentence:
+        return [], 0, is_generating(redis_client, session_id)
+    if count == 1:
+        # The queue is not counted again for a single sentence
+        return [sentence], 0, True
+    # Fill the rest of the batch with whatever arrived alongside it
+    more, remaining, generating = pop_sentences(redis_client, session_id, count - 1)
+    return [sentence, *more], remaining, generating
+
+
+# ---------------------------------------------------------------------------
+# Answer generation → session queue
+# ---------------------------------------------------------------------------
+
+
+def queue_answer(
+    redis_client: Any,
+    session_id: str,
+    vector_store: Any,
+    query: str,
+    cache_key: Tuple[str, str, str] | None = None,
+    on_sentence: Callable[[int], None] | None = None,
+) -> int:
+    """
+    Queue the answer to ``query``, from the answer cache when possible.
+
+    Args:
+        cache_key:   (document fingerprint, kind, text) – ``text`` is what
+                     is embedded for the similarity lookup (the question,
+                     or the topic for the teaching monologue).  Looked up
+                     in the process's answer cache, exact repeats first,
+                     then in the shared script store.  Questions retrieved
+                     without an embedding are matched as exact repeats
+                     only.  None skips both.
+        on_sentence: Called with the running total after each queued sentence.
+
+    Returns:
+        Number of sentences queued.
+
+    Raises:
+        Exception: If retrieval or generation fails.
+    """
+    cached = bool(cache_key and cache_key[0])
+    vector = None
+    if cached:
+        fingerprint, kind, text = cache_key
+        sentences, vector = _lookup_answer(redis_client, vector_store, query, fingerprint, kind, text)
+        if sentences:
+            queue_sentences(redis_client, session_id, sentences)
+            if on_sentence is not None:
+                on_sentence(len(sentences))
+            return len(sentences)
+
+    # A question is its own cache text, so its vector also serves retrieval
+    query_vector = vector if cached and text == query else None
+    collected: List[str] = []
+    if STREAM_ANSWERS:
+        count = stream_answer_into_queue(
+            redis_client, session_id, vector_store, query, on_sentence,
+            collected=collected, query_vector=query_vector,
+        )
+    else:
+        count = queue_answer_blocking(
+            redis_client, session_id, vector_store, query, collected=collected, query_vector=query_vector
+        )
+        if on_sentence is not None:
+            on_sentence(count)
+
+    if cached and any(collected):
+        _store_answer(redis_client, fingerprint, kind, text, vector, collected)
+    return count
+
+
+def queue_answer_blocking(
+    redis_client: Any,
+    session_id: str,
+    vector_store: Any,
+    query: str,
+    collected: List[str] | None = None,
+    query_vector: List[float] | None = None,
+) -> int:
+    """
+    Generate the full answer, then queue its sentences.
+
+    Args:
+        collected:    Optional list that receives the queued sentences.
+        query_vector: Optional precomputed embedding of ``query``.
+
+    Returns:
+        Number of sentences queued.
+    """
+    qa_result = vector_store.query_with_sources(query, query_vector=query_vector)
+    sentences = answer_sentences(qa_result.get("answer", ""))
+
+    queue_sentences(redis_client, session_id, sentences)
+    if collected is not None:
+        collected.extend(sentences)
+    return len(sentences)
+
+
+def stream_answer_into_queue(
+    redis_client: Any,
+    session_id: str,
+    vector_store: Any,
+    query: str,
+    on_sentence: Callable[[int], None] | None = None,
+    collected: List[str] | None = None,
+    query_vector: List[float] | None = None,
+) -> int:
+    """
+    Consume the streamed answer and queue each sentence as soon as it is complete.
+
+    Args:
+        on_sentence:  Called with the running total after each queued sentence.
+        collected:    Optional list that receives the queued sentences.
+        query_vector: Optional precomputed embedding of ``query``.
+
+    Returns:
+        Number of sentences queued.
+
+    Raises:
+        Exception: If retrieval or generation fails.
+    """
+    stream = _SentenceStream(on_sentence)
+    for piece in vector_store.query_with_sources_stream(query, query_vector=query_vector):
+        speakable = stream.add(piece)
+        if speakable:
+            queue_sentences(redis_client, session_id, speakable)
+            stream.queued(speakable)
+    fallback = stream.fallback()
+    if fallback:
+        queue_sentences(redis_client, session_id, fallback)
+        stream.queued(fallback)
+
+    if collected is not None:
+        collected.extend(stream.sentences)
+    logger.info("stream: '%s' → %d sentences queued.", session_id, len(stream.sentences))
+    return len(stream.sentences)
+
+
+def _lookup_answer(
+    redis_client: Any, vector_store: Any, query: str, fingerprint: str, kind: str, text: str
+) -> Tuple[List[str] | None, List[float] | None]:
+    """
+    Look up the answer to ``query`` in the answer cache and the script store.
+
+    Returns:
+        (sentences or None, embedding of ``text`` or None if not embedded).
+    """
+    sentences = _cached_by_text(fingerprint, kind, text)
+    if sentences:
+        return sentences, None
+
+    scripts = None
+    if not _wants_vector(vector_store, query, kind):
+        # Precomputed follow-up answers (precompute.py) are matched by embedding
+        scripts = fetch_scripts(redis_client, fingerprint)
+    vector = None
+    if scripts is None or has_scripts(scripts, kind):
+        try:
+            vector = vector_store.embed_query(text)
+        except Exception as exc:
+            logger.warning("answer cache: could not embed %s '%s' – %s", kind, text[:60], exc)
+
+    sentences = _cached_by_vector(fingerprint, kind, vector)
+    if not sentences:
+        # Generated by another process, or precomputed
+        if scripts is None:
+            scripts = fetch_scripts(redis_client, fingerprint)
+        sentences = _adopt_script(scripts, fingerprint, kind, text, vector)
+    return sentences, vector
+
+
+def _store_answer(
+    redis_client: Any, fingerprint: str, kind: str, text: str, vector: List[float] | None, sentences: List[str]
+) -> None:
+    """Cache a generated answer; teaching monologues also go to the script store."""
+    if _cache_answer(fingerprint, kind, text, vector, sentences):
+        save_script(redis_client, fingerprint, kind, text, vector, sentences)
+
+
+# ---------------------------------------------------------------------------
+# Answer helpers shared by the sync and async paths
+# ---------------------------------------------------------------------------
+
+
+class _SentenceStream:
+    """
+    Speakable sentences of a streamed answer, in queueing order.
+
+    add() splits each streamed piece; the caller queues what it returns and
+    reports it with queued().  Once the stream ends, fallback() returns what
+    to queue so the queue is never left empty – the same rule as
+    answer_sentences() for a blocking answer.
+    """
+
+    def __init__(self, on_sentence: Callable[[int], None] | None = None) -> None:
+        self.sentences: List[str] = []
+        self._skipped: List[str] = []
+        self._on_sentence = on_sentence
+
+    def add(self, piece: str) -> List[str]:
+        speakable = split_into_sentences(piece)
+        if not speakable:
+            self._skipped.append(piece)
+        return speakable
+
+    def queued(self, sentences: List[str]) -> None:
+        self.sentences.extend(sentences)
+        if self._on_sentence is not None:
+            self._on_sentence(len(self.sentences))
+
+    def fallback(self) -> List[str]:
+        if self.sentences:
+            return []
+        return [" ".join(self._skipped).strip()]
+
+
+def _wants_vector(vector_store: Any, query: str, kind: str) -> bool:
+    """
+    Return whether a lookup embeds its text whatever the store holds: when
+    retrieval needs the vector anyway, or for teaching monologues, whose
+    shared scripts are matched by embedding.
+    """
+    return kind == "teach" or vector_store.needs_query_embedding(query)
+
+
+def _cached_by_text(fingerprint: str, kind: str, text: str) -> List[str] | None:
+    """Return the answer cached for an exact repeat of ``text``, if any."""
+    cache = get_answer_cache()
+    return cache.lookup_text(fingerprint, kind, text) if cache is not None else None
+
+
+def _cached_by_vector(fingerprint: str, kind: str, vector: List[float] | None) -> List[str] | None:
+    """Return the cached answer to a similar ``text``, if any; None ``vector`` records a miss."""
+    cache = get_answer_cache()
+    return cache.lookup(fingerprint, kind, vector) if cache is not None else None
+
+
+def _adopt_script(
+    scripts: Dict[str, Any], fingerprint: str, kind: str, text: str, vector: List[float] | None
+) -> List[str] | None:
+    """Match ``text`` against the fetched shared scripts, caching a hit locally."""
+    sentences = match_script(scripts, kind, text, vector)
+    cache = get_answer_cache()
+    if sentences and cache is not None:
+        cache.store(fingerprint, kind, text, vector, sentences)
+    return sentences
+
+
+def _cache_answer(
+    fingerprint: str, kind: str, text: str, vector: List[float] | None, sentences: List[str]
+) -> bool:
+    """
+    Cache a generated answer in this process.
+
+    Returns:
+        True if it also belongs in the shared script store: teaching
+        monologues are shared with every process (script_store.py).
+    """
+    cache = get_answer_cache()
+    if cache is not None:
+        cache.store(fingerprint, kind, text, vector, sentences)
+    return kind == "teach" and vector is not None
+
+
+# ---------------------------------------------------------------------------
+# Async variants (asgi_app.py)
+# ---------------------------------------------------------------------------
+
+
+@timed_redis("queue_sentences")
+async def aqueue_sentences(redis_client: Any, session_id: str, sentences: List[str]) -> None:
+    """Async variant of queue_sentences()."""
+    if not sentences:
+        return
+    key = queue_key(session_id)
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.rpush(key, *sentences)
+    pipe.expire(key, SESSION_TTL)
+    await pipe.execute()
+
+
+@timed_redis("pop_sentences")
+async def apop_sentences(
+    redis_client: Any, session_id: str, count: int = 1
+) -> Tuple[List[str], int, bool]:
+    """Async variant of pop_sentences()."""
+    return _pop_result(await _APOP_SENTENCES(_pop_keys(session_id), [count], client=redis_client))
+
+
+@timed_redis("admit_question")
+async def aadmit_question(
+    redis_client: Any, session_id: str, max_questions: int
+) -> Tuple[str, Dict[str, str]]:
+    """Async variant of admit_question()."""
+    return _admit_result(
+        await _AADMIT_QUESTION(_admit_keys(session_id), _admit_args(max_questions), client=redis_client)
+    )
+
+
+@timed_redis("is_generating")
+async def ais_generating(redis_client: Any, session_id: str) -> bool:
+    """Async variant of is_generating()."""
+    return int(await redis_client.get(generating_key(session_id)) or 0) > 0
+
+
+@timed_redis("begin_generation")
+async def abegin_generation(redis_client: Any, session_id: str, ttl: int = GENERATING_TTL) -> None:
+    """Async variant of begin_generation()."""
+    key = generating_key(session_id)
+    pipe = redis_client.pipeline()
+    pipe.incr(key)
+    pipe.expire(key, ttl)
+    await pipe.execute()
+
+
+@timed_redis("end_generation")
+async def aend_generation(redis_client: Any, session_id: str) -> None:
+    """Async variant of end_generation()."""
+    key = generating_key(session_id)
+    if await redis_client.decr(key) <= 0:
+        await redis_client.delete(key)
+
+
+@timed_redis("ip_slot_used")
+async def aip_slot_used(redis_client: Any, ip: str) -> bool:
+    """Async variant of ip_slot_used()."""
+    return await redis_client.exists(ip_slot_key(ip)) == 1
+
+
+@timed_redis("claim_ip_slot")
+async def aclaim_ip_slot(redis_client: Any, ip: str) -> bool:
+    """Async variant of claim_ip_slot()."""
+    return await redis_client.set(ip_slot_key(ip), "1", nx=True) is True
+
+
+@timed_redis("create_session")
+async def acreate_session(redis_client: Any, topic: str, filename: str, pending_ttl: int) -> str:
+    """Async variant of create_session()."""
+    session_id = str(uuid.uuid4())
+    key = meta_key(session_id)
+    pipe = redis_client.pipeline()
+    pipe.hset(key, mapping={"topic": topic, "filename": filename})
+    pipe.expire(key, SESSION_TTL)
+    await pipe.execute()
+    await abegin_generation(redis_client, session_id, ttl=pending_ttl)
+    return session_id
+
+
+async def await_for_sentence(redis_client: Any, session_id: str, timeout: float) -> str | None:
+    """
+    Async variant of wait_for_sentence().
+
+    BLPOP only suspends the coroutine, so waiting clients cost a Redis
+    connection each but no thread.
+    """
+    key = queue_key(session_id)
+    deadline = time.monotonic() + timeout
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return None
+        item = await redis_client.blpop([key], timeout=min(remaining, BLPOP_SLICE_SECONDS))
+        if item:
+            return item[1]
+        if not await ais_generating(redis_client, session_id):
+            return await redis_client.lpop(key)
+
+
+async def anext_sentences(
+    redis_client: Any, session_id: str, count: int, wait: float
+) -> Tuple[List[str], int, bool]:
+    """Async variant of next_sentences()."""
+    sentences, remaining, generating = await apop_sentences(redis_client, session_id, count)
+    if sentences or not wait or not generating:
+        return sentences, remaining, generating
+    sentence = await await_for_sentence(redis_client, session_id, wait)
+    if not sentence:
+        return [], 0, await ais_generating(redis_client, session_id)
+    if count == 1:
+        return [sentence], 0, True
+    more, remaining, generating = await apop_sentences(redis_client, session_id, count - 1)
+    return [sentence, *more], remaining, generating
+
+
+async def aqueue_answer(
+    redis_client: Any,
+    session_id: str,
+    vector_store: Any,
+    query: str,
+    cache_key: Tuple[str, str, str] | None = None,
+    on_sentence: Callable[[int], None] | None = None,
+) -> int:
+    """
+    Async variant of queue_answer().
+
+    The vector store's index must already be loaded.
+    """
+    cached = bool(cache_key and cache_key[0])
+    vector = None
+    if cached:
+        fingerprint, kind, text = cache_key
+        sentences, vector = await _alookup_answer(redis_client, vector_store, query, fingerprint, kind, text)
+        if sentences:
+            await aqueue_sentences(redis_client, session_id, sentences)
+            if on_sentence is not None:
+                on_sentence(len(sentences))
+            return len(sentences)
+
+    query_vector = vector if cached and text == query else None
+    collected: List[str] = []
+    if STREAM_ANSWERS:
+        count = await astream_answer_into_queue(
+            redis_client, session_id, vector_store, query, on_sentence,
+            collected=collected, query_vector=query_vector,
+        )
+    else:
+        count = await aqueue_answer_blocking(
+            redis_client, session_id, vector_store, query, collected=collected, query_vector=query_vector
+        )
+        if on_sentence is not None:
+            on_sentence(count)
+
+    if cached and any(collected):
+        await _astore_answer(redis_client, fingerprint, kind, text, vector, collected)
+    return count
+
+
+async def aqueue_answer_blocking(
+    redis_client: Any,
+    session_id: str,
+    vector_store: Any,
+    query: str,
+    collected: List[str] | None = None,
+    query_vector: List[float] | None = None,
+) -> int:
+    """Async variant of queue_answer_blocking()."""
+    qa_result = await vector_store.aquery_with_sources(query, query_vector=query_vector)
+    sentences = answer_sentences(qa_result.get("answer", ""))
+
+    await aqueue_sentences(redis_client, session_id, sentences)
+    if collected is not None:
+        collected.extend(sentences)
+    return len(sentences)
+
+
+async def astream_answer_into_queue(
+    redis_client: Any,
+    session_id: str,
+    vector_store: Any,
+    query: str,
+    on_sentence: Callable[[int], None] | None = None,
+    collected: List[str] | None = None,
+    query_vector: List[float] | None = None,
+) -> int:
+    """Async variant of stream_answer_into_queue()."""
+    stream = _SentenceStream(on_sentence)
+    async for piece in vector_store.aquery_with_sources_stream(query, query_vector=query_vector):
+        speakable = stream.add(piece)
+        if speakable:
+            await aqueue_sentences(redis_client, session_id, speakable)
+            stream.queued(speakable)
+    fallback = stream.fallback()
+    if fallback:
+        await aqueue_sentences(redis_client, session_id, fallback)
+        stream.queued(fallback)
+
+    if collected is not None:
+        collected.extend(stream.sentences)
+    logger.info("stream: '%s' → %d sentences queued.", session_id, len(stream.sentences))
+    return len(stream.sentences)
+
+
+async def _alookup_answer(
+    redis_client: Any, vector_store: Any, query: str, fingerprint: str, kind: str, text: str
+) -> Tuple[List[str] | None, List[float] | None]:
+    """Async variant of _lookup_answer()."""
+    sentences = _cached_by_text(fingerprint, kind, text)
+    if sentences:
+        return sentences, None
+
+    scripts = None
+    if not _wants_vector(vector_store, query, kind):
+        scripts = await afetch_scripts(redis_client, fingerprint)
+    vector = None
+    if scripts is None or has_scripts(scripts, kind):
+        try:
+            vector = await vector_store.aembed_query(text)
+        except Exception as exc:
+            logger.warning("answer cache: could not embed %s '%s' – %s", kind, text[:60], exc)
+
+    sentences = _cached_by_vector(fingerprint, kind, vector)
+    if not sentences:
+        if scripts is None:
+            scripts = await afetch_scripts(redis_client, fingerprint)
+        sentences = _adopt_script(scripts, fingerprint, kind, text, vector)
+    return sentences, vector
+
+
+async def _astore_answer(
+    redis_client: Any, fingerprint: str, kind: str, text: str, vector: List[float] | None, sentences: List[str]
+) -> None:
+    """Async variant of _store_answer()."""
+    if _cache_answer(fingerprint, kind, text, vector, sentences):
+        await asave_script(redis_client, fingerprint, kind, text, vector, sentences)
@@ -0,0 +1,453 @@
+"""
+One sharded in-memory vector store serving the vectors of every loaded document.
+
+With the default per-document backend every index directory under
+``faiss_store`` is searched through its own small FAISS index.  With
+INDEX_BACKEND=shared, loading a document instead copies its vectors into a
+process-wide SharedIndex, and the LangChain store handed to VectorStore
+searches them there through a DocumentSlice:
+
+  - vectors live in SHARED_INDEX_SHARDS float32 arenas per dimension; a
+    document's vectors go to one shard as one contiguous block, whose
+    offsets are the document's chunk positions (its docstore ids)
+  - a search scans the document's block alone (``faiss.knn`` on a view of
+    the arena), so it costs the same however many documents the shard holds
+  - adding a document appends its block to the arena; removing one only
+    forgets the block.  The arena is reallocated – doubled, with the freed
+    blocks squeezed out – once it is full or half of it is freed, so adding
+    and removing cost amortised O(vectors of the document), never a rebuild
+    per update
+  - searches take the shard lock only to look up their block, and scan it
+    outside the lock (FAISS releases the GIL).  Arena rows are never reused
+    in place, so a search still holding a view of a reallocated arena
+    keeps reading the rows it looked up
+  - search_batch() answers many searches with one FAISS call per document,
+    so sessions opening the same document (identical uploads share an
+    index, see document_index.py) read its vectors once.  With
+    SHARED_INDEX_BATCH_WAIT_MS > 0 concurrent searches are gathered into
+    such calls: a batch starts at once when no other is running, otherwise
+    waits up to that long for one to finish.  It is off by default: on
+    few cores the thread hand-offs cost more than the shared scans save
+    (see benchmarks/shared_search.py)
+
+The index directories stay the durable storage: a document enters the
+shared index when it is loaded and leaves it when the index cache drops it
+(idle, least recently used, changed on disk or collected, see
+index_cache.py), so INDEX_CACHE_MAX_BYTES also bounds the shared index
+(arenas hold up to twice their live vectors).  Only flat float32 L2
+indexes are shared.  Their vectors are copied to the heap of every
+process, whereas per-document indexes are memory-mapped and their pages
+shared between processes, so the backend suits few large processes (the
+ASGI app) rather than many web workers.  Compressed indexes
+(FAISS_INDEX_FACTORY) keep being searched on their own, memory-mapped and
+compressed.  A store whose document was dropped while still in use keeps
+answering from its memory-mapped index.
+
+Typical usage::
+
+    vectorstore = load_index_dir(path, embeddings)
+    if SHARED_INDEX_ENABLED:
+        vectorstore = share_index(vectorstore)
+    get_index_cache().put(path, vectorstore, on_remove=vectorstore.index.release)
+"""
+
+import copy
+import itertools
+import logging
+import os
+import threading
+from collections import defaultdict
+from typing import Any, Dict, List, Sequence, Tuple
+
+import faiss
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# Constants
+# ---------------------------------------------------------------------------
+
+# "per_document" (one FAISS index per directory) or "shared"
+_INDEX_BACKEND = os.environ.get("INDEX_BACKEND", "per_document")
+SHARED_INDEX_ENABLED = _INDEX_BACKEND == "shared"
+_SHARDS = int(os.environ.get("SHARED_INDEX_SHARDS", 8))
+# Longest a search waits for a running batch, gathering others to share its
+# FAISS call (0 disables batching)
+_BATCH_WAIT_SECONDS = float(os.environ.get("SHARED_INDEX_BATCH_WAIT_MS", 0)) / 1000
+_BATCH_MAX = int(os.environ.get("SHARED_INDEX_BATCH_MAX", 64))
+# Rows of a shard's first arena
+_MIN_ARENA_ROWS = 1024
+
+
+class _Shard:
+    """
+    A float32 arena of document blocks.  Rows below ``size`` are never
+    rewritten while the arena is in use; the lock guards the block table.
+    """
+
+    __slots__ = ("arena", "size", "freed", "blocks", "lock")
+
+    def __init__(self, dimension: int) -> None:
+        self.arena = np.empty((0, dimension), dtype=np.float32)
+        # Rows handed out so far, and how many of them belong to removed blocks
+        self.size = 0
+        self.freed = 0
+        # slot → (first row, rows) of the document's block
+        self.blocks: Dict[int, Tuple[int, int]] = {}
+        self.lock = threading.Lock()
+
+    def block(self, slot: int) -> np.ndarray:
+        """Return a view of the vectors of ``slot`` (lock held)."""
+        start, rows = self.blocks[slot]
+        return self.arena[start : start + rows]
+
+    def append(self, slot: int, vectors: np.ndarray) -> None:
+        """Store ``vectors`` as the block of ``slot`` (lock held)."""
+        rows = len(vectors)
+        if self.size + rows > len(self.arena):
+            self._reallocate(rows)
+        self.arena[self.size : self.size + rows] = vectors
+        self.blocks[slot] = (self.size, rows)
+        self.size += rows
+
+    def discard(self, slot: int) -> None:
+        """Forget the block of ``slot``, compacting once half the arena is freed (lock held)."""
+        self.freed += self.blocks.pop(slot)[1]
+        if self.freed * 2 > self.size:
+            self._reallocate(0)
+
+    def _reallocate(self, extra: int) -> None:
+        """Move the live blocks to a new arena with room for twice them plus ``extra`` rows."""
+        live = self.size - self.freed
+        arena = np.empty((max(_MIN_ARENA_ROWS, 2 * (live + extra)), self.arena.shape[1]), dtype=np.float32)
+        row = 0
+        for slot, (start, rows) in self.blocks.items():
+            arena[row : row + rows] = self.arena[start : start + rows]
+            self.blocks[slot] = (row, rows)
+            row += rows
+        # Views handed to running searches keep the old arena alive
+        self.arena = arena
+        self.size = row
+        self.freed = 0
+
+
+# ---------------------------------------------------------------------------
+# DocumentSlice class
+# ---------------------------------------------------------------------------
+
+
+class DocumentSlice:
+    """
+    The vectors of one document inside a SharedIndex, searchable like a FAISS index.
+
+    Implements the part of the ``faiss.Index`` interface that LangChain's
+    FAISS store and VectorStore use (``d``, ``ntotal``, ``search``,
+    ``reconstruct``); positions returned are the document's own chunk
+    positions.
+    """
+
+    def __init__(self, shared: "SharedIndex", slot: int, source: faiss.Index) -> None:
+        self.shared = shared
+        self.slot = slot
+        self.d = source.d
+        self.ntotal = source.ntotal
+        self.metric_type = faiss.METRIC_L2
+        self.code_size = source.code_size
+        self.is_trained = True
+        self.released = False
+        # Answers searches once the slice has been released
+        self._source = source
+
+    def search(self, x: np.ndarray, k: int, params: Any = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Return (distances, positions) of the ``k`` nearest chunks for each
+        row of ``x``, batched with concurrent searches (see SearchBatcher).
+        """
+        return self.shared.batcher.search(self, x, k)
+
+    def reconstruct(self, key: int) -> np.ndarray:
+        return self._source.reconstruct(key)
+
+    def release(self) -> None:
+        """Remove the document's vectors from the shared index."""
+        self.shared.remove(self)
+
+
+# ---------------------------------------------------------------------------
+# SearchBatcher class
+# ---------------------------------------------------------------------------
+
+
+class _Batch:
+    """Searches answered by one search_batch() call, and its outcome."""
+
+    __slots__ = ("requests", "results", "error", "done")
+
+    def __init__(self) -> None:
+        self.requests: List[Tuple[DocumentSlice, np.ndarray, int]] = []
+        self.results: List[Tuple[np.ndarray, np.ndarray]] = []
+        self.error: BaseException | None = None
+        self.done = threading.Event()
+
+
+class SearchBatcher:
+    """
+    Gathers concurrent searches into SharedIndex.search_batch() calls.
+
+    The first search of a batch runs it on its own thread and hands every
+    search in it its result.  It starts at once when no other batch is
+    running; otherwise it waits for one to finish – searches arriving
+    meanwhile join the batch – but no longer than ``wait_seconds``, and not
+    once ``max_batch`` searches have joined.  A lone search therefore pays
+    no delay, and under load the batches grow with the load.
+    """
+
+    def __init__(self, shared: "SharedIndex", wait_seconds: float = _BATCH_WAIT_SECONDS, max_batch: int = _BATCH_MAX) -> None:
+        """
+        Args:
+            shared:       Index answering the batches.
+            wait_seconds: Longest a search waits for others; 0 searches at once.
+            max_batch:    Batch size that is run without waiting further.
+        """
+        self.shared = shared
+        self.wait_seconds = wait_seconds
+        self.max_batch = max(1, max_batch)
+
+        self._open: _Batch | None = None
+        self._running = 0
+        self._changed = threading.Condition(threading.Lock())
+
+    def search(self, document: DocumentSlice, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Search ``queries`` within ``document`` as part of the next batch."""
+        if self.wait_seconds <= 0:
+            return self.shared.search(document, queries, k)
+
+        with self._changed:
+            batch = self._open
+            leader = batch is None
+            if leader:
+                batch = self._open = _Batch()
+            position = len(batch.requests)
+            batch.requests.append((document, queries, k))
+            if len(batch.requests) >= self.max_batch:
+                self._changed.notify_all()
+
+        if leader:
+            self._run(batch)
+        else:
+            batch.done.wait()
+
+        if batch.error is not None:
+            raise batch.error
+        return batch.results[position]
+
+    def _run(self, batch: _Batch) -> None:
+        with self._changed:
+            self._changed.wait_for(
+                lambda: not self._running or len(batch.requests) >= self.max_batch, timeout=self.wait_seconds
+            )
+            # Closed: later searches open the next batch
+            self._open = None
+            self._running += 1
+
+        try:
+            batch.results = self.shared.search_batch(batch.requests)
+        except BaseException as exc:
+            batch.error = exc
+        finally:
+            batch.done.set()
+            with self._changed:
+                self._running -= 1
+                self._changed.notify_all()
+
+
+# ---------------------------------------------------------------------------
+# SharedIndex class
+# ---------------------------------------------------------------------------
+
+
+class SharedIndex:
+    """Thread-safe sharded store of the vectors of many documents."""
+
+    def __init__(
+        self,
+        shards: int = _SHARDS,
+        batch_wait_seconds: float = _BATCH_WAIT_SECONDS,
+        batch_max: int = _BATCH_MAX,
+    ) -> None:
+        """
+        Args:
+            shards:             Shards per vector dimension.
+            batch_wait_seconds: See SearchBatcher.
+            batch_max:          See SearchBatcher.
+        """
+        self.shards = max(1, shards)
+        self.batcher = SearchBatcher(self, batch_wait_seconds, batch_max)
+
+        self._shards: Dict[int, List[_Shard]] = {}
+        self._slots = itertools.count(1)
+        self._lock = threading.Lock()
+
+        self.documents = 0
+        self.vectors = 0
+        self.searches = 0
+        self.search_calls = 0
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+
+    def add(self, source: faiss.Index) -> DocumentSlice:
+        """
+        Copy the vectors of ``source`` into the shared index.
+
+        Raises:
+            RuntimeError: If ``source`` is not a flat float32 L2 index.
+        """
+        if not isinstance(source, faiss.IndexFlat) or source.metric_type != faiss.METRIC_L2:
+            raise RuntimeError(f"only flat L2 indexes are shared, not {type(source).__name__}")
+        document = DocumentSlice(self, next(self._slots), source)
+        shard = self._shard(document)
+        with shard.lock:
+            shard.append(document.slot, _flat_vectors(source))
+        with self._lock:
+            self.documents += 1
+            self.vectors += document.ntotal
+        return document
+
+    def remove(self, document: DocumentSlice) -> None:
+        """Remove the vectors of ``document``; later searches on it use its source index."""
+        shard = self._shard(document)
+        with shard.lock:
+            if document.released:
+                return
+            document.released = True
+            shard.discard(document.slot)
+        with self._lock:
+            self.documents -= 1
+            self.vectors -= document.ntotal
+
+    def search(self, document: DocumentSlice, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Search the (n, d) float32 ``queries`` within ``document`` at once; see search_batch()."""
+        with self._lock:
+            self.searches += 1
+            self.search_calls += 1
+        return self._search_document(document, np.ascontiguousarray(queries, dtype=np.float32), k)
+
+    def search_batch(
+        self, requests: Sequence[Tuple[DocumentSlice, np.ndarray, int]]
+    ) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Run many searches, one FAISS call per document.
+
+        Args:
+            requests: (document, queries, k) triples; ``queries`` is a
+                      (n, d) float32 array, already normalised if the
+                      document's vectors are.
+
+        Returns:
+            (distances, positions) per request, in request order, shaped
+            (n, k) like ``faiss.Index.search``; missing results are -1.
+        """
+        results: List[Tuple[np.ndarray, np.ndarray]] = [None] * len(requests)  # type: ignore[list-item]
+        by_document: Dict[DocumentSlice, List[int]] = defaultdict(list)
+        for i, (document, _, _) in enumerate(requests):
+            by_document[document].append(i)
+
+        for document, indexes in by_document.items():
+            if len(indexes) == 1:
+                _, queries, k = requests[indexes[0]]
+                results[indexes[0]] = self._search_document(document, np.ascontiguousarray(queries, dtype=np.float32), k)
+                continue
+
+            blocks = [np.asarray(requests[i][1], dtype=np.float32).reshape(-1, document.d) for i in indexes]
+            k = max(requests[i][2] for i in indexes)
+            distances, positions = self._search_document(document, np.ascontiguousarray(np.concatenate(blocks)), k)
+
+            row = 0
+            for i, block in zip(indexes, blocks):
+                k_i = requests[i][2]
+                results[i] = (distances[row : row + len(block), :k_i], positions[row : row + len(block), :k_i])
+                row += len(block)
+
+        with self._lock:
+            self.searches += len(requests)
+            self.search_calls += len(by_document)
+        return results
+
+    def stats(self) -> Dict[str, int]:
+        """Return document / vector counts and how many searches shared a FAISS call."""
+        with self._lock:
+            return {
+                "documents": self.documents,
+                "vectors": self.vectors,
+                "searches": self.searches,
+                "search_calls": self.search_calls,
+            }
+
+    # ------------------------------------------------------------------
+    # Internal helpers
+    # ------------------------------------------------------------------
+
+    def _shard(self, document: DocumentSlice) -> _Shard:
+        shards = self._shards.get(document.d)
+        if shards is None:
+            with self._lock:
+                shards = self._shards.setdefault(document.d, [_Shard(document.d) for _ in range(self.shards)])
+        return shards[document.slot % self.shards]
+
+    def _search_document(self, document: DocumentSlice, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        shard = self._shard(document)
+        with shard.lock:
+            released = document.released
+            if not released:
+                vectors = shard.block(document.slot)
+        if not released:
+            # Outside the lock: the rows of the view are never rewritten
+            return faiss.knn(queries, vectors, k)
+
+        logger.debug("SharedIndex: slot %d was released – searching its source index.", document.slot)
+        return document._source.search(queries, k)
+
+
+def _flat_vectors(index: faiss.IndexFlat) -> np.ndarray:
+    """Return a (ntotal, d) float32 view of the vectors of a flat index."""
+    return faiss.rev_swig_ptr(index.get_xb(), index.ntotal * index.d).reshape(index.ntotal, index.d)
+
+
+# ---------------------------------------------------------------------------
+# Process-wide singleton
+# ---------------------------------------------------------------------------
+
+_shared_index: SharedIndex | None = None
+_shared_index_lock = threading.Lock()
+
+
+def get_shared_index() -> SharedIndex:
+    """Return the process-wide SharedIndex, creating it on first use."""
+    global _shared_index
+    if _shared_index is None:
+        with _shared_index_lock:
+            if _shared_index is None:
+                _shared_index = SharedIndex(_SHARDS)
+                logger.info("SharedIndex configured (shards=%d per dimension).", _shared_index.shards)
+    return _shared_index
+
+
+def share_index(vectorstore: Any) -> Any:
+    """
+    Return a copy of a loaded LangChain FAISS store that searches its
+    vectors in the shared index.
+
+    The copy shares the docstore, id map and BM25 index of ``vectorstore``.
+    If its vectors cannot be copied, ``vectorstore`` is returned unchanged.
+    """
+    try:
+        document = get_shared_index().add(vectorstore.index)
+    except RuntimeError as exc:
+        logger.warning("share_index: serving the index on its own – %s", exc)
+        return vectorstore
+    shared = copy.copy(vectorstore)
+    shared.index = document
+    return shared
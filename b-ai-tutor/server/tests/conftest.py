@@ -0,0 +1,45 @@
+"""
+Shared fixtures for the server tests.
+
+Run from b-ai-tutor/server with::
+
+    pip install pytest "fakeredis[lua]"
+    python -m pytest tests
+"""
+
+import hashlib
+import os
+import sys
+
+import numpy as np
+import pytest
+from langchain_core.embeddings import Embeddings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+fakeredis = pytest.importorskip("fakeredis")
+# The GC claim and question admission are Lua scripts
+pytest.importorskip("lupa")
+
+
+@pytest.fixture
+def redis_client():
+    """A fresh in-memory Redis, safe to share between threads."""
+    return fakeredis.FakeRedis(server=fakeredis.FakeServer(), decode_responses=True)
+
+
+class HashEmbeddings(Embeddings):
+    """Deterministic 16-dimensional vectors derived from the text."""
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:4], "little")
+        return np.random.default_rng(seed).normal(size=16).tolist()
+
+
+@pytest.fixture
+def embeddings():
+    """Offline stand-in for the Gemini embeddings client."""
+    return HashEmbeddings()
@@ -0,0 +1,116 @@
+"""
+Selection of the RAG prompt context (build_context): relevance threshold,
+near-duplicate removal, MMR ordering and the token / chunk limits.
+"""
+
+import pytest
+from langchain_core.documents import Document
+
+import context_builder
+from context_builder import build_context, estimate_tokens
+from metrics import CONTEXT_CHUNKS_DROPPED
+
+GREEK = "alpha beta gamma delta epsilon zeta theta iota kappa lambda"
+
+
+def chunk(text):
+    return Document(page_content=text)
+
+
+def distinct(name, words=10):
+    """A text sharing no terms with any other ``name``."""
+    return " ".join(f"{name}{i}" for i in range(words)) + "."
+
+
+@pytest.fixture(autouse=True)
+def selection_settings(monkeypatch):
+    monkeypatch.setattr(context_builder, "_MIN_RELEVANCE", 0.3)
+    monkeypatch.setattr(context_builder, "_DUPLICATE_JACCARD", 0.8)
+    monkeypatch.setattr(context_builder, "_MMR_LAMBDA", 0.7)
+
+
+def test_low_scores_are_dropped():
+    docs, stats = build_context([(chunk(distinct("a")), 1.0), (chunk(distinct("b")), 0.2)])
+
+    assert [d.page_content for d in docs] == [distinct("a")]
+    assert stats["dropped"]["low_score"] == 1
+
+
+def test_near_duplicates_are_dropped():
+    candidates = [
+        (chunk(GREEK + "."), 1.0),
+        # Same terms, different case and punctuation
+        (chunk(GREEK.upper().replace(" ", ", ") + "!"), 0.9),
+        (chunk(distinct("b")), 0.8),
+    ]
+
+    docs, stats = build_context(candidates)
+
+    assert [d.page_content for d in docs] == [GREEK + ".", distinct("b")]
+    assert stats["dropped"]["duplicate"] == 1
+
+
+def test_mmr_prefers_a_new_chunk_over_a_redundant_one():
+    # Shares 7 of 11 word pairs with the first chunk: similar, not a duplicate
+    overlapping = " ".join(GREEK.split()[:8]) + " omicron sigma."
+    candidates = [
+        (chunk(GREEK + "."), 1.0),
+        (chunk(overlapping), 0.9),
+        (chunk(distinct("c")), 0.8),
+    ]
+
+    docs, stats = build_context(candidates)
+
+    assert [d.page_content for d in docs] == [GREEK + ".", distinct("c"), overlapping]
+    assert stats["dropped"] == {"low_score": 0, "duplicate": 0, "budget": 0, "max_chunks": 0}
+
+
+def test_chunks_over_the_budget_are_skipped_not_truncated():
+    large = distinct("big", words=100)
+    small = distinct("s", words=5)
+    budget = estimate_tokens(distinct("a", words=50)) + estimate_tokens(small)
+
+    docs, stats = build_context(
+        [(chunk(distinct("a", words=50)), 1.0), (chunk(large), 0.9), (chunk(small), 0.8)], token_budget=budget
+    )
+
+    # The large chunk does not fit; the smaller one after it still does
+    assert [d.page_content for d in docs] == [distinct("a", words=50), small]
+    assert stats["dropped"]["budget"] == 1
+    assert stats["tokens"] <= budget
+
+
+def test_first_chunk_is_cut_at_a_sentence_to_fit():
+    text = " ".join(f"Sentence number {i} explains one more idea." for i in range(100))
+
+    docs, stats = build_context([(chunk(text), 1.0)], token_budget=100)
+
+    assert len(docs) == 1
+    assert text.startswith(docs[0].page_content)
+    assert docs[0].page_content.endswith("idea.")
+    assert stats["tokens"] <= 100
+
+
+def test_leftovers_after_max_chunks_are_counted_separately():
+    counter = CONTEXT_CHUNKS_DROPPED.labels(reason="max_chunks")
+    before = counter._value.get()
+    candidates = [(chunk(distinct(name)), 1.0 - i / 10) for i, name in enumerate("abcd")]
+
+    docs, stats = build_context(candidates, max_chunks=2)
+
+    assert len(docs) == 2
+    assert stats["dropped"]["max_chunks"] == 2
+    assert stats["dropped"]["budget"] == 0
+    assert counter._value.get() == before + 2
+
+
+def test_no_candidates():
+    docs, stats = build_context([])
+
+    assert docs == []
+    assert stats == {
+        "candidates": 0,
+        "chunks": 0,
+        "tokens": 0,
+        "dropped": {"low_score": 0, "duplicate": 0, "budget": 0, "max_chunks": 0},
+    }
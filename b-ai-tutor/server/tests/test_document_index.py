@@ -0,0 +1,235 @@
+"""
+Garbage collection of index directories must never delete an index that a
+session is about to load: the GC claim (_CLAIM_INDEX_LUA) races question
+admission leases (sessions.admit_question) and document references
+(add_document_reference).
+"""
+
+import os
+import threading
+import time
+
+import pytest
+
+import document_index
+from document_index import (
+    add_document_reference,
+    collect_unreferenced_indexes,
+    index_being_collected,
+)
+from sessions import (
+    QUESTION_OK,
+    SESSION_MISSING,
+    admit_question,
+    index_claim_key,
+    index_lease_key,
+    meta_key,
+)
+
+# Old enough for any grace period used below
+_LONG_AGO = time.time() - 10 * 24 * 3600
+
+
+def make_index(root, name, size=1000, age=None):
+    """Create ``<root>/docs/<name>`` holding ``size`` bytes; ``age`` seconds old if given."""
+    path = root / "docs" / name
+    path.mkdir(parents=True)
+    (path / "index.faiss").write_bytes(b"x" * size)
+    if age is not None:
+        mtime = time.time() - age
+        os.utime(path, (mtime, mtime))
+    return str(path)
+
+
+def start_session(redis_client, session_id, store_path):
+    redis_client.hset(meta_key(session_id), mapping={"store_path": store_path})
+
+
+@pytest.fixture(autouse=True)
+def gc_settings(monkeypatch):
+    monkeypatch.setattr(document_index, "_GC_GRACE_SECONDS", 600)
+    monkeypatch.setattr(document_index, "_DISK_HIGH_WATER_BYTES", 0)
+
+
+# ---------------------------------------------------------------------------
+# Claims against leases and references
+# ---------------------------------------------------------------------------
+
+
+def test_unused_index_past_grace_is_collected(redis_client, tmp_path):
+    path = make_index(tmp_path, "abc", age=3600)
+
+    result = collect_unreferenced_indexes(redis_client, root=str(tmp_path))
+
+    assert result["removed"] == 1
+    assert not os.path.exists(path)
+    # The claim is dropped once the directory is gone
+    assert not index_being_collected(redis_client, "abc")
+
+
+def test_admitted_question_lease_blocks_collection(redis_client, tmp_path):
+    path = make_index(tmp_path, "abc", age=3600)
+    start_session(redis_client, "s1", path)
+
+    verdict, _ = admit_question(redis_client, "s1", max_questions=5)
+    # The session expires while its question is still loading the index
+    redis_client.delete(meta_key("s1"))
+    result = collect_unreferenced_indexes(redis_client, root=str(tmp_path))
+
+    assert verdict == QUESTION_OK
+    assert result["removed"] == 0
+    assert os.path.isdir(path)
+
+
+def test_expired_lease_does_not_block_collection(redis_client, tmp_path):
+    path = make_index(tmp_path, "abc", age=3600)
+    redis_client.zadd(index_lease_key("abc"), {meta_key("s1"): time.time() - 1})
+
+    collect_unreferenced_indexes(redis_client, root=str(tmp_path))
+
+    assert not os.path.exists(path)
+    # Expired leases are pruned by the claim
+    assert redis_client.zcard(index_lease_key("abc")) == 0
+
+
+def test_question_on_index_being_collected_is_refused(redis_client, tmp_path):
+    path = make_index(tmp_path, "abc", age=3600)
+    start_session(redis_client, "s1", path)
+    redis_client.set(index_claim_key("abc"), "1")
+
+    verdict, meta = admit_question(redis_client, "s1", max_questions=5)
+
+    assert verdict == SESSION_MISSING
+    assert meta == {}
+    # Refused questions take no lease and are not counted
+    assert redis_client.zcard(index_lease_key("abc")) == 0
+
+
+def test_document_reference_blocks_collection(redis_client, tmp_path):
+    path = make_index(tmp_path, "abc", age=3600)
+
+    add_document_reference(redis_client, "abc", "s1", ttl=3600)
+    collect_unreferenced_indexes(redis_client, root=str(tmp_path))
+
+    assert os.path.isdir(path)
+
+
+def test_reference_added_during_collection_sees_the_claim(redis_client, tmp_path):
+    make_index(tmp_path, "abc", age=3600)
+    # Collection claims the index first ...
+    assert document_index._claim_for_collection(
+        redis_client, document_index._scan_index_dirs(str(tmp_path))[0][0]
+    )
+
+    # ... so a reuse that references it afterwards must not load it
+    add_document_reference(redis_client, "abc", "s1", ttl=3600)
+
+    assert index_being_collected(redis_client, "abc")
+
+
+def test_legacy_session_directory_kept_while_session_lives(redis_client, tmp_path):
+    session_id = "0f8fad5b-d9cb-469f-a165-70867728950e"
+    path = tmp_path / session_id
+    path.mkdir()
+    os.utime(path, (_LONG_AGO, _LONG_AGO))
+    start_session(redis_client, session_id, str(path))
+
+    collect_unreferenced_indexes(redis_client, root=str(tmp_path))
+    assert path.is_dir()
+
+    redis_client.delete(meta_key(session_id))
+    collect_unreferenced_indexes(redis_client, root=str(tmp_path))
+    assert not path.exists()
+
+
+def test_admission_racing_collection_never_loses_a_leased_index(redis_client, tmp_path):
+    """Every question admitted OK finds its index on disk, however the two interleave."""
+    stop = threading.Event()
+    missing = []
+
+    def collect():
+        while not stop.is_set():
+            collect_unreferenced_indexes(redis_client, root=str(tmp_path))
+
+    collector = threading.Thread(target=collect)
+    collector.start()
+    admitted = 0
+    try:
+        for i in range(200):
+            path = make_index(tmp_path, f"doc{i}", size=10, age=3600)
+            start_session(redis_client, f"s{i}", path)
+            verdict, _ = admit_question(redis_client, f"s{i}", max_questions=5)
+            if verdict == QUESTION_OK:
+                admitted += 1
+                if not os.path.isdir(path):
+                    missing.append(path)
+            # The session ends; its index becomes collectable
+            redis_client.delete(meta_key(f"s{i}"), index_lease_key(f"doc{i}"))
+    finally:
+        stop.set()
+        collector.join()
+
+    assert admitted > 0
+    assert missing == []
+
+
+# ---------------------------------------------------------------------------
+# Grace period and high-water eviction
+# ---------------------------------------------------------------------------
+
+
+def test_recent_unused_index_is_kept_for_the_grace_period(redis_client, tmp_path):
+    young = make_index(tmp_path, "young", age=60)
+    old = make_index(tmp_path, "old", age=3600)
+
+    collect_unreferenced_indexes(redis_client, root=str(tmp_path))
+
+    assert os.path.isdir(young)
+    assert not os.path.exists(old)
+
+
+def test_leftovers_are_removed_after_the_grace_period(redis_client, tmp_path):
+    recent = make_index(tmp_path, "abc.tmp-1", age=60)
+    stale = make_index(tmp_path, "abc.tmp-2", age=3600)
+    deleting = make_index(tmp_path, "abc.deleting-3", age=60)
+
+    collect_unreferenced_indexes(redis_client, root=str(tmp_path))
+
+    assert os.path.isdir(recent)
+    assert not os.path.exists(stale)
+    assert not os.path.exists(deleting)
+
+
+def test_high_water_evicts_oldest_unused_indexes_only(redis_client, tmp_path, monkeypatch):
+    monkeypatch.setattr(document_index, "_DISK_HIGH_WATER_BYTES", 2500)
+    # All within the grace period, oldest first
+    referenced = make_index(tmp_path, "referenced", age=400)
+    leased = make_index(tmp_path, "leased", age=300)
+    unused_old = make_index(tmp_path, "unused-old", age=200)
+    unused_new = make_index(tmp_path, "unused-new", age=100)
+    add_document_reference(redis_client, "referenced", "s1", ttl=3600)
+    start_session(redis_client, "s2", leased)
+    assert admit_question(redis_client, "s2", max_questions=5)[0] == QUESTION_OK
+
+    result = collect_unreferenced_indexes(redis_client, root=str(tmp_path))
+
+    # 4000 bytes against a 2250-byte target: both unused ones go, in-use ones stay
+    assert result["removed"] == 2
+    assert result["disk_bytes"] == 2000
+    assert os.path.isdir(referenced) and os.path.isdir(leased)
+    assert not os.path.exists(unused_old) and not os.path.exists(unused_new)
+
+
+def test_high_water_stops_evicting_once_under_target(redis_client, tmp_path, monkeypatch):
+    monkeypatch.setattr(document_index, "_DISK_HIGH_WATER_BYTES", 3500)
+    oldest = make_index(tmp_path, "a", age=300)
+    middle = make_index(tmp_path, "b", age=200)
+    newest = make_index(tmp_path, "c", age=100)
+    make_index(tmp_path, "d", age=50)
+
+    result = collect_unreferenced_indexes(redis_client, root=str(tmp_path))
+
+    # 4000 bytes against a 3150-byte target: the oldest one is enough
+    assert result["removed"] == 1
+    assert not os.path.exists(oldest)
+    assert os.path.isdir(middle) and os.path.isdir(newest)
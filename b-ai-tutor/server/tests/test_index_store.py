@@ -0,0 +1,148 @@
+"""
+Saving an index in the compact format (save_compact_index) and loading it
+back through memory mapping (load_index_dir), plus the legacy pickle
+fallback.
+"""
+
+import os
+
+import numpy as np
+import pytest
+from langchain_community.vectorstores import FAISS
+
+from index_store import (
+    CHUNKS_FILE,
+    MODEL_FILE,
+    OFFSETS_FILE,
+    ChunkFileDocstore,
+    is_compact_index,
+    load_index_dir,
+    read_index_model,
+    save_compact_index,
+)
+from lexical_index import LEXICAL_FILE
+
+TEXTS = [
+    "Mitochondria release energy through the Krebs cycle.",
+    "Chloroplasts capture light – photosynthesis makes glucose.",
+    "Ribosomes translate messenger RNA into proteins.",
+    "Enzymes lower the activation energy of reactions.",
+]
+METADATAS = [{"page": i + 1, "section": f"1.{i} Cells"} for i in range(len(TEXTS))]
+MODEL = ("gemini-embedding-001", "v1beta")
+
+
+@pytest.fixture
+def vectorstore(embeddings):
+    return FAISS.from_texts(TEXTS, embeddings, metadatas=METADATAS)
+
+
+def top_texts(store, query, k=2):
+    return [doc.page_content for doc in store.similarity_search(query, k=k)]
+
+
+# ---------------------------------------------------------------------------
+# Compact format
+# ---------------------------------------------------------------------------
+
+
+def test_compact_round_trip(vectorstore, embeddings, tmp_path):
+    path = str(tmp_path / "abc")
+
+    save_compact_index(vectorstore, path, MODEL)
+    loaded = load_index_dir(path, embeddings)
+
+    assert is_compact_index(path)
+    assert {CHUNKS_FILE, OFFSETS_FILE, MODEL_FILE, LEXICAL_FILE} <= set(os.listdir(path))
+    assert isinstance(loaded.docstore, ChunkFileDocstore)
+    assert loaded.index.ntotal == len(TEXTS)
+    assert loaded.embed_model == MODEL
+    for query in TEXTS:
+        assert top_texts(loaded, query) == top_texts(vectorstore, query)
+    # The BM25 index comes back with the chunks, in the same positions
+    assert len(loaded.lexical_index) == len(TEXTS)
+    assert loaded.lexical_index.search("Krebs cycle", 1)[0][0][0] == 0
+
+
+def test_chunk_file_docstore_lookups(vectorstore, tmp_path):
+    path = str(tmp_path / "abc")
+    save_compact_index(vectorstore, path)
+
+    docstore = ChunkFileDocstore(path)
+
+    assert len(docstore) == len(TEXTS)
+    for position, (text, metadata) in enumerate(zip(TEXTS, METADATAS)):
+        doc = docstore.search(str(position))
+        assert doc.id == str(position)
+        assert doc.page_content == text
+        assert doc.metadata == metadata
+    # Records are UTF-8: multi-byte characters do not shift later offsets
+    assert "–" in docstore.search("1").page_content
+    assert docstore.search(str(len(TEXTS))) == f"ID {len(TEXTS)} not found."
+    assert docstore.search("-1") == "ID -1 not found."
+    assert docstore.search("abc") == "ID abc not found."
+
+
+def test_empty_chunk_file(tmp_path):
+    (tmp_path / CHUNKS_FILE).write_bytes(b"")
+    with open(tmp_path / OFFSETS_FILE, "wb") as fh:
+        np.save(fh, np.zeros(1, dtype=np.int64))
+
+    docstore = ChunkFileDocstore(str(tmp_path))
+
+    assert len(docstore) == 0
+    assert docstore.search("0") == "ID 0 not found."
+
+
+def test_mismatched_chunk_records_are_rejected(vectorstore, embeddings, tmp_path):
+    path = str(tmp_path / "abc")
+    save_compact_index(vectorstore, path)
+    offsets = np.load(os.path.join(path, OFFSETS_FILE))
+    with open(os.path.join(path, OFFSETS_FILE), "wb") as fh:
+        np.save(fh, offsets[:-1])
+
+    with pytest.raises(ValueError, match="chunk records"):
+        load_index_dir(path, embeddings)
+
+
+# ---------------------------------------------------------------------------
+# Recorded model
+# ---------------------------------------------------------------------------
+
+
+def test_read_index_model(vectorstore, tmp_path):
+    save_compact_index(vectorstore, str(tmp_path / "recorded"), MODEL)
+    save_compact_index(vectorstore, str(tmp_path / "unrecorded"))
+
+    assert read_index_model(str(tmp_path / "recorded")) == MODEL
+    assert read_index_model(str(tmp_path / "unrecorded")) is None
+
+
+def test_unreadable_model_file_is_ignored(tmp_path):
+    (tmp_path / MODEL_FILE).write_text('{"model": "gemini-embedding-001"}', encoding="utf-8")
+    assert read_index_model(str(tmp_path)) is None
+
+    (tmp_path / MODEL_FILE).write_text("not json", encoding="utf-8")
+    assert read_index_model(str(tmp_path)) is None
+
+
+# ---------------------------------------------------------------------------
+# Legacy pickle format
+# ---------------------------------------------------------------------------
+
+
+def test_legacy_pickle_fallback(vectorstore, embeddings, tmp_path):
+    path = str(tmp_path / "legacy")
+    vectorstore.save_local(path)
+
+    loaded = load_index_dir(path, embeddings)
+
+    assert not is_compact_index(path)
+    assert not isinstance(loaded.docstore, ChunkFileDocstore)
+    # Saved before the model was recorded: built with the primary model
+    assert loaded.embed_model is None
+    for query in TEXTS:
+        assert top_texts(loaded, query) == top_texts(vectorstore, query)
+    # No lexical.npz: the BM25 index is rebuilt from the chunks
+    assert not os.path.exists(os.path.join(path, LEXICAL_FILE))
+    assert len(loaded.lexical_index) == len(TEXTS)
@@ -0,0 +1,125 @@
+"""
+The BM25 index behind keyword retrieval (lexical_index.py): tokenisation,
+scores, query coverage and persistence.
+"""
+
+import math
+
+import pytest
+
+from lexical_index import LEXICAL_FILE, LexicalIndex, tokenize
+
+CHUNKS = [
+    "The Krebs cycle: krebs named it.",
+    "The cycle releases energy.",
+    "Glucose stores energy from light.",
+]
+
+
+def bm25(tf, df, doc_length, average_length, doc_count, k1=1.2, b=0.75):
+    idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+    return idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * doc_length / average_length))
+
+
+# ---------------------------------------------------------------------------
+# Tokenisation
+# ---------------------------------------------------------------------------
+
+
+def test_tokenize_drops_stop_words_and_lowercases():
+    assert tokenize("What is the Krebs cycle? Please explain it.") == ["kreb", "cycle"]
+
+
+def test_tokenize_strips_plurals_only():
+    assert tokenize("enzymes proteins cells") == ["enzyme", "protein", "cell"]
+    # Words that merely end in "s" keep it; short ones are left alone
+    assert tokenize("glass analysis virus gas bus") == ["glass", "analysis", "virus", "gas", "bus"]
+
+
+def test_tokenize_keeps_digits_and_drops_single_letters():
+    assert tokenize("Figure 3 shows x and y in 2024") == ["figure", "3", "show", "2024"]
+
+
+def test_tokenize_keeps_duplicates_in_order():
+    assert tokenize("energy, light energy") == ["energy", "light", "energy"]
+
+
+# ---------------------------------------------------------------------------
+# Scoring and coverage
+# ---------------------------------------------------------------------------
+
+
+def test_bm25_scores():
+    index = LexicalIndex.build(CHUNKS)
+    lengths = [len(tokenize(chunk)) for chunk in CHUNKS]
+    average = sum(lengths) / len(lengths)
+
+    hits, coverage = index.search("krebs", k=5)
+
+    assert coverage == 1.0
+    assert [position for position, _ in hits] == [0]
+    assert hits[0][1] == pytest.approx(bm25(2, 1, lengths[0], average, 3), rel=1e-5)
+
+
+def test_scores_add_up_over_query_terms():
+    index = LexicalIndex.build(CHUNKS)
+    lengths = [len(tokenize(chunk)) for chunk in CHUNKS]
+    average = sum(lengths) / len(lengths)
+
+    hits, _ = index.search("cycle energy", k=5)
+
+    # Chunk 1 holds both terms, chunks 0 and 2 one each
+    assert hits[0][0] == 1
+    expected = bm25(1, 2, lengths[1], average, 3) * 2
+    assert hits[0][1] == pytest.approx(expected, rel=1e-5)
+    assert {position for position, _ in hits} == {0, 1, 2}
+
+
+def test_hits_are_limited_to_k_best_first():
+    index = LexicalIndex.build(CHUNKS)
+
+    hits, _ = index.search("krebs cycle energy", k=2)
+
+    assert len(hits) == 2
+    assert hits[0][1] >= hits[1][1]
+    assert hits[0][0] == 0
+
+
+def test_coverage_counts_distinct_query_terms_found():
+    index = LexicalIndex.build(CHUNKS)
+
+    assert index.search("krebs mitochondria", k=5)[1] == 0.5
+    assert index.search("krebs krebs mitochondria", k=5)[1] == 0.5
+    # Only stop words: nothing to look up
+    assert index.search("what is this", k=5) == ([], 0.0)
+    assert index.search("mitochondria", k=5) == ([], 0.0)
+
+
+def test_empty_index():
+    index = LexicalIndex.build([])
+
+    assert len(index) == 0
+    assert index.search("krebs", k=5) == ([], 0.0)
+
+
+# ---------------------------------------------------------------------------
+# Persistence
+# ---------------------------------------------------------------------------
+
+
+def test_save_and_load(tmp_path):
+    index = LexicalIndex.build(CHUNKS)
+    index.save(str(tmp_path))
+
+    loaded = LexicalIndex.load(str(tmp_path))
+
+    assert len(loaded) == len(CHUNKS)
+    for query in ("krebs cycle", "energy", "light glucose"):
+        assert loaded.search(query, k=5) == index.search(query, k=5)
+
+
+def test_load_missing_or_unreadable(tmp_path):
+    assert LexicalIndex.load(str(tmp_path)) is None
+
+    (tmp_path / LEXICAL_FILE).write_bytes(b"not an npz file")
+    assert LexicalIndex.load(str(tmp_path)) is None
@@ -0,0 +1,43 @@
+"""
+Header / footer removal in pdf_extractor.py: which edge lines count as page
+numbers (_PAGE_NUMBER_RE) and what strip_repeated_lines drops.
+"""
+
+import pytest
+
+from pdf_extractor import _PAGE_NUMBER_RE, strip_repeated_lines
+
+
+def page(*texts):
+    return [(text, 10.0, False) for text in texts]
+
+
+@pytest.mark.parametrize("line", ["12", "Page 3", "page 3 of 10", "3 / 10", "iv", "xiv", "XLII", "mcmxc"])
+def test_page_numbers(line):
+    assert _PAGE_NUMBER_RE.match(line)
+
+
+@pytest.mark.parametrize("line", ["civil", "ill", "vivid", "Mill", "iiii", "vx", "xxxx", "", "Page"])
+def test_words_and_malformed_numerals_are_not_page_numbers(line):
+    assert not _PAGE_NUMBER_RE.match(line)
+
+
+def test_page_numbers_and_repeated_headers_are_stripped():
+    topics = ["Cells", "Enzymes", "Light", "Genes"]
+    bodies = {n: [f"{topic} one.", f"{topic} two.", f"{topic} three."] for n, topic in enumerate(topics, 1)}
+    pages = [(n, page("Biology 101", *body, str(n))) for n, body in bodies.items()]
+
+    stripped = list(strip_repeated_lines(iter(pages)))
+
+    assert [n for n, _ in stripped] == [1, 2, 3, 4]
+    for n, lines in stripped:
+        assert [text for text, _, _ in lines] == bodies[n]
+
+
+def test_single_words_at_a_page_edge_are_kept():
+    pages = [(1, page("Civil", "Rights movements.", "Ill")), (2, page("Vivid", "Colours.", "ii"))]
+
+    stripped = dict(strip_repeated_lines(iter(pages)))
+
+    assert [text for text, _, _ in stripped[1]] == ["Civil", "Rights movements.", "Ill"]
+    assert [text for text, _, _ in stripped[2]] == ["Vivid", "Colours."]
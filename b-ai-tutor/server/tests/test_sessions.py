@@ -0,0 +1,142 @@
+"""
+The session Lua scripts: popping sentences (_POP_SENTENCES_LUA) and
+admitting questions (_ADMIT_QUESTION_LUA).
+"""
+
+import asyncio
+import time
+
+import fakeredis
+import pytest
+
+from sessions import (
+    INDEX_LEASE_TTL,
+    QUESTION_LIMIT_REACHED,
+    QUESTION_OK,
+    SESSION_MISSING,
+    SESSION_NOT_READY,
+    SESSION_TTL,
+    aadmit_question,
+    admit_question,
+    apop_sentences,
+    begin_generation,
+    index_claim_key,
+    index_lease_key,
+    meta_key,
+    next_sentences,
+    pop_sentences,
+    question_count_key,
+    queue_key,
+    queue_sentences,
+)
+
+SESSION = "s1"
+
+
+def start_session(redis_client, **meta):
+    redis_client.hset(meta_key(SESSION), mapping={"topic": "cells", **meta})
+
+
+# ---------------------------------------------------------------------------
+# Popping sentences
+# ---------------------------------------------------------------------------
+
+
+def test_pop_from_empty_queue(redis_client):
+    assert pop_sentences(redis_client, SESSION, 3) == ([], 0, False)
+
+
+def test_pop_reports_remaining_and_generating(redis_client):
+    queue_sentences(redis_client, SESSION, ["One.", "Two.", "Three."])
+    begin_generation(redis_client, SESSION)
+
+    assert pop_sentences(redis_client, SESSION, 2) == (["One.", "Two."], 1, True)
+
+
+def test_pop_more_than_queued(redis_client):
+    queue_sentences(redis_client, SESSION, ["One.", "Two."])
+
+    assert pop_sentences(redis_client, SESSION, 5) == (["One.", "Two."], 0, False)
+    assert redis_client.llen(queue_key(SESSION)) == 0
+
+
+def test_next_sentences_does_not_wait_when_nothing_is_generating(redis_client):
+    started = time.monotonic()
+
+    assert next_sentences(redis_client, SESSION, 1, wait=5) == ([], 0, False)
+    assert time.monotonic() - started < 1
+
+
+# ---------------------------------------------------------------------------
+# Admitting questions
+# ---------------------------------------------------------------------------
+
+
+def test_missing_session(redis_client):
+    assert admit_question(redis_client, SESSION, 5) == (SESSION_MISSING, {})
+    assert not redis_client.exists(question_count_key(SESSION))
+
+
+def test_session_without_index_is_not_ready(redis_client):
+    start_session(redis_client)
+
+    verdict, meta = admit_question(redis_client, SESSION, 5)
+
+    assert verdict == SESSION_NOT_READY
+    assert meta == {"topic": "cells"}
+    assert not redis_client.exists(question_count_key(SESSION))
+
+
+def test_admitted_question_is_counted_and_leases_the_index(redis_client):
+    start_session(redis_client, store_path="faiss_store/docs/abc/", fingerprint="abc")
+
+    verdict, meta = admit_question(redis_client, SESSION, 5)
+
+    assert verdict == QUESTION_OK
+    assert meta["fingerprint"] == "abc"
+    assert redis_client.get(question_count_key(SESSION)) == "1"
+    assert 0 < redis_client.ttl(question_count_key(SESSION)) <= SESSION_TTL
+    # The lease is named after the last path component, trailing slash or not
+    (member, expiry), = redis_client.zrange(index_lease_key("abc"), 0, -1, withscores=True)
+    assert member == meta_key(SESSION)
+    assert expiry == pytest.approx(time.time() + INDEX_LEASE_TTL, abs=5)
+    assert 0 < redis_client.ttl(index_lease_key("abc")) <= INDEX_LEASE_TTL
+
+
+def test_question_limit(redis_client):
+    start_session(redis_client, store_path="faiss_store/docs/abc")
+
+    verdicts = [admit_question(redis_client, SESSION, 2)[0] for _ in range(3)]
+
+    assert verdicts == [QUESTION_OK, QUESTION_OK, QUESTION_LIMIT_REACHED]
+    assert redis_client.get(question_count_key(SESSION)) == "2"
+
+
+def test_index_being_collected_reports_session_missing(redis_client):
+    start_session(redis_client, store_path="faiss_store/docs/abc")
+    redis_client.set(index_claim_key("abc"), "1")
+
+    assert admit_question(redis_client, SESSION, 5) == (SESSION_MISSING, {})
+    assert not redis_client.exists(question_count_key(SESSION))
+    assert not redis_client.exists(index_lease_key("abc"))
+
+
+def test_async_variants_match():
+    server = fakeredis.FakeServer()
+    sync_client = fakeredis.FakeRedis(server=server, decode_responses=True)
+    async_client = fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+    start_session(sync_client, store_path="faiss_store/docs/abc")
+    queue_sentences(sync_client, SESSION, ["One.", "Two."])
+
+    async def run():
+        return (
+            await aadmit_question(async_client, SESSION, 1),
+            await aadmit_question(async_client, SESSION, 1),
+            await apop_sentences(async_client, SESSION, 5),
+        )
+
+    admitted, limited, popped = asyncio.run(run())
+
+    assert admitted[0] == QUESTION_OK
+    assert limited[0] == QUESTION_LIMIT_REACHED
+    assert popped == (["One.", "Two."], 0, False)
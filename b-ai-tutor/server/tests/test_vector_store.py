@@ -0,0 +1,126 @@
+"""
+Hybrid retrieval in VectorStore: choosing between BM25, vector and fused
+rankings (_plan_retrieval) and merging them (_scored_documents).
+"""
+
+import pytest
+from langchain_community.vectorstores import FAISS
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+import vector_store
+from lexical_index import LexicalIndex
+from vector_store import VectorStore
+
+TEXTS = [
+    "Mitochondria run the Krebs cycle.",
+    "Chloroplasts capture light for photosynthesis.",
+    "Ribosomes build proteins.",
+    "Enzymes speed up reactions.",
+]
+
+
+@pytest.fixture
+def store(tmp_path, embeddings):
+    store = VectorStore(
+        pickle_file=str(tmp_path / "idx"), embeddings=embeddings, llm=FakeListChatModel(responses=["ok"])
+    )
+    store.vectorstore = FAISS.from_texts(TEXTS, store.embeddings)
+    store.vectorstore.lexical_index = LexicalIndex.build(TEXTS)
+    return store
+
+
+def texts_and_scores(scored):
+    return [(doc.page_content, pytest.approx(score)) for doc, score in scored]
+
+
+# ---------------------------------------------------------------------------
+# Ranking fusion
+# ---------------------------------------------------------------------------
+
+
+def test_lexical_ranking_is_relative_to_the_best_score(store):
+    scored = store._scored_documents("lexical", [(2, 4.0), (0, 1.0)], [], k=5)
+
+    assert texts_and_scores(scored) == [(TEXTS[2], 1.0), (TEXTS[0], 0.25)]
+
+
+def test_vector_ranking_uses_cosine_similarity(store):
+    # Distances of unit vectors: similarity is 1 - d / 2
+    scored = store._scored_documents("vector", [], [(1, 0.4), (3, 1.0), (0, 1.6)], k=2)
+
+    assert texts_and_scores(scored) == [(TEXTS[1], 1.0), (TEXTS[3], 0.5 / 0.8)]
+
+
+def test_hybrid_fuses_ranks_not_scores(store):
+    # Chunk 0 is second in both rankings; chunks 2 and 1 lead one ranking each
+    lexical_hits = [(2, 100.0), (0, 1.0)]
+    vector_hits = [(1, 0.0), (0, 1.9)]
+
+    scored = store._scored_documents("hybrid", lexical_hits, vector_hits, k=3)
+
+    # 2 / 62 beats 1 / 61 however far apart the raw scores are
+    assert [doc.page_content for doc, _ in scored] == [TEXTS[0], TEXTS[2], TEXTS[1]]
+    # Relevance: mean of the relative scores, 0 for a ranking missing the chunk
+    relevance = {doc.page_content: score for doc, score in scored}
+    assert relevance[TEXTS[0]] == pytest.approx((0.01 + 0.05) / 2)
+    assert relevance[TEXTS[2]] == pytest.approx(0.5)
+    assert relevance[TEXTS[1]] == pytest.approx(0.5)
+
+
+def test_hybrid_keeps_k_results(store):
+    scored = store._scored_documents("hybrid", [(0, 2.0), (1, 1.0)], [(2, 0.1), (3, 0.2)], k=3)
+
+    assert len(scored) == 3
+
+
+def test_retrievals_are_counted_by_mode(store):
+    counter = vector_store.RETRIEVALS.labels(mode="lexical")
+    before = counter._value.get()
+
+    store._scored_documents("lexical", [(0, 1.0)], [], k=1)
+
+    assert counter._value.get() == before + 1
+
+
+# ---------------------------------------------------------------------------
+# Retrieval planning
+# ---------------------------------------------------------------------------
+
+
+def test_keyword_question_needs_no_embedding(store):
+    mode, hits = store._plan_retrieval("Krebs cycle mitochondria", k=5)
+
+    assert mode == "lexical"
+    assert hits[0][0] == 0
+    assert not store.needs_query_embedding("Krebs cycle mitochondria")
+
+
+def test_partly_matching_question_is_fused(store):
+    mode, hits = store._plan_retrieval("How do mitochondria make ATP and NADH?", k=5)
+
+    assert mode == "hybrid"
+    assert hits
+    assert store.needs_query_embedding("How do mitochondria make ATP and NADH?")
+
+
+def test_unmatched_question_uses_vectors(store):
+    assert store._plan_retrieval("Describe zebras", k=5) == ("vector", [])
+
+
+def test_configured_modes(store, monkeypatch):
+    monkeypatch.setattr(vector_store, "_RETRIEVAL_MODE", "vector")
+    assert store._plan_retrieval("Krebs cycle mitochondria", k=5) == ("vector", [])
+
+    monkeypatch.setattr(vector_store, "_RETRIEVAL_MODE", "lexical")
+    assert store._plan_retrieval("How do mitochondria make ATP and NADH?", k=5)[0] == "lexical"
+
+
+def test_retrieve_scored_skips_the_embedding_for_keyword_questions(store, monkeypatch):
+    def fail(query):
+        raise AssertionError("embedded a keyword question")
+
+    monkeypatch.setattr(store, "embed_query", fail)
+
+    scored = store.retrieve_scored("Krebs cycle mitochondria", k=2)
+
+    assert scored[0][0].page_content == TEXTS[0]
@@ -2,30 +2,74 @@
 FAISS-backed vector store powered by Google Gemini embeddings.
 
 Responsibilities:
-  - Chunk raw text with LangChain's RecursiveCharacterTextSplitter
-  - Embed chunks using the Gemini embedding API
-  - Persist / reload the FAISS index to/from disk
-  - Expose similarity search and retrieval-augmented generation (RAG) query
+  - Chunk raw text with LangChain's RecursiveCharacterTextSplitter, either
+    in one go or incrementally from a stream of pages; structured pages
+    (see pdf_extractor.iter_structured_pages) are chunked per section and
+    tagged with their section title and page range
+  - Embed chunks in concurrent batches using the Gemini embedding API,
+    rate-limited and retried per batch (see embedding_limiter.py), while
+    later pages are still being extracted
+  - Persist / reload the FAISS index to/from disk (memory-mapped compact
+    format, see index_store.py); with INDEX_BACKEND=shared the loaded
+    vectors are searched in one process-wide index (shared_index.py)
+  - Retrieve context with BM25 (lexical_index.py), vector search or a
+    fusion of both, and answer questions with retrieval-augmented
+    generation (RAG).  Query embeddings are cached (query_cache.py), and a
+    precomputed query vector can be passed in instead.  Candidates are
+    over-retrieved and trimmed to a token budget (context_builder.py).
 
 Typical usage::
 
     vs = VectorStore(google_api_key="...")
     vs.create_vector_store_from_text(my_text)
+    # or, streaming:  vs.create_vector_store_from_pages(page_texts)
+    # or, by section:  vs.create_vector_store_from_structured_pages(pages)
     results = vs.search_similar("some topic", k=5)
+    vector  = vs.embed_query("explain X")     # cached across sessions
+    docs    = vs.retrieve("explain X", query_vector=vector)
     answer  = vs.query_with_sources("explain X in 60 words")
+    for sentence in vs.query_with_sources_stream("explain X"):
+        ...
+    async for sentence in vs.aquery_with_sources_stream("explain X"):
+        ...   # async variant used by asgi_app.py
+
+Gemini clients are shared: ``get_embeddings_client`` / ``get_llm_client``
+return one instance per (model, api_version, key) so every request reuses
+the same pooled keep-alive HTTP connections instead of paying a fresh TLS
+handshake.
 """
 
 import logging
 import os
-import time
-from typing import Any, Dict, List, Tuple
-
+import re
+import shutil
+import threading
+import uuid
+from bisect import bisect_right
+from concurrent.futures import Future, ThreadPoolExecutor
+from itertools import islice
+from typing import Any, AsyncIterable, AsyncIterator, Callable, Dict, Iterable, Iterator, List, Tuple
+
+import faiss
+import httpx
+import numpy as np
 from langchain_community.vectorstores import FAISS
 from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAIEmbeddings
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
+from context_builder import CONTEXT_CANDIDATES, build_context
+from embedding_cache import CachedEmbeddings, get_embedding_cache
+from embedding_limiter import RateLimitedEmbeddings
+from index_cache import get_index_cache
+from index_store import INDEX_FILE, build_factory_index, load_index_dir, read_index_model, save_compact_index
+from metrics import EMBEDDING_FALLBACKS, RETRIEVALS, STAGE_SECONDS, GeminiMetricsCallback, record_cache_lookup
+from query_cache import get_query_embedding_cache
+from shared_index import SHARED_INDEX_ENABLED, share_index
+
 logger = logging.getLogger(__name__)
 
 # ---------------------------------------------------------------------------
@@ -42,11 +86,268 @@ _FALLBACK_EMBED_MODELS: List[Tuple[str, str]] = [
     ("models/text-embedding-004", "v1beta"),
 ]
 
+# Embedding size requested from Gemini (Matryoshka truncation); 0 keeps the
+# model's native size (3072 for gemini-embedding-001).  Values up to 768
+# also suit the fallback model.
+_EMBED_DIMENSIONS = int(os.environ.get("EMBED_OUTPUT_DIMENSIONALITY", 0)) or None
+
+# FAISS index_factory string for saved indexes: "Flat" (exact), "SQ8"
+# (4x smaller), "PQ<m>" / "IVF<n>,SQ8" for large shared indexes.  Indexes
+# with fewer than _INDEX_FACTORY_MIN_VECTORS vectors stay flat, since PQ and
+# IVF need enough vectors to train their centroids.
+_INDEX_FACTORY = os.environ.get("FAISS_INDEX_FACTORY", "Flat")
+_INDEX_FACTORY_MIN_VECTORS = int(os.environ.get("FAISS_INDEX_MIN_VECTORS", 0))
+
+# Vectors and queries are L2-normalised, so L2 ranking equals cosine ranking
+# even for truncated embeddings (native Gemini vectors are unit length already).
+_FAISS_KWARGS: Dict[str, Any] = {"normalize_L2": True}
+
+# Context retrieval: "hybrid" answers keyword-heavy questions from the BM25
+# index alone (no query embedding round trip) and fuses the BM25 and vector
+# rankings otherwise; "vector" and "lexical" use one side only.
+_RETRIEVAL_MODE = os.environ.get("RETRIEVAL_MODE", "hybrid")
+_RETRIEVAL_K = 5
+# Keyword-heavy: this share of the question's terms occur in the document
+# and the best BM25 chunk scores at least this much (about one term found
+# in under a fifth of the chunks)
+_LEXICAL_MIN_COVERAGE = float(os.environ.get("HYBRID_LEXICAL_MIN_COVERAGE", 0.8))
+_LEXICAL_MIN_SCORE = float(os.environ.get("HYBRID_LEXICAL_MIN_SCORE", 2.0))
+# Candidates taken from each ranking before fusion, per result
+_FUSION_CANDIDATES = 4
+# Reciprocal rank fusion constant (the usual 60 from the RRF paper)
+_RRF_K = 60
+
 # LLM used for RAG generation
 _LLM_MODEL = "gemini-2.5-flash"
 
-# Seconds to wait after embedding creation to avoid hitting rate limits
-_RATE_LIMIT_SLEEP = 2
+# Text splitter configuration: prefer paragraph > line > sentence > comma breaks
+_CHUNK_SIZE = 1000
+_SPLITTER_SEPARATORS = ["\n\n", "\n", ".", ","]
+
+# Chunks per embedding request, and requests in flight per index build
+_EMBED_BATCH_SIZE = int(os.environ.get("EMBED_BATCH_SIZE", 64))
+_EMBED_CONCURRENCY = int(os.environ.get("EMBED_CONCURRENCY", 4))
+# Characters buffered before the incremental chunker splits off finished chunks
+_CHUNK_WINDOW = 8 * _CHUNK_SIZE
+# "structured" chunks PDFs per section with page / section metadata (see
+# iter_structured_chunks()); "plain" splits the concatenated page texts
+_CHUNKING_MODE = os.environ.get("INGEST_CHUNKING", "structured")
+# Section titles longer than this (many stacked headings) are cut
+_SECTION_TITLE_MAX_CHARS = 200
+
+# Keep-alive connection pool shared by every request using a given client
+_HTTP_MAX_CONNECTIONS = int(os.environ.get("GEMINI_HTTP_MAX_CONNECTIONS", 32))
+_HTTP_KEEPALIVE_EXPIRY = float(os.environ.get("GEMINI_HTTP_KEEPALIVE_EXPIRY", 60))
+
+
+# Simple RAG prompt shared by the blocking and streaming query paths
+_RAG_PROMPT = ChatPromptTemplate.from_template(
+    "You are a helpful tutor. Answer the following question based on "
+    "the provided context.\n\n"
+    "Context:\n{context}\n\n"
+    "Question: {question}\n\n"
+    "Answer:"
+)
+
+# Sentence boundary: terminal punctuation followed by whitespace
+_SENTENCE_BOUNDARY_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+# ---------------------------------------------------------------------------
+# LLM output helpers
+# ---------------------------------------------------------------------------
+
+
+def _message_text(message: Any) -> str:
+    """Return the plain text of an LLM message / chunk regardless of its type."""
+    content = message.content if hasattr(message, "content") else message
+    if isinstance(content, list):
+        # Multi-part content: keep only the text parts
+        return "".join(
+            part if isinstance(part, str) else part.get("text", "")
+            for part in content
+            if isinstance(part, (str, dict))
+        )
+    return str(content)
+
+
+class _SentenceBuffer:
+    """Accumulates text fragments and hands back the sentences they complete."""
+
+    def __init__(self) -> None:
+        self._buffer = ""
+
+    def feed(self, fragment: str) -> List[str]:
+        """Add a fragment; return the sentences finished by it."""
+        if not fragment:
+            return []
+        self._buffer += fragment
+        parts = _SENTENCE_BOUNDARY_RE.split(self._buffer)
+        # Everything but the last part is a finished sentence
+        self._buffer = parts[-1]
+        return [s.strip() for s in parts[:-1] if s.strip()]
+
+    def flush(self) -> str | None:
+        """Return whatever is left once the stream has ended."""
+        tail, self._buffer = self._buffer.strip(), ""
+        return tail or None
+
+
+def iter_sentences(fragments: Iterable[str]) -> Iterator[str]:
+    """
+    Re-chunk a stream of text fragments into complete sentences.
+
+    A sentence is emitted as soon as its terminal punctuation is followed by
+    whitespace; whatever is left when the stream ends is emitted last.
+
+    Args:
+        fragments: Arbitrary text pieces, e.g. LLM token chunks.
+
+    Yields:
+        Stripped, non-empty sentences in order.
+    """
+    buffer = _SentenceBuffer()
+    for fragment in fragments:
+        yield from buffer.feed(fragment)
+    tail = buffer.flush()
+    if tail:
+        yield tail
+
+
+async def aiter_sentences(fragments: AsyncIterable[str]) -> AsyncIterator[str]:
+    """Async variant of iter_sentences()."""
+    buffer = _SentenceBuffer()
+    async for fragment in fragments:
+        for sentence in buffer.feed(fragment):
+            yield sentence
+    tail = buffer.flush()
+    if tail:
+        yield tail
+
+
+def _batched(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    """Yield lists of up to ``size`` consecutive items."""
+    iterator = iter(items)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def _page_at(marks: List[Tuple[int, int]], offset: int) -> int:
+    """Return the page holding ``offset``, given (offset, page) marks of page starts."""
+    return marks[max(0, bisect_right(marks, (offset, float("inf"))) - 1)][1]
+
+
+def _relative_scores(hits: List[Tuple[int, float]]) -> Dict[int, float]:
+    """Map each position to its score over the best score of ``hits`` (higher is better)."""
+    best = max((score for _, score in hits), default=0.0)
+    return {p: score / best if best > 0 else 0.0 for p, score in hits}
+
+
+def _embedding_space(model: str) -> str:
+    """Identity of the vectors ``model`` produces under the configured size."""
+    return f"{model}@{_EMBED_DIMENSIONS}" if _EMBED_DIMENSIONS else model
+
+
+def _document_embedder(embeddings: Embeddings, model: str) -> Embeddings:
+    """
+    Wrap ``embeddings`` for index builds.
+
+    Calls are rate-limited and retried (embedding_limiter.py) and, when
+    enabled, served from the persistent chunk-embedding cache first, so
+    cached chunks never consume rate-limit tokens.
+    """
+    limited = RateLimitedEmbeddings(embeddings, model)
+    cache = get_embedding_cache()
+    if cache is None:
+        return limited
+    return CachedEmbeddings(limited, _embedding_space(model), cache)
+
+
+# ---------------------------------------------------------------------------
+# Shared client registry
+# ---------------------------------------------------------------------------
+
+_client_lock = threading.Lock()
+_embedding_clients: Dict[Tuple[str, str, str], GoogleGenerativeAIEmbeddings] = {}
+_llm_clients: Dict[Tuple[str, str, str, float], ChatGoogleGenerativeAI] = {}
+
+
+def _http_client_args() -> Dict[str, Any]:
+    """httpx arguments that size the keep-alive pool of a Gemini client."""
+    return {
+        "limits": httpx.Limits(
+            max_connections=_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=_HTTP_MAX_CONNECTIONS,
+            keepalive_expiry=_HTTP_KEEPALIVE_EXPIRY,
+        ),
+    }
+
+
+def get_embeddings_client(
+    model: str,
+    api_version: str,
+    google_api_key: str,
+) -> GoogleGenerativeAIEmbeddings:
+    """
+    Return the shared embeddings client for (model, api_version, key).
+
+    The client is created on first use and reused by every later caller,
+    across requests and threads (the underlying httpx client is thread-safe).
+    """
+    key = (model, api_version, google_api_key)
+    client = _embedding_clients.get(key)
+    if client is not None:
+        return client
+
+    with _client_lock:
+        client = _embedding_clients.get(key)
+        if client is None:
+            logger.info(
+                "Creating shared embeddings client for model '%s' (api_version=%s).",
+                model,
+                api_version,
+            )
+            client = GoogleGenerativeAIEmbeddings(
+                model=model,
+                google_api_key=google_api_key,
+                model_kwargs={"api_version": api_version},
+                client_args=_http_client_args(),
+                output_dimensionality=_EMBED_DIMENSIONS,
+            )
+            _embedding_clients[key] = client
+    return client
+
+
+def get_llm_client(
+    model: str,
+    api_version: str,
+    google_api_key: str,
+    temperature: float = 0.9,
+) -> ChatGoogleGenerativeAI:
+    """
+    Return the shared chat client for (model, api_version, key, temperature).
+
+    See get_embeddings_client() for the sharing semantics.
+    """
+    key = (model, api_version, google_api_key, temperature)
+    client = _llm_clients.get(key)
+    if client is not None:
+        return client
+
+    with _client_lock:
+        client = _llm_clients.get(key)
+        if client is None:
+            logger.info("Creating shared LLM client for model '%s'.", model)
+            client = ChatGoogleGenerativeAI(
+                model=model,
+                temperature=temperature,
+                google_api_key=google_api_key,
+                model_kwargs={"api_version": api_version},
+                client_args=_http_client_args(),
+                callbacks=[GeminiMetricsCallback(model)],
+            )
+            _llm_clients[key] = client
+    return client
 
 
 # ---------------------------------------------------------------------------
@@ -66,6 +367,8 @@ class VectorStore:
         self,
         google_api_key: str | None = None,
         pickle_file: str = "faiss_store",
+        embeddings: Embeddings | None = None,
+        llm: BaseChatModel | None = None,
     ) -> None:
         """
         Initialise embeddings, LLM, and text splitter.
@@ -73,52 +376,49 @@ class VectorStore:
         Args:
             google_api_key: Google API key.  Falls back to the GOOGLE_API_KEY
                             environment variable if not supplied.
-            pickle_file:    Directory name for FAISS save_local / load_local.
-                            A ".pkl" suffix is stripped automatically for
-                            compatibility with the FAISS native serialisation.
+            pickle_file:    Index directory (see index_store.py).  A ".pkl"
+                            suffix is stripped automatically for
+                            compatibility with older store paths.
+            embeddings:     Embeddings client to use instead of the shared
+                            Gemini client (e.g. a stub in benchmarks).
+            llm:            Chat model to use instead of the shared Gemini
+                            client.
 
         Raises:
-            ValueError: If no API key is available.
+            ValueError: If no API key is available and no clients are injected.
         """
         if google_api_key is None:
             google_api_key = os.environ.get("GOOGLE_API_KEY")
 
-        if not google_api_key:
+        if not google_api_key and (embeddings is None or llm is None):
             raise ValueError("GOOGLE_API_KEY environment variable is not set")
 
         # Store key for use in embedding fallback attempts
         self.google_api_key = google_api_key
 
-        # Primary embedding model
-        logger.info(
-            "Initialising embeddings with model '%s' (api_version=%s).",
-            _PRIMARY_EMBED_MODEL,
-            _PRIMARY_EMBED_API_VER,
-        )
-        self.embeddings = GoogleGenerativeAIEmbeddings(
-            model=_PRIMARY_EMBED_MODEL,
-            google_api_key=google_api_key,
-            model_kwargs={"api_version": _PRIMARY_EMBED_API_VER},
+        # Primary embedding model (shared across requests unless injected)
+        self.embeddings = embeddings or get_embeddings_client(
+            _PRIMARY_EMBED_MODEL, _PRIMARY_EMBED_API_VER, google_api_key
         )
+        # Model behind self.embeddings (switches on fallback, or on loading
+        # an index built by a fallback model)
+        self.embed_model = _PRIMARY_EMBED_MODEL
+        self.embed_api_version = _PRIMARY_EMBED_API_VER
+        self._embeddings_injected = embeddings is not None
 
         # LLM used for RAG answer generation
-        logger.info("Initialising LLM with model '%s'.", _LLM_MODEL)
-        self.llm = ChatGoogleGenerativeAI(
-            model=_LLM_MODEL,
-            temperature=0.9,
-            google_api_key=google_api_key,
-            model_kwargs={"api_version": "v1"},
-        )
+        self.llm = llm or get_llm_client(_LLM_MODEL, "v1", google_api_key)
 
         self.vectorstore: FAISS | None = None
 
         # Strip ".pkl" so the path works with FAISS's directory-based serialisation
         self.pickle_file = pickle_file.removesuffix(".pkl")
 
-        # Splitter configuration: prefer paragraph > line > sentence > comma breaks
         self.text_splitter = RecursiveCharacterTextSplitter(
-            separators=["\n\n", "\n", ".", ","],
-            chunk_size=1000,
+            separators=_SPLITTER_SEPARATORS,
+            chunk_size=_CHUNK_SIZE,
+            # Chunk offsets map structured chunks back to their pages
+            add_start_index=True,
         )
 
         logger.debug("VectorStore initialised.  FAISS index path: '%s'.", self.pickle_file)
@@ -154,26 +454,142 @@ class VectorStore:
         logger.debug("chunk_text_by_full_stops: produced %d chunk(s).", len(cleaned))
         return cleaned
 
+    def iter_chunks(self, pieces: Iterable[str]) -> Iterator[Document]:
+        """
+        Split a text that arrives in consecutive pieces into chunk Documents.
+
+        The pieces are concatenated as-is (callers insert any separators,
+        e.g. a newline between pages).  Once more than _CHUNK_WINDOW
+        characters are buffered, the buffer is split and every chunk but the
+        last is emitted; the last one may continue in the next piece, so it
+        is carried over.  The chunks match a one-shot split of the full text
+        except possibly around those carry-over points.
+
+        Args:
+            pieces: Text fragments in document order.
+
+        Yields:
+            Chunk Documents with {"source": "pdf"} metadata.
+        """
+        buffer = ""
+        for piece in pieces:
+            buffer += piece
+            if len(buffer) < _CHUNK_WINDOW:
+                continue
+            with STAGE_SECONDS.labels(stage="chunk").time():
+                chunks = self.text_splitter.split_text(buffer)
+            for chunk in chunks[:-1]:
+                yield Document(page_content=chunk, metadata={"source": "pdf"})
+            buffer = chunks[-1] if chunks else ""
+
+        with STAGE_SECONDS.labels(stage="chunk").time():
+            chunks = self.text_splitter.split_text(buffer)
+        for chunk in chunks:
+            yield Document(page_content=chunk, metadata={"source": "pdf"})
+
+    def iter_structured_chunks(self, pages: Iterable[Tuple[int, List[Tuple[str, bool]]]]) -> Iterator[Document]:
+        """
+        Split structured pages into chunk Documents that never span sections.
+
+        Every heading that follows body text closes the current section:
+        the section is split and all its chunks are emitted.  Consecutive
+        headings form one section title ("3 Photosynthesis – 3.1 Light").
+        Heading lines stay in the chunk text, so the first chunk of a
+        section says what it is about.  Long sections are split
+        incrementally past _CHUNK_WINDOW characters, like iter_chunks().
+
+        Args:
+            pages: (page_number, [(line_text, is_heading), ...]) in document
+                   order, as produced by pdf_extractor.iter_structured_pages().
+
+        Yields:
+            Chunk Documents with "source", "page_start", "page_end" and,
+            once a heading has been seen, "section" metadata.
+        """
+        section = ""
+        buffer = ""
+        # (offset in buffer, page number) wherever a new page starts
+        marks: List[Tuple[int, int]] = []
+        has_body = False
+
+        for page_num, lines in pages:
+            marks.append((len(buffer), page_num))
+            for text, is_heading in lines:
+                if is_heading and has_body:
+                    yield from self._split_section(buffer, marks, section, final=True)
+                    section, buffer, marks, has_body = "", "", [(0, page_num)], False
+                if is_heading:
+                    title = text.strip()
+                    section = f"{section} – {title}" if section else title
+                    section = section[:_SECTION_TITLE_MAX_CHARS]
+                else:
+                    has_body = has_body or bool(text.strip())
+                buffer += text + "\n"
+
+            if len(buffer) >= _CHUNK_WINDOW:
+                carry = yield from self._split_section(buffer, marks, section, final=False)
+                buffer, marks = carry
+
+        if buffer.strip():
+            yield from self._split_section(buffer, marks, section, final=True)
+
+    def _split_section(
+        self,
+        buffer: str,
+        marks: List[Tuple[int, int]],
+        section: str,
+        final: bool,
+    ) -> Iterator[Document]:
+        """
+        Emit the chunks of a section buffer for iter_structured_chunks().
+
+        Unless ``final``, the last chunk is held back (it may continue on the
+        next page); the generator then returns the carried-over text and its
+        page marks, rebased to offset 0.
+        """
+        with STAGE_SECONDS.labels(stage="chunk").time():
+            docs = self.text_splitter.create_documents([buffer])
+        carried = docs.pop() if docs and not final else None
+
+        for doc in docs:
+            start = max(0, doc.metadata.get("start_index", 0))
+            metadata: Dict[str, Any] = {
+                "source": "pdf",
+                "page_start": _page_at(marks, start),
+                "page_end": _page_at(marks, start + len(doc.page_content) - 1),
+            }
+            if section:
+                metadata["section"] = section
+            yield Document(page_content=doc.page_content, metadata=metadata)
+
+        if carried is None:
+            return "", []
+        start = max(0, carried.metadata.get("start_index", 0))
+        rebased = [(0, _page_at(marks, start))] + [(o - start, p) for o, p in marks if o > start]
+        return buffer[start:], rebased
+
     # ------------------------------------------------------------------
     # Index creation
     # ------------------------------------------------------------------
 
-    def create_vector_store_from_text(self, text: str) -> bool:
+    def create_vector_store_from_text(
+        self,
+        text: str,
+        on_stage: Callable[[str], None] | None = None,
+    ) -> bool:
         """
         Build a FAISS vector store from raw text.
 
-        Steps:
-          1. Wrap the text in a LangChain Document.
-          2. Split into chunks with RecursiveCharacterTextSplitter.
-          3. Embed chunks using the primary Gemini embedding model,
-             falling back to alternatives if the primary fails.
-          4. Persist the index to disk via FAISS.save_local.
+        Convenience wrapper around create_vector_store_from_pages() for text
+        that is already in memory.
 
         Args:
-            text: The full document text to index.
+            text:     The full document text to index.
+            on_stage: Optional progress callback, see
+                      create_vector_store_from_pages().
 
         Returns:
-            True on success.
+            True on success, False if the text produced no chunks.
 
         Raises:
             Exception: If the vector store cannot be created after all fallbacks.
@@ -181,54 +597,268 @@ class VectorStore:
         logger.info(
             "Creating vector store from %d characters of text.", len(text)
         )
+        return self.create_vector_store_from_pages([text], on_stage=on_stage)
 
-        try:
-            # 1. Wrap in a Document so the splitter keeps metadata intact
-            doc = Document(page_content=text, metadata={"source": "pdf"})
+    def create_vector_store_from_pages(
+        self,
+        pieces: Iterable[str],
+        on_stage: Callable[[str], None] | None = None,
+        resolve_path: Callable[[], str] | None = None,
+    ) -> bool:
+        """
+        Build a FAISS vector store from a stream of text pieces.
 
-            # 2. Split into chunks
-            docs = self.text_splitter.split_documents([doc])
-            logger.info("Text split into %d chunk(s).", len(docs))
+        Steps:
+          1. Split the pieces into chunks incrementally (iter_chunks()).
+          2. Embed every _EMBED_BATCH_SIZE chunks on a thread pool, up to
+             _EMBED_CONCURRENCY batches at once, while later pages are
+             still being extracted and chunked.  Each batch is rate-limited
+             and retried on its own; only a batch that keeps failing makes
+             the build switch to a fallback model.
+          3. Add each embedded batch to the FAISS index, in order.
+          4. Persist the index to disk.
+
+        Only the batches in flight and the one being assembled are held
+        besides the index itself, so peak memory does not grow with the size
+        of the raw document.
 
-            if not docs:
-                logger.warning("Text splitter produced zero chunks – aborting.")
-                return False
+        Args:
+            pieces:       Consecutive fragments of the document text, e.g.
+                          page texts (callers insert separators).
+            on_stage:     Optional progress callback, called with "chunk",
+                          "embed" and "index" as each step is first reached.
+            resolve_path: Optional callable invoked once every chunk has been
+                          indexed; its return value replaces the store path
+                          before saving.  Lets callers name the index after
+                          content that is only known at the end of the stream.
 
-            # 3. Embed and build FAISS index
-            try:
-                logger.debug("Attempting primary embedding model '%s'.", _PRIMARY_EMBED_MODEL)
-                self.vectorstore = FAISS.from_documents(docs, self.embeddings)
-                logger.info("Vector store created with primary embedding model.")
-            except Exception as primary_exc:
-                logger.warning(
-                    "Primary embedding model failed: %s.  Trying fallbacks.", primary_exc
-                )
-                self._try_fallback_embeddings(docs, primary_exc)
+        Returns:
+            True on success, False if the pieces produced no chunks.
 
-            # Brief pause to stay within API rate limits
-            logger.debug("Sleeping %ds to avoid rate-limit issues.", _RATE_LIMIT_SLEEP)
-            time.sleep(_RATE_LIMIT_SLEEP)
+        Raises:
+            Exception: If the vector store cannot be created after all fallbacks.
+        """
+        return self._build_from_chunks(self.iter_chunks(pieces), on_stage, resolve_path)
+
+    def create_vector_store_from_structured_pages(
+        self,
+        pages: Iterable[Tuple[int, List[Tuple[str, bool]]]],
+        on_stage: Callable[[str], None] | None = None,
+        resolve_path: Callable[[], str] | None = None,
+    ) -> bool:
+        """
+        Build a FAISS vector store from a stream of structured pages.
+
+        Same pipeline as create_vector_store_from_pages(), chunked with
+        iter_structured_chunks() so every chunk records its section title
+        and page range.
+
+        Args:
+            pages:        (page_number, [(line_text, is_heading), ...]) in
+                          document order, headers and footers already
+                          stripped (see pdf_extractor.iter_structured_pages()).
+            on_stage:     See create_vector_store_from_pages().
+            resolve_path: See create_vector_store_from_pages().
+
+        Returns:
+            True on success, False if the pages produced no chunks.
 
-            # 4. Persist the index to disk
-            self.vectorstore.save_local(self.pickle_file)
+        Raises:
+            Exception: If the vector store cannot be created after all fallbacks.
+        """
+        return self._build_from_chunks(self.iter_structured_chunks(pages), on_stage, resolve_path)
+
+    def _build_from_chunks(
+        self,
+        docs: Iterable[Document],
+        on_stage: Callable[[str], None] | None,
+        resolve_path: Callable[[], str] | None,
+    ) -> bool:
+        """Embed, index and save a stream of chunks (steps 2-4 of create_vector_store_from_pages())."""
+        reached: List[str] = []
+
+        def stage(name: str) -> None:
+            if name not in reached:
+                reached.append(name)
+                if on_stage is not None:
+                    on_stage(name)
+
+        def chunks() -> Iterator[Document]:
+            for doc in docs:
+                stage("chunk")
+                yield doc
+
+        try:
+            self.vectorstore = None
+            embedder = _document_embedder(self.embeddings, self.embed_model)
+            chunk_count = 0
+
+            with ThreadPoolExecutor(max_workers=_EMBED_CONCURRENCY, thread_name_prefix="embed") as pool:
+                in_flight: List[Tuple[List[Document], Future]] = []
+                for batch in _batched(chunks(), _EMBED_BATCH_SIZE):
+                    stage("embed")
+                    chunk_count += len(batch)
+                    in_flight.append(
+                        (batch, pool.submit(embedder.embed_documents, [d.page_content for d in batch]))
+                    )
+                    # Keep the pool busy while the next batch is assembled
+                    if len(in_flight) > _EMBED_CONCURRENCY:
+                        embedder = self._index_batch(in_flight, embedder, pool)
+                while in_flight:
+                    embedder = self._index_batch(in_flight, embedder, pool)
+
+            logger.info("Text split into %d chunk(s).", chunk_count)
+            if self.vectorstore is None:
+                logger.warning("Text splitter produced zero chunks – aborting.")
+                return False
+
+            # Persist the index to disk
+            stage("index")
+            self._apply_index_factory()
+            if resolve_path is not None:
+                self.pickle_file = resolve_path().removesuffix(".pkl")
+            self._save_atomically()
             logger.info("FAISS index saved to '%s'.", self.pickle_file)
 
+            # Warm the process-wide cache so the first question skips the disk
+            if SHARED_INDEX_ENABLED:
+                # The shared index copies the vectors; keep the mmapped saved
+                # index behind it rather than the heap-built one
+                self.vectorstore = load_index_dir(self.pickle_file, self.embeddings, **_FAISS_KWARGS)
+            self._cache_loaded()
+
             return True
 
         except Exception as exc:
             logger.exception("Failed to create vector store: %s", exc)
             raise Exception(f"Error creating vector store: {exc}") from exc
 
-    def _try_fallback_embeddings(self, docs: List[Document], original_exc: Exception) -> None:
+    def _index_batch(
+        self,
+        in_flight: List[Tuple[List[Document], Future]],
+        embedder: Embeddings,
+        pool: ThreadPoolExecutor,
+    ) -> Embeddings:
+        """
+        Add the oldest in-flight batch to the index once its vectors arrive.
+
+        A failed batch has already been retried by RateLimitedEmbeddings, so
+        a failure here means the primary model is persistently failing: the
+        in-flight batches are drained and every chunk seen so far is
+        re-embedded with a fallback model (vector dimensions differ between
+        models, so one index cannot mix them).
+
+        Returns:
+            The embedder to use for the remaining batches.
+        """
+        batch, future = in_flight.pop(0)
+        try:
+            vectors = future.result()
+        except Exception as exc:
+            if self.embed_model != _PRIMARY_EMBED_MODEL:
+                raise
+            logger.warning("Primary embedding model failed: %s.  Trying fallbacks.", exc)
+            docs = self._indexed_documents() + batch
+            for later_batch, later_future in in_flight:
+                later_future.cancel()
+                docs.extend(later_batch)
+            in_flight.clear()
+            return self._try_fallback_embeddings(docs, exc, pool)
+
+        self._add_to_index(batch, vectors, embedder)
+        return embedder
+
+    def _add_to_index(
+        self,
+        batch: List[Document],
+        vectors: List[List[float]],
+        embedder: Embeddings,
+    ) -> None:
+        """Append embedded chunks to the in-memory index, creating it on first use."""
+        text_embeddings = [(doc.page_content, vec) for doc, vec in zip(batch, vectors)]
+        metadatas = [doc.metadata for doc in batch]
+        with STAGE_SECONDS.labels(stage="index_add").time():
+            if self.vectorstore is None:
+                self.vectorstore = FAISS.from_embeddings(
+                    text_embeddings, embedder, metadatas=metadatas, **_FAISS_KWARGS
+                )
+            else:
+                self.vectorstore.add_embeddings(text_embeddings, metadatas=metadatas)
+
+    def _apply_index_factory(self) -> None:
+        """
+        Re-encode the freshly built flat index per FAISS_INDEX_FACTORY.
+
+        Falls back to keeping the flat index if FAISS cannot train the
+        requested one.
+        """
+        index = self.vectorstore.index
+        if _INDEX_FACTORY == "Flat" or index.ntotal < _INDEX_FACTORY_MIN_VECTORS:
+            return
+        try:
+            with STAGE_SECONDS.labels(stage="index_encode").time():
+                self.vectorstore.index = build_factory_index(index, _INDEX_FACTORY)
+        except RuntimeError as exc:
+            logger.warning(
+                "Could not build a '%s' index over %d vectors (%s) – keeping it flat.",
+                _INDEX_FACTORY,
+                index.ntotal,
+                exc,
+            )
+            return
+        logger.info("Index re-encoded as '%s' (%d vectors).", _INDEX_FACTORY, index.ntotal)
+
+    def _indexed_documents(self) -> List[Document]:
+        """Return the chunks already in the in-memory index, in insertion order."""
+        if self.vectorstore is None:
+            return []
+        docstore = self.vectorstore.docstore
+        index_to_id = self.vectorstore.index_to_docstore_id
+        docs = (docstore.search(index_to_id[i]) for i in range(len(index_to_id)))
+        # Fresh Documents without ids – they are re-added under new ones
+        return [Document(page_content=d.page_content, metadata=d.metadata) for d in docs]
+
+    def _save_atomically(self) -> None:
+        """
+        Write the index to a temporary sibling directory, then rename it into place.
+
+        Readers therefore never observe a half-written index.  If another
+        process already published an index at the same path (two uploads of
+        the same document racing), that copy is kept and ours is discarded.
+        """
+        tmp_path = f"{self.pickle_file}.tmp-{uuid.uuid4().hex}"
+        with STAGE_SECONDS.labels(stage="index_save").time():
+            save_compact_index(self.vectorstore, tmp_path, (self.embed_model, self.embed_api_version))
+        try:
+            os.rename(tmp_path, self.pickle_file)
+        except OSError:
+            if not self.index_exists():
+                shutil.rmtree(tmp_path, ignore_errors=True)
+                raise
+            logger.info("Index at '%s' was published concurrently – keeping it.", self.pickle_file)
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+    def _try_fallback_embeddings(
+        self,
+        docs: List[Document],
+        original_exc: Exception,
+        pool: ThreadPoolExecutor,
+    ) -> Embeddings:
         """
         Try each entry in _FALLBACK_EMBED_MODELS until one succeeds.
 
-        Updates self.embeddings and self.vectorstore on the first success.
+        Rebuilds the index from ``docs`` with the fallback model, embedding
+        batches concurrently on ``pool``.  Updates self.embeddings,
+        self.embed_model and self.vectorstore on the first success.
 
         Args:
             docs:         The already-split Document list to embed.
             original_exc: The exception raised by the primary model
                           (re-raised if all fallbacks fail).
+            pool:         Thread pool of the running build.
+
+        Returns:
+            The embedder to use for the rest of the build.
 
         Raises:
             Exception: If every fallback model also fails.
@@ -242,18 +872,28 @@ class VectorStore:
                 api_version,
             )
             try:
-                fallback_emb = GoogleGenerativeAIEmbeddings(
-                    model=model_name,
-                    google_api_key=self.google_api_key,
-                    model_kwargs={"api_version": api_version},
+                fallback_emb = get_embeddings_client(
+                    model_name, api_version, self.google_api_key
                 )
-                self.vectorstore = FAISS.from_documents(docs, fallback_emb)
-                # Persist the working model so future calls use it
+                embedder = _document_embedder(fallback_emb, model_name)
+                batches = list(_batched(docs, _EMBED_BATCH_SIZE))
+                futures = [
+                    pool.submit(embedder.embed_documents, [d.page_content for d in batch])
+                    for batch in batches
+                ]
+                self.vectorstore = None
+                for batch, future in zip(batches, futures):
+                    self._add_to_index(batch, future.result(), embedder)
+                # Persist the working model so future calls use it; it is
+                # recorded with the index for later loads (see load_index())
                 self.embeddings = fallback_emb
+                self.embed_model = model_name
+                self.embed_api_version = api_version
+                EMBEDDING_FALLBACKS.labels(model=model_name).inc()
                 logger.info(
                     "Vector store created with fallback model '%s'.", model_name
                 )
-                return
+                return embedder
             except Exception as fallback_exc:
                 logger.warning(
                     "Fallback model '%s' also failed: %s", model_name, fallback_exc
@@ -303,7 +943,223 @@ class VectorStore:
     # Retrieval-augmented generation (RAG)
     # ------------------------------------------------------------------
 
-    def query_with_sources(self, query: str) -> Dict[str, Any]:
+    def _ensure_loaded(self) -> None:
+        """
+        Lazy-load the index from the cache / disk if not already in memory.
+
+        Raises:
+            ValueError: If there is neither an in-memory nor a saved index.
+        """
+        if self.vectorstore is None:
+            if not self.load_index():
+                raise ValueError(
+                    "Vector store not initialised and no saved index found at "
+                    f"'{self.pickle_file}'."
+                )
+
+    def embed_query(self, query: str) -> List[float]:
+        """
+        Embed ``query`` with the store's model, through the query embedding cache.
+
+        The vector can be passed to retrieve() / query_with_sources() of
+        any store built with the same model, so one question can be
+        retrieved against several indexes with a single embedding.
+        """
+        cache = get_query_embedding_cache()
+        space = _embedding_space(self.embed_model)
+        vector = cache.get(space, query) if cache is not None else None
+        if vector is None:
+            vector = self.embeddings.embed_query(query)
+            if cache is not None:
+                cache.put(space, query, vector)
+        return vector
+
+    async def aembed_query(self, query: str) -> List[float]:
+        """Async variant of embed_query()."""
+        cache = get_query_embedding_cache()
+        space = _embedding_space(self.embed_model)
+        vector = await cache.aget(space, query) if cache is not None else None
+        if vector is None:
+            vector = await self.embeddings.aembed_query(query)
+            if cache is not None:
+                await cache.aput(space, query, vector)
+        return vector
+
+    def needs_query_embedding(self, query: str) -> bool:
+        """
+        Return whether retrieving ``query`` embeds it – False for keyword
+        questions answered from the BM25 index alone (see RETRIEVAL_MODE).
+        """
+        return self._plan_retrieval(query, _RETRIEVAL_K)[0] != "lexical"
+
+    def _plan_retrieval(self, query: str, k: int) -> Tuple[str, List[Tuple[int, float]]]:
+        """
+        Pick the retrieval mode for ``query`` and run its BM25 side.
+
+        Returns:
+            (mode, lexical hits) where mode is "lexical", "hybrid" or
+            "vector"; only "lexical" needs no query embedding.
+        """
+        lexical = getattr(self.vectorstore, "lexical_index", None)
+        if _RETRIEVAL_MODE == "vector" or lexical is None:
+            return "vector", []
+
+        hits, coverage = lexical.search(query, _FUSION_CANDIDATES * k)
+        if _RETRIEVAL_MODE == "lexical" and hits:
+            return "lexical", hits
+        if hits and coverage >= _LEXICAL_MIN_COVERAGE and hits[0][1] >= _LEXICAL_MIN_SCORE:
+            return "lexical", hits
+        return ("hybrid" if hits else "vector"), hits
+
+    def _vector_hits(self, embedding: List[float], count: int) -> List[Tuple[int, float]]:
+        """Return up to ``count`` (position, distance) pairs nearest to ``embedding``."""
+        vector = np.asarray([embedding], dtype=np.float32)
+        if _FAISS_KWARGS.get("normalize_L2"):
+            faiss.normalize_L2(vector)
+        distances, positions = self.vectorstore.index.search(vector, count)
+        return [(int(p), float(d)) for p, d in zip(positions[0], distances[0]) if p != -1]
+
+    def _scored_documents(
+        self,
+        mode: str,
+        lexical_hits: List[Tuple[int, float]],
+        vector_hits: List[Tuple[int, float]],
+        k: int,
+    ) -> List[Tuple[Document, float]]:
+        """
+        Turn the ranked hits of ``mode`` into the top-k (chunk, relevance) pairs.
+
+        Relevance is relative to the best hit of each ranking: BM25 score
+        over the best score, cosine similarity (from the L2 distance of
+        normalised vectors) over the best similarity.  Hybrid rankings are
+        merged by reciprocal rank fusion – BM25 scores and distances are not
+        on comparable scales, their ranks are – and a chunk's relevance is
+        the mean of its two relative scores (0 for a ranking missing it).
+        """
+        RETRIEVALS.labels(mode=mode).inc()
+        lexical = _relative_scores(lexical_hits)
+        vector = _relative_scores([(p, max(0.0, 1.0 - d / 2)) for p, d in vector_hits])
+        if mode == "lexical":
+            ranked = [(p, lexical[p]) for p, _ in lexical_hits[:k]]
+        elif mode == "vector":
+            ranked = [(p, vector[p]) for p, _ in vector_hits[:k]]
+        else:
+            fused: Dict[int, float] = {}
+            for hits in (lexical_hits, vector_hits):
+                for rank, (position, _) in enumerate(hits):
+                    fused[position] = fused.get(position, 0.0) + 1.0 / (_RRF_K + rank + 1)
+            positions = sorted(fused, key=fused.get, reverse=True)[:k]
+            ranked = [(p, (lexical.get(p, 0.0) + vector.get(p, 0.0)) / 2) for p in positions]
+
+        docstore = self.vectorstore.docstore
+        index_to_id = self.vectorstore.index_to_docstore_id
+        return [(docstore.search(index_to_id[p]), score) for p, score in ranked]
+
+    def retrieve_scored(
+        self,
+        query: str,
+        k: int = _RETRIEVAL_K,
+        query_vector: List[float] | None = None,
+    ) -> List[Tuple[Document, float]]:
+        """
+        Return the ``k`` chunks most relevant to ``query`` (see RETRIEVAL_MODE).
+
+        Keyword-heavy questions are answered from the BM25 index alone, so
+        they cost no embedding call.
+
+        Args:
+            query:        Question text (always used for the BM25 side).
+            k:            Number of chunks to return.
+            query_vector: Precomputed embedding of ``query`` (embed_query());
+                          embedded through the query cache when omitted.
+
+        Returns:
+            (chunk, relevance) pairs, best first; relevance is in 0–1,
+            relative to the best hit (see _scored_documents()).
+        """
+        with STAGE_SECONDS.labels(stage="retrieve").time():
+            mode, lexical_hits = self._plan_retrieval(query, k)
+            vector_hits = []
+            if mode != "lexical":
+                embedding = query_vector if query_vector is not None else self.embed_query(query)
+                vector_hits = self._vector_hits(embedding, _FUSION_CANDIDATES * k if lexical_hits else k)
+            return self._scored_documents(mode, lexical_hits, vector_hits, k)
+
+    async def aretrieve_scored(
+        self,
+        query: str,
+        k: int = _RETRIEVAL_K,
+        query_vector: List[float] | None = None,
+    ) -> List[Tuple[Document, float]]:
+        """Async variant of retrieve_scored() – the query embedding is awaited."""
+        with STAGE_SECONDS.labels(stage="retrieve").time():
+            mode, lexical_hits = self._plan_retrieval(query, k)
+            vector_hits = []
+            if mode != "lexical":
+                embedding = query_vector if query_vector is not None else await self.aembed_query(query)
+                vector_hits = self._vector_hits(embedding, _FUSION_CANDIDATES * k if lexical_hits else k)
+            return self._scored_documents(mode, lexical_hits, vector_hits, k)
+
+    def retrieve(
+        self,
+        query: str,
+        k: int = _RETRIEVAL_K,
+        query_vector: List[float] | None = None,
+    ) -> List[Document]:
+        """Return the ``k`` chunks most relevant to ``query``, see retrieve_scored()."""
+        return [doc for doc, _ in self.retrieve_scored(query, k, query_vector)]
+
+    async def aretrieve(
+        self,
+        query: str,
+        k: int = _RETRIEVAL_K,
+        query_vector: List[float] | None = None,
+    ) -> List[Document]:
+        """Async variant of retrieve()."""
+        return [doc for doc, _ in await self.aretrieve_scored(query, k, query_vector)]
+
+    def _prepare_rag(
+        self, query: str, query_vector: List[float] | None = None
+    ) -> Tuple[List[Document], Any, Dict[str, str]]:
+        """
+        Retrieve context for ``query`` and build the prompt → LLM chain.
+
+        CONTEXT_CANDIDATES chunks are retrieved and build_context() keeps
+        the relevant, non-redundant ones that fit the token budget.
+
+        Returns:
+            (relevant_docs, chain, chain_inputs)
+        """
+        candidates = self.retrieve_scored(query, k=CONTEXT_CANDIDATES, query_vector=query_vector)
+        return self._rag_chain(query, candidates)
+
+    async def _aprepare_rag(
+        self, query: str, query_vector: List[float] | None = None
+    ) -> Tuple[List[Document], Any, Dict[str, str]]:
+        """Async variant of _prepare_rag() – the query embedding is awaited."""
+        candidates = await self.aretrieve_scored(query, k=CONTEXT_CANDIDATES, query_vector=query_vector)
+        return self._rag_chain(query, candidates)
+
+    def _rag_chain(
+        self, query: str, candidates: List[Tuple[Document, float]]
+    ) -> Tuple[List[Document], Any, Dict[str, str]]:
+        """Select the context from ``candidates`` and build the prompt → LLM chain and its inputs."""
+        relevant_docs, stats = build_context(candidates)
+        logger.info(
+            "RAG: %d of %d candidate chunk(s), ~%d token(s) of context.",
+            stats["chunks"],
+            stats["candidates"],
+            stats["tokens"],
+        )
+
+        # Concatenate chunk texts as LLM context
+        context = "\n\n".join(doc.page_content for doc in relevant_docs)
+
+        # Pipe prompt → LLM (LangChain Expression Language)
+        chain = _RAG_PROMPT | self.llm
+        return relevant_docs, chain, {"context": context, "question": query}
+
+    def query_with_sources(self, query: str, query_vector: List[float] | None = None) -> Dict[str, Any]:
         """
         Answer a question using retrieved context and return source snippets.
 
@@ -311,65 +1167,32 @@ class VectorStore:
         the previously persisted FAISS index from disk.
 
         Args:
-            query: The question to answer.
+            query:        The question to answer.
+            query_vector: Optional precomputed embedding of ``query``.
 
         Returns:
             A dict with:
                 - "answer"  (str)  : LLM-generated answer.
-                - "sources" (list) : Up to 5 source dicts, each containing
-                                      "content" (first 200 chars) and "metadata".
+                - "sources" (list) : One dict per chunk in the prompt (at
+                                      most RAG_CONTEXT_MAX_CHUNKS), each
+                                      containing "content" (first 200
+                                      chars) and "metadata".
 
         Raises:
             ValueError: If the vector store is not available (neither
                         in-memory nor on disk).
             Exception:  If retrieval or LLM inference fails.
         """
-        # Lazy-load from disk if not already in memory
-        if self.vectorstore is None:
-            if os.path.exists(self.pickle_file):
-                logger.info(
-                    "query_with_sources: loading vector store from disk ('%s').",
-                    self.pickle_file,
-                )
-                self.vectorstore = FAISS.load_local(
-                    self.pickle_file,
-                    self.embeddings,
-                    allow_dangerous_deserialization=True,
-                )
-            else:
-                raise ValueError(
-                    "Vector store not initialised and no saved index found at "
-                    f"'{self.pickle_file}'."
-                )
+        self._ensure_loaded()
 
         logger.info("query_with_sources: query='%s'.", query)
 
         try:
-            # Retrieve the most relevant chunks
-            retriever = self.vectorstore.as_retriever(search_kwargs={"k": 5})
-            relevant_docs = retriever.invoke(query)
-            logger.debug(
-                "query_with_sources: retrieved %d document(s).", len(relevant_docs)
-            )
-
-            # Concatenate chunk texts as LLM context
-            context = "\n\n".join(doc.page_content for doc in relevant_docs)
-
-            # Build a simple RAG prompt
-            prompt = ChatPromptTemplate.from_template(
-                "You are a helpful tutor. Answer the following question based on "
-                "the provided context.\n\n"
-                "Context:\n{context}\n\n"
-                "Question: {question}\n\n"
-                "Answer:"
-            )
-
-            # Pipe prompt → LLM (LangChain Expression Language)
-            chain = prompt | self.llm
-            result = chain.invoke({"context": context, "question": query})
+            relevant_docs, chain, inputs = self._prepare_rag(query, query_vector)
+            result = chain.invoke(inputs)
 
             # Extract plain-text answer regardless of return type
-            answer = result.content if hasattr(result, "content") else str(result)
+            answer = _message_text(result)
             logger.debug(
                 "query_with_sources: answer generated (%d chars).", len(answer)
             )
@@ -389,29 +1212,174 @@ class VectorStore:
             logger.exception("query_with_sources failed: %s", exc)
             raise Exception(f"Error querying vector store: {exc}") from exc
 
+    def query_with_sources_stream(self, query: str, query_vector: List[float] | None = None) -> Iterator[str]:
+        """
+        Answer a question like query_with_sources(), yielding sentences as
+        soon as the LLM has finished generating each one.
+
+        Retrieval happens before the first sentence is yielded; the LLM
+        output is then consumed as a token stream and cut at sentence
+        boundaries incrementally, so callers can forward the first sentence
+        while the rest of the answer is still being generated.
+
+        Args:
+            query:        The question to answer.
+            query_vector: Optional precomputed embedding of ``query``.
+
+        Yields:
+            Complete sentences (stripped), in order.  A trailing fragment
+            without terminal punctuation is yielded when the stream ends.
+
+        Raises:
+            ValueError: If the vector store is not available.
+            Exception:  If retrieval or LLM inference fails.
+        """
+        self._ensure_loaded()
+
+        logger.info("query_with_sources_stream: query='%s'.", query)
+
+        try:
+            _, chain, inputs = self._prepare_rag(query, query_vector)
+            tokens = (_message_text(chunk) for chunk in chain.stream(inputs))
+            yield from iter_sentences(tokens)
+        except Exception as exc:
+            logger.exception("query_with_sources_stream failed: %s", exc)
+            raise Exception(f"Error querying vector store: {exc}") from exc
+
+    async def aquery_with_sources(self, query: str, query_vector: List[float] | None = None) -> Dict[str, Any]:
+        """
+        Async variant of query_with_sources().
+
+        The index must already be loaded (see load_index()); retrieval and
+        generation are awaited, so many answers can be in flight on one
+        event loop.
+        """
+        self._ensure_loaded()
+
+        logger.info("aquery_with_sources: query='%s'.", query)
+
+        try:
+            relevant_docs, chain, inputs = await self._aprepare_rag(query, query_vector)
+            answer = _message_text(await chain.ainvoke(inputs))
+            return {
+                "answer": answer,
+                "sources": [
+                    {"content": doc.page_content[:200], "metadata": doc.metadata}
+                    for doc in relevant_docs
+                ],
+            }
+        except Exception as exc:
+            logger.exception("aquery_with_sources failed: %s", exc)
+            raise Exception(f"Error querying vector store: {exc}") from exc
+
+    async def aquery_with_sources_stream(
+        self, query: str, query_vector: List[float] | None = None
+    ) -> AsyncIterator[str]:
+        """
+        Async variant of query_with_sources_stream().
+
+        The index must already be loaded (see load_index()).
+        """
+        self._ensure_loaded()
+
+        logger.info("aquery_with_sources_stream: query='%s'.", query)
+
+        try:
+            _, chain, inputs = await self._aprepare_rag(query, query_vector)
+            tokens = (_message_text(chunk) async for chunk in chain.astream(inputs))
+            async for sentence in aiter_sentences(tokens):
+                yield sentence
+        except Exception as exc:
+            logger.exception("aquery_with_sources_stream failed: %s", exc)
+            raise Exception(f"Error querying vector store: {exc}") from exc
+
     # ------------------------------------------------------------------
     # Persistence helpers
     # ------------------------------------------------------------------
 
     def load_index(self) -> bool:
         """
-        Load a previously persisted FAISS index from disk into memory.
+        Load a previously persisted FAISS index into memory.
+
+        The process-wide index cache is consulted first so repeated questions
+        against the same session do not re-read the index.  On a miss the
+        vectors are memory-mapped (see index_store.py), so the load is cheap
+        and the pages are shared with other worker processes.  Queries are
+        then embedded with the model recorded for the index, which differs
+        from the primary one if the index was built by a fallback model.
 
         Returns:
             True if the index was found and loaded, False otherwise.
         """
+        cache = get_index_cache()
+        cached = cache.get(self.pickle_file)
+        record_cache_lookup("index", hit=cached is not None)
+        if cached is not None:
+            logger.debug("load_index: cache hit for '%s'.", self.pickle_file)
+            self._use_index_model(getattr(cached, "embed_model", None))
+            self.vectorstore = cached
+            return True
+
         if os.path.exists(self.pickle_file):
             logger.info("Loading FAISS index from '%s'.", self.pickle_file)
-            self.vectorstore = FAISS.load_local(
-                self.pickle_file,
-                self.embeddings,
-                allow_dangerous_deserialization=True,
-            )
+            # Before loading, so the loaded store embeds with the right model
+            self._use_index_model(read_index_model(self.pickle_file))
+            with STAGE_SECONDS.labels(stage="index_load").time():
+                self.vectorstore = load_index_dir(self.pickle_file, self.embeddings, **_FAISS_KWARGS)
+            self._cache_loaded()
             return True
 
         logger.warning("load_index: path '%s' does not exist.", self.pickle_file)
         return False
 
+    def _use_index_model(self, model: Tuple[str, str] | None) -> None:
+        """Switch query embeddings to the (model, api_version) that built the index."""
+        if model is None or model[0] == self.embed_model:
+            return
+        if self._embeddings_injected:
+            logger.warning(
+                "Index '%s' was built with '%s' – keeping the injected embeddings.", self.pickle_file, model[0]
+            )
+            return
+        logger.info("Index '%s' was built with '%s' – embedding queries with it.", self.pickle_file, model[0])
+        self.embeddings = get_embeddings_client(model[0], model[1], self.google_api_key)
+        self.embed_model, self.embed_api_version = model
+
+    def _cache_loaded(self) -> None:
+        """Put the loaded index in the index cache, moving its vectors to the shared index if enabled."""
+        on_remove = None
+        if SHARED_INDEX_ENABLED:
+            with STAGE_SECONDS.labels(stage="index_share").time():
+                self.vectorstore = share_index(self.vectorstore)
+            # Unset if the vectors could not be shared
+            on_remove = getattr(self.vectorstore.index, "release", None)
+        get_index_cache().put(self.pickle_file, self.vectorstore, on_remove=on_remove)
+
+    def index_exists(self) -> bool:
+        """Return True if a complete index has been saved at the store path."""
+        return os.path.exists(os.path.join(self.pickle_file, INDEX_FILE))
+
+    @staticmethod
+    def index_config() -> Dict[str, Any]:
+        """
+        Settings that determine the index built from a given text.
+
+        Used to fingerprint documents so identical uploads share one index.
+        """
+        config: Dict[str, Any] = {
+            "chunk_size": _CHUNK_SIZE,
+            "separators": _SPLITTER_SEPARATORS,
+            "embed_model": _PRIMARY_EMBED_MODEL,
+        }
+        # Only non-default settings, so default indexes keep their fingerprints
+        if _EMBED_DIMENSIONS:
+            config["embed_dimensions"] = _EMBED_DIMENSIONS
+        if _INDEX_FACTORY != "Flat":
+            config["index_factory"] = _INDEX_FACTORY
+        if _CHUNKING_MODE == "structured":
+            config["chunking"] = _CHUNKING_MODE
+        return config
+
     def get_index_info(self) -> Dict[str, Any]:
         """
         Return a status summary for the current vector store.
@@ -426,4 +1394,35 @@ class VectorStore:
             "status": "initialized",
             "index_path": self.pickle_file,
             "type": type(self.vectorstore).__name__,
+            "backend": "shared" if hasattr(self.vectorstore.index, "release") else "per_document",
         }
+
+
+# ---------------------------------------------------------------------------
+# Query embedding prefetch
+# ---------------------------------------------------------------------------
+
+
+def prefetch_query_embeddings(texts: Iterable[str]) -> threading.Thread:
+    """
+    Embed ``texts`` into the query embedding cache on a background thread.
+
+    The ingest worker calls this with the session topic and its teaching
+    query as soon as a job starts, so both vectors are ready by the time
+    the teach stage needs them instead of costing a round trip each there.
+    Join the returned thread before relying on the cache; failures are
+    only logged (the teach stage then embeds as usual).
+    """
+    texts = list(texts)
+
+    def run() -> None:
+        try:
+            store = VectorStore()
+            for text in texts:
+                store.embed_query(text)
+        except Exception as exc:
+            logger.warning("prefetch_query_embeddings: %s", exc)
+
+    thread = threading.Thread(target=run, name="query-prefetch", daemon=True)
+    thread.start()
+    return thread
@@ -18,6 +18,10 @@ import {
 const BACKEND_URL = import.meta.env.VITE_BACKEND_URL as string;
 const EMPTY_QUEUE_RETRY_MS = 2500;
 const ERROR_RETRY_MS = 4000;
+// Long-poll: the server holds /next open until a sentence arrives (max 25 s)
+const NEXT_WAIT_SECONDS = 20;
+// Sentences fetched per /next call; the extras are spoken without a round trip
+const NEXT_BATCH_SIZE = 3;
 const MAX_QUESTION_LEN = 500; // mirrors server truncation limit
 
 type SessionState = "teaching" | "listening" | "responding";
@@ -79,6 +83,8 @@ const Session = () => {
   // AbortController for the current in-flight /next fetch; cancelled on
   // unmount and whenever we deliberately stop the loop.
   const fetchAbortRef = useRef<AbortController | null>(null);
+  // Sentences already fetched from /next but not yet spoken
+  const pendingSentencesRef = useRef<string[]>([]);
 
   // Keep refs in sync with state
   useEffect(() => { sessionStateRef.current = sessionState; }, [sessionState]);
@@ -128,24 +134,40 @@ const Session = () => {
     (sid: string) => {
       if (sessionStateRef.current === "listening") return;
 
+      const speakNextPending = () => {
+        const text = pendingSentencesRef.current.shift() as string;
+        speakSentence(text, () => {
+          if (sessionStateRef.current !== "listening") {
+            pollTimeoutRef.current = setTimeout(
+              () => pollNext(sid),
+              pendingSentencesRef.current.length ? 0 : 300,
+            );
+          }
+        });
+      };
+
+      // Prefetched sentences are spoken before asking the server again
+      if (pendingSentencesRef.current.length) {
+        speakNextPending();
+        return;
+      }
+
       // Cancel any previous in-flight request before starting a new one
       fetchAbortRef.current?.abort();
       const controller = new AbortController();
       fetchAbortRef.current = controller;
 
-      fetch(`${BACKEND_URL}/session/${sid}/next`, { signal: controller.signal })
+      fetch(
+        `${BACKEND_URL}/session/${sid}/next?wait=${NEXT_WAIT_SECONDS}&count=${NEXT_BATCH_SIZE}`,
+        { signal: controller.signal },
+      )
         .then((r) => r.json())
         .then((data) => {
-          if (data.text) {
-            // Got a sentence — speak it, then immediately poll for the next
-            speakSentence(data.text, () => {
-              if (sessionStateRef.current !== "listening") {
-                pollTimeoutRef.current = setTimeout(
-                  () => pollNext(sid),
-                  300,
-                );
-              }
-            });
+          const sentences: string[] = data.sentences ?? (data.text ? [data.text] : []);
+          if (sentences.length) {
+            // Got sentences — speak them in order, then poll for more
+            pendingSentencesRef.current.push(...sentences);
+            speakNextPending();
           } else if (data.done) {
             // Server confirmed the queue is fully drained — stop the loop.
             // Polling will be restarted explicitly when a question is submitted.